@@ -24,9 +24,8 @@ def forward_relative_finrez(data: pd.Series, forward_candles: int) -> pd.Series:
 
 async def load_df(symbol, minutes):
     ts = TimeSeries(Symbol(symbol, Exchange.Barchart))
-    await ts.load_ohlc()
+    await ts.load_ohlc(resolution=f'{minutes}m')
     # ts._df = ts._df.between_time('06:45', '23:00')
-    ts.resample(f'{minutes}m')
     df = ts.get_raw_df()
 
     return df
@@ -0,0 +1,5 @@
+"""Benchmarks for performance sensitive parts of the package
+
+| Every module is runnable, for example:
+| python -m cns_analytics.benchmarks.storage_formats
+"""
@@ -0,0 +1,62 @@
+"""Compares compiled OHLC resampling with pandas resample groupby
+
+Usage: python -m cns_analytics.benchmarks.resample_ohlc [rows]
+"""
+import sys
+import time
+
+import pandas as pd
+
+from cns_analytics import utils
+from cns_analytics.benchmarks.storage_formats import generate_ohlc
+
+
+def resample_ohlc_pandas(data: pd.DataFrame, duration) -> pd.DataFrame:
+    """Previous implementation of TimeSeries.resample for OHLC"""
+    resampled = data.resample(pd.Timedelta(duration))
+    df = resampled.last()
+    df['px_open'] = resampled.px_open.first()
+    df['px_high'] = resampled.px_high.max()
+    df['px_low'] = resampled.px_low.min()
+    df['volume'] = resampled.volume.sum()
+    return df.dropna()
+
+
+def _timed(func, *args, **kwargs):
+    t1 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t1
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    data = generate_ohlc(rows)
+
+    # compile kernel before timing
+    utils.resample_ohlc(data.iloc[:100], '5m')
+
+    # pandas steps in local wall time for non-UTC timezones, check edges match there too
+    local = data.iloc[:200_000].tz_convert('America/New_York')
+    for duration in ['5m', '7m', '15m', '1h', '1d']:
+        pd.testing.assert_frame_equal(resample_ohlc_pandas(local, duration),
+                                      utils.resample_ohlc(local, duration), check_freq=False)
+
+    results = []
+    for duration in ['5m', '15m', '1h', '1d']:
+        expected, pandas_time = _timed(resample_ohlc_pandas, data, duration)
+        result, kernel_time = _timed(utils.resample_ohlc, data, duration)
+        pd.testing.assert_frame_equal(expected, result, check_freq=False)
+
+        results.append({
+            'duration': duration,
+            'pandas_ms': pandas_time * 1e3,
+            'kernel_ms': kernel_time * 1e3,
+            'speedup': pandas_time / kernel_time,
+        })
+
+    print(f"OHLC resample, {rows} rows")
+    print(pd.DataFrame(results).set_index('duration').round(2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Compares size, write and read speed of storage formats on synthetic market data
+
+Usage: python -m cns_analytics.benchmarks.storage_formats [ohlc_rows] [tick_rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cns_analytics.storage import Storage, StorageCodec, StorageFormat
+
+
+FORMATS = [
+    StorageFormat(codec=StorageCodec.FEATHER_V1),
+    StorageFormat(codec=StorageCodec.UNCOMPRESSED),
+    StorageFormat(codec=StorageCodec.LZ4),
+    StorageFormat(codec=StorageCodec.LZ4, delta_time=True),
+    StorageFormat(codec=StorageCodec.ZSTD),
+    StorageFormat(codec=StorageCodec.ZSTD, delta_time=True),
+    StorageFormat(codec=StorageCodec.ZSTD, level=9, delta_time=True),
+]
+
+
+def generate_ohlc(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Returns 1m bars shaped like stored OHLC data (random walk, weekends skipped)"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2015-01-01', periods=int(rows * 1.5), freq='1T', tz='UTC', name='time')
+    index = index[index.dayofweek < 5][:rows]
+
+    close = np.round(1000 + np.cumsum(rng.normal(0, 0.5, rows)), 2)
+    opn = np.round(np.concatenate(([close[0]], close[:-1])), 2)
+    spread = np.round(np.abs(rng.normal(0, 0.3, (2, rows))), 2)
+
+    return pd.DataFrame({
+        'px_open': opn,
+        'px_high': np.maximum(opn, close) + spread[0],
+        'px_low': np.minimum(opn, close) - spread[1],
+        'px_close': close,
+        'volume': rng.integers(0, 500, rows).astype(np.float64),
+    }, index=index)
+
+
+def generate_ticks(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Returns ticks shaped like stored tick data (irregular time, px, qty, side)"""
+    rng = np.random.default_rng(seed)
+    gaps = rng.exponential(200, rows).astype(np.int64) * 1_000_000
+    index = pd.DatetimeIndex(pd.Timestamp('2021-01-01', tz='UTC').value + np.cumsum(gaps),
+                             name='ts').tz_localize('UTC')
+
+    return pd.DataFrame({
+        'px': np.round(75000 + np.cumsum(rng.integers(-1, 2, rows)), 0),
+        'qty': rng.integers(1, 50, rows).astype(np.float64),
+        'side': rng.choice(np.array(['B', 'S'], dtype=object), rows),
+    }, index=index)
+
+
+def _best_of(func, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t1)
+    return best
+
+
+def benchmark(data: pd.DataFrame, formats=FORMATS, repeat: int = 3) -> pd.DataFrame:
+    """Writes and reads data in every format
+
+    :param data: DataFrame to store
+    :param formats: Formats to compare
+    :param repeat: Best of repeat timings is reported
+    :returns: DataFrame with size and speed of every format
+    """
+    storage = Storage()
+    results = []
+
+    with tempfile.TemporaryDirectory() as folder:
+        storage.local_folder = folder
+
+        for fmt in formats:
+            key = fmt.get_name()
+            write_time = _best_of(lambda: storage._serialize(key, data, fmt), repeat)
+            read_time = _best_of(lambda: storage._deserialize(key), repeat)
+
+            restored = storage._deserialize(key)
+            assert np.array_equal(restored.index.asi8, data.index.asi8), fmt
+            assert restored.columns.tolist() == data.columns.tolist(), fmt
+
+            size = os.path.getsize(os.path.join(folder, key))
+            results.append({
+                'format': key,
+                'size_mb': size / 2 ** 20,
+                'ratio': data.memory_usage(deep=False).sum() / size,
+                'write_ms': write_time * 1e3,
+                'read_ms': read_time * 1e3,
+            })
+
+    return pd.DataFrame(results).set_index('format').round(2)
+
+
+def main():
+    ohlc_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    tick_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000_000
+
+    print(f"OHLC, {ohlc_rows} rows")
+    print(benchmark(generate_ohlc(ohlc_rows)))
+    print()
+    print(f"Ticks, {tick_rows} rows")
+    print(benchmark(generate_ticks(tick_rows)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Measures allocations of chained TimeSeries arithmetic
+
+| Compares current TimeSeries.from_df with previous behaviour
+  (copy of every intermediate result and four addons per TimeSeries).
+
+Usage: python -m cns_analytics.benchmarks.timeseries_ops [rows]
+"""
+import contextlib
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from cns_analytics.benchmarks.storage_formats import generate_ohlc
+from cns_analytics.timeseries import TimeSeries
+
+
+@contextlib.contextmanager
+def legacy_from_df():
+    """Temporarily restores previous TimeSeries.from_df"""
+    current = TimeSeries.__dict__['from_df']
+
+    def from_df(cls, df, copy=True):
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+
+        series = cls()
+        series._df = df.copy()
+        # addons used to be created in __init__
+        for addon in ('mask', 'optimize', 'fix', 'backtest'):
+            getattr(series, addon)
+        return series
+
+    TimeSeries.from_df = classmethod(from_df)
+    try:
+        yield
+    finally:
+        TimeSeries.from_df = current
+
+
+def _measure(func, repeat: int = 5):
+    func()
+    t1 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = (time.perf_counter() - t1) / repeat
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    data = generate_ohlc(rows)
+    a = TimeSeries.from_df(data.px_close.rename('A'))
+    b = TimeSeries.from_df(data.px_open.rename('B'))
+    c = TimeSeries.from_df(data.px_high.rename('C'))
+
+    expressions = {
+        'a*5 - b*2 + c': lambda: a * 5 - b * 2 + c,
+        '(a - b).diff().abs().cumsum()': lambda: (a - b).diff().abs().cumsum(),
+        '-(a / b) * 100': lambda: -(a / b) * 100,
+    }
+
+    results = []
+    for name, func in expressions.items():
+        with legacy_from_df():
+            legacy_time, legacy_peak = _measure(func)
+        new_time, new_peak = _measure(func)
+
+        results.append({
+            'expression': name,
+            'legacy_ms': legacy_time * 1e3,
+            'new_ms': new_time * 1e3,
+            'legacy_peak_mb': legacy_peak / 2 ** 20,
+            'new_peak_mb': new_peak / 2 ** 20,
+        })
+
+    print(f"TimeSeries arithmetic, {rows} rows")
+    print(pd.DataFrame(results).set_index('expression').round(2))
+
+
+if __name__ == '__main__':
+    main()
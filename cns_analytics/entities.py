@@ -176,3 +176,41 @@ class DropLogic(enum.Enum):
     SKIP_AFTER_UPDATE = enum.auto()
     # high is calculated in window
     WINDOWED = enum.auto()
+
+
+class BarType(enum.Enum):
+    """How ticks are grouped into bars"""
+    # fixed time interval
+    TIME = enum.auto()
+    # fixed traded quantity
+    VOLUME = enum.auto()
+    # fixed traded money (price * quantity)
+    DOLLAR = enum.auto()
+    # fixed number of ticks
+    TICK = enum.auto()
+    # signed tick count exceeds its expected value
+    TICK_IMBALANCE = enum.auto()
+    # signed volume exceeds its expected value
+    VOLUME_IMBALANCE = enum.auto()
+
+
+class Alignment(enum.Enum):
+    """How symbols with different timestamps are aligned"""
+    # only timestamps present in all symbols
+    INNER = enum.auto()
+    # all timestamps, missing prices are taken from previous timestamps
+    OUTER_FFILL = enum.auto()
+    # timestamps of first symbol, other symbols take last price not older than tolerance
+    ASOF = enum.auto()
+    # regular grid, every symbol takes last price not older than tolerance
+    GRID = enum.auto()
+
+
+class Statistic(enum.Enum):
+    """Statistics that can be calculated in walk-forward manner"""
+    MEAN = enum.auto()
+    STD = enum.auto()
+    # shift and coefficient of regression of second symbol on first one
+    OLS = enum.auto()
+    PERCENTILE = enum.auto()
+    HURST = enum.auto()
@@ -1,14 +1,20 @@
+import enum
+import json
 import logging
 import os
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
 
-import feather
+import numpy as np
 import pandas as pd
 import paramiko
 import paramiko.util
+import pyarrow as pa
+import pyarrow.feather as feather
 
 from dotenv import load_dotenv
 
-from cns_analytics import Symbol
+from cns_analytics import Symbol, utils
 from cns_analytics.entities import MDType
 from paramiko.py3compat import decodebytes
 
@@ -16,10 +22,54 @@ from paramiko.py3compat import decodebytes
 paramiko.util.get_logger('paramiko').setLevel(logging.WARN)
 load_dotenv('.env')
 
+
+class StorageCodec(enum.Enum):
+    """Codecs for market data files"""
+    # legacy format, always uncompressed
+    FEATHER_V1 = "feather_v1"
+    UNCOMPRESSED = "uncompressed"
+    LZ4 = "lz4"
+    ZSTD = "zstd"
+
+
+@dataclass(frozen=True)
+class StorageFormat:
+    """Describes how market data is written to disk
+
+    | Files are readable regardless of format they were written with,
+      but only feather v1 files are readable by installs with feather-format or old pyarrow.
+    | delta_time stores time index as first timestamp followed by differences,
+      which compresses much better for regular bars.
+    | dictionary_columns are stored as dictionary encoded (useful for side of ticks).
+    """
+    codec: StorageCodec = StorageCodec.FEATHER_V1
+    level: Optional[int] = None
+    delta_time: bool = False
+    dictionary_columns: Tuple[str, ...] = ('side', 'maker_side')
+
+    def get_name(self):
+        name = self.codec.value
+        if self.level is not None:
+            name += f"-{self.level}"
+        if self.delta_time:
+            name += "+delta"
+        return name
+
+
 class Storage:
     local_folder = os.getenv("STORAGE_FOLDER", ".cache/")
     remote_folder = "/upload/cns_analytics/"
+    # feather v1 by default, so files stay readable by older installs, LZ4/ZSTD are opt-in
+    format = StorageFormat(
+        codec=StorageCodec[os.getenv("STORAGE_CODEC", StorageCodec.FEATHER_V1.name)],
+        delta_time=os.getenv("STORAGE_DELTA_TIME", "0") == "1",
+    )
+    base_resolution = '1m'
+    # downsampled OHLC levels, maintained next to base data, empty STORAGE_PYRAMID disables them
+    pyramid_resolutions = tuple(
+        filter(None, os.getenv("STORAGE_PYRAMID", "5m,15m,1h,1d").split(",")))
     _storage = None
+    _time_delta_key = b'cns_analytics.time_delta'
 
     @classmethod
     def get(cls):
@@ -93,40 +143,303 @@ class Storage:
 
     def _deserialize(self, key):
         local_path = os.path.join(self.local_folder, key)
-        df = feather.read_dataframe(local_path)
+        return self._prepare(self._from_table(feather.read_table(local_path)))
+
+    def _iter_deserialize(self, key, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """Reads file by record batches, keeping about chunk_size rows in memory"""
+        local_path = os.path.join(self.local_folder, key)
+
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(local_path))
+        except pa.ArrowInvalid:
+            # feather v1 can't be read partially
+            df = self._deserialize(key)
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start: start + chunk_size]
+            return
+
+        batches = []
+        rows = 0
+        time_start = 0
+
+        for i in range(reader.num_record_batches):
+            batches.append(reader.get_batch(i))
+            rows += batches[-1].num_rows
+
+            if rows < chunk_size and i != reader.num_record_batches - 1:
+                continue
+
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+            df = self._from_table(table, time_start=time_start)
+            batches = []
+            rows = 0
+
+            if isinstance(df.index, pd.DatetimeIndex) and len(df):
+                time_start = df.index.asi8[-1]
+
+            yield self._prepare(df)
+
+    @staticmethod
+    def _prepare(df: pd.DataFrame) -> pd.DataFrame:
         if 'ts' in df.columns:
             df.rename(columns={
                 'ts': 'time'
             }, inplace=True)
             df.set_index('time', inplace=True)
+        elif 'time' in df.columns:
+            df.set_index('time', inplace=True)
+        elif df.index.name == 'ts':
+            df.index.name = 'time'
         df = df.sort_index()
         return df
 
-    def _serialize(self, key, data: pd.DataFrame):
+    def _serialize(self, key, data: pd.DataFrame, fmt: Optional[StorageFormat] = None):
+        fmt = fmt or self.format
         local_path = os.path.join(self.local_folder, key)
         folders, filename = os.path.split(local_path)
         os.makedirs(os.path.join(folders), exist_ok=True)
-        return feather.write_dataframe(data, local_path)
+
+        if fmt.codec is StorageCodec.FEATHER_V1:
+            # v1 supports neither index nor schema metadata
+            return feather.write_feather(data.reset_index(), local_path, version=1)
+
+        return feather.write_feather(self._to_table(data, fmt), local_path,
+                                     compression=fmt.codec.value,
+                                     compression_level=fmt.level)
+
+    @classmethod
+    def _to_table(cls, data: pd.DataFrame, fmt: StorageFormat) -> pa.Table:
+        """Converts DataFrame to arrow table, applying encodings from fmt"""
+        for column in fmt.dictionary_columns:
+            if column in data.columns and data[column].dtype == object:
+                data = data.assign(**{column: data[column].astype('category')})
+
+        if not fmt.delta_time or not isinstance(data.index, pd.DatetimeIndex):
+            return pa.Table.from_pandas(data)
+
+        name = data.index.name or 'time'
+        tz = str(data.index.tz) if data.index.tz is not None else None
+        timestamps = data.index.asi8
+        deltas = np.diff(timestamps, prepend=np.int64(0))
+
+        data = data.reset_index(drop=True)
+        data.insert(0, name, deltas)
+
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[cls._time_delta_key] = json.dumps({'column': name, 'tz': tz}).encode()
+        return table.replace_schema_metadata(metadata)
+
+    @classmethod
+    def _from_table(cls, table: pa.Table, time_start: int = 0) -> pd.DataFrame:
+        """Converts arrow table back to DataFrame, reverting encodings
+
+        :param table: Table to convert
+        :param time_start: Last timestamp of previous part of the file for delta encoded time
+        """
+        metadata = (table.schema.metadata or {}).get(cls._time_delta_key)
+        dictionary_columns = [field.name for field in table.schema
+                              if pa.types.is_dictionary(field.type)]
+
+        df = table.to_pandas()
+
+        for column in dictionary_columns:
+            df[column] = df[column].astype(object)
+
+        if metadata is not None:
+            metadata = json.loads(metadata)
+            timestamps = np.cumsum(df.pop(metadata['column']).values) + time_start
+            index = pd.DatetimeIndex(timestamps.astype('datetime64[ns]'), name=metadata['column'])
+            if metadata['tz'] is not None:
+                index = index.tz_localize('UTC').tz_convert(metadata['tz'])
+            df.index = index
+
+        return df
 
     @staticmethod
-    def _get_key(symbol: Symbol, md_type: MDType) -> str:
-        return f"{symbol.exchange.name}/{md_type.name}/{symbol.name}"
+    def _get_key(symbol: Symbol, md_type: MDType, resolution: Optional[str] = None) -> str:
+        if resolution is None:
+            return f"{symbol.exchange.name}/{md_type.name}/{symbol.name}"
+        return f"{symbol.exchange.name}/{md_type.name}_{resolution}/{symbol.name}"
+
+    def _fetch(self, key) -> bool:
+        """Makes file available locally, returns False if it doesn't exist"""
+        if not self._exists_locally(key):
+            if not self._exists_remote(key):
+                return False
+            self._download(key)
+        return True
 
     @classmethod
-    def load_data(cls, symbol: Symbol, md_type: MDType) -> pd.DataFrame:
+    def load_data(cls, symbol: Symbol, md_type: MDType,
+                  resolution: Optional[str] = None) -> pd.DataFrame:
+        """Loads market data
+
+        | Levels of OHLC pyramid are read directly,
+          other resolutions are aggregated from base data.
+
+        :param symbol: Symbol to load
+        :param md_type: Type of market data
+        :param resolution: Resolution of OHLC bars, base data is returned by default.
+            Pyramid levels are matched by duration, so '60m' is read from '1h' level.
+            Calendar resolutions (months, years) are not supported
+        :returns: Market data
+        """
         storage = cls.get()
+
+        if resolution is not None:
+            resolution = storage._normalize_resolution(resolution)
+
+        if resolution is not None and resolution != cls.base_resolution:
+            if md_type is not MDType.OHLC:
+                raise NotImplementedError(f"Resolution is not supported for {md_type.name}")
+            return storage._load_resampled(symbol, resolution)
+
         key = storage._get_key(symbol, md_type)
 
-        if not storage._exists_locally(key):
-            if not storage._exists_remote(key):
-                raise KeyError(symbol.name)
-            storage._download(key)
+        if not storage._fetch(key):
+            raise KeyError(symbol.name)
 
         return storage._deserialize(key)
 
+    def _normalize_resolution(self, resolution: str) -> str:
+        """Returns name of base or pyramid resolution of same duration (like '1h' for '60m'),
+        other fixed resolutions are returned unchanged
+
+        | Calendar units (months and years) are rejected: bars are aggregated by fixed
+          duration, and pd.Timedelta silently reads '1M' as one minute.
+        """
+        unit = resolution.strip().lstrip('0123456789. ')
+        if unit[:1] in ('M', 'Y', 'y'):
+            raise ValueError(f"Calendar resolution is not supported: {resolution}")
+
+        duration = pd.Timedelta(resolution)
+
+        for level in (self.base_resolution, *self.pyramid_resolutions):
+            if pd.Timedelta(level) == duration:
+                return level
+        return resolution
+
+    def _load_resampled(self, symbol: Symbol, resolution: str) -> pd.DataFrame:
+        """Returns OHLC bars of resolution, building missing pyramid level from base data"""
+        key = self._get_key(symbol, MDType.OHLC, resolution)
+
+        if resolution in self.pyramid_resolutions and self._fetch(key):
+            return self._deserialize(key)
+
+        data = utils.resample_ohlc(self.load_data(symbol, MDType.OHLC), resolution)
+
+        if resolution in self.pyramid_resolutions:
+            # data was saved before pyramid existed, keep level for next loads on all machines
+            self._serialize(key, data)
+            self._upload(key)
+
+        return data
+
+    @classmethod
+    def iter_data(cls, symbol: Symbol, md_type: MDType,
+                  chunk_size: int = 1_000_000) -> Iterator[pd.DataFrame]:
+        """Yields market data in chunks sorted by time
+
+        | Only one chunk is kept in memory, except for files in legacy feather v1 format.
+
+        :param symbol: Symbol to load
+        :param md_type: Type of market data
+        :param chunk_size: Approximate number of rows in a chunk
+        """
+        storage = cls.get()
+        key = storage._get_key(symbol, md_type)
+
+        if not storage._fetch(key):
+            raise KeyError(symbol.name)
+
+        yield from storage._iter_deserialize(key, chunk_size)
+
     @classmethod
     def save_data(cls, symbol: Symbol, md_type: MDType, data: pd.DataFrame):
+        """Saves market data, replacing stored one
+
+        | For OHLC data levels of pyramid are updated too. This costs reading previous base
+          data and reading and writing every level that changed (files are rewritten whole,
+          also on remote storage). Set STORAGE_PYRAMID to empty string to disable pyramid.
+
+        :param symbol: Symbol of data
+        :param md_type: Type of market data
+        :param data: Data to save
+        """
         storage = cls.get()
         key = storage._get_key(symbol, md_type)
+        previous = None
+
+        if md_type is MDType.OHLC and storage.pyramid_resolutions and storage._fetch(key):
+            # pyramid is updated incrementally only for bars appended to previous data
+            previous = storage._deserialize(key)
+
         storage._serialize(key, data)
         storage._upload(key)
+
+        if md_type is MDType.OHLC:
+            storage._update_pyramid(symbol, data, previous)
+
+    @staticmethod
+    def _count_unchanged_rows(previous: pd.DataFrame, data: pd.DataFrame) -> int:
+        """Returns number of first rows of data equal to the same rows of previous data"""
+        if list(previous.columns) != list(data.columns):
+            return 0
+
+        count = min(len(previous), len(data))
+        old_values = previous.values[:count]
+        new_values = data.values[:count]
+
+        same = previous.index[:count] == data.index[:count]
+        same &= ((old_values == new_values) | (pd.isna(old_values) & pd.isna(new_values))).all(axis=1)
+
+        return count if same.all() else int(np.argmin(same))
+
+    def _update_pyramid(self, symbol: Symbol, data: pd.DataFrame,
+                        previous: Optional[pd.DataFrame] = None):
+        """Updates downsampled levels of OHLC data
+
+        | When data starts at the same bar as previous base data and matches it up to
+          the last stored bucket of a level, buckets before it are kept
+          and only the rest is aggregated again.
+        | Otherwise level is rebuilt from scratch (history was edited or trimmed).
+        | Level is written and uploaded only when it changed.
+
+        :param symbol: Symbol of data
+        :param data: New base data
+        :param previous: Base data stored before data was saved, if any
+        """
+        if data.empty:
+            return
+
+        unchanged = 0
+        if previous is not None and not previous.empty and previous.index[0] == data.index[0]:
+            unchanged = self._count_unchanged_rows(previous, data)
+
+        if unchanged == len(data) == len(previous):
+            # data is the same, existing levels are up to date
+            resolutions = [resolution for resolution in self.pyramid_resolutions
+                           if not self._fetch(self._get_key(symbol, MDType.OHLC, resolution))]
+        else:
+            resolutions = self.pyramid_resolutions
+
+        for resolution in resolutions:
+            key = self._get_key(symbol, MDType.OHLC, resolution)
+            level = self._deserialize(key) if self._fetch(key) else None
+            start = level.index[-1] if level is not None and not level.empty else None
+
+            # rows before last stored bucket must be the same in previous and new data
+            if start is not None and unchanged \
+                    and data.index.searchsorted(start) <= unchanged \
+                    and previous.index.searchsorted(start) <= unchanged:
+                tail = utils.resample_ohlc(data[start:], resolution)
+                if tail.equals(level[start:]):
+                    continue
+                level = pd.concat([level[level.index < start], tail])
+            else:
+                level = utils.resample_ohlc(data, resolution)
+
+            level.index.name = data.index.name
+            self._serialize(key, level)
+            self._upload(key)
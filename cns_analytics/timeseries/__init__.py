@@ -2,3 +2,5 @@
 from .timeseries import TimeSeries
 from .spread import Spread
 from .ohlc import OHLC
+from .chunked import ChunkedTimeSeries
+from .universe import Universe, SpreadUniverse
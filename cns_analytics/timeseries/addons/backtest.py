@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from typing import Optional, Union
 
 import matplotlib.pyplot as plt
+import numba
 import numpy as np
 import pandas as pd
 
@@ -11,6 +12,42 @@ from cns_analytics.entities import Symbol, Exchange, Duration, DateTime
 from cns_analytics.timeseries import TimeSeries
 
 
+@numba.njit(nogil=True)
+def _stat_arb(px, mask, tp, sl):
+    n = px.shape[0]
+    reval = np.empty(n)
+    tp_count = np.empty(n, dtype=np.int64)
+    sl_count = np.empty(n, dtype=np.int64)
+
+    in_position = False
+    exit_tp = 0.0
+    exit_sl = 0.0
+    open_money = 0.0
+    tp_total = 0
+    sl_total = 0
+
+    for i in range(n):
+        if not in_position:
+            if mask[i]:
+                exit_tp = px[i] + tp
+                exit_sl = px[i] - sl
+                open_money -= px[i]
+                in_position = True
+        elif px[i] > exit_tp or px[i] < exit_sl:
+            if px[i] > exit_tp:
+                tp_total += 1
+            else:
+                sl_total += 1
+            open_money += px[i]
+            in_position = False
+
+        reval[i] = open_money + px[i] if in_position else open_money
+        tp_count[i] = tp_total
+        sl_count[i] = sl_total
+
+    return reval, tp_count, sl_count
+
+
 @dataclass
 class FlexBacktestResult:
     spread: list
@@ -24,62 +61,32 @@ class BacktestAddon:
         self.ts = ts
 
     def stat_arb(self, *, tp: float, sl: float,
-                 entry_mask: Optional[np.ndarray] = None,
+                 entry_mask: Optional[Union[np.ndarray, pd.Series]] = None,
                  symbol: Optional[Union[Symbol, str]] = None):
+        """Opens long position when entry mask allows and holds it until take profit or stop loss
+
+        :param tp: Take profit distance from entry price
+        :param sl: Stop loss distance from entry price
+        :param entry_mask: Points where position can be opened, array of framed length
+            or series aligned by time
+        :param symbol: Symbol to trade
+        :returns: DataFrame with revaluation, tp_count and sl_count columns
+        """
         symbol = self.ts.expect_one_symbol(symbol)
-        df = self.ts.get_framed_df()[symbol]
-        df = df.reset_index()
-        df['time'] = df['time'].values.astype(np.int64) // 10 ** 9
-        df['mask'] = df[symbol] if entry_mask is None else entry_mask
+        core = self.ts.get_core(framed=True)
 
-        timestamp_history = []
-        reval_history = []
-        tp_count_history = []
-        sl_count_history = []
+        if entry_mask is None:
+            mask = np.ones(len(core), dtype=np.bool_)
+        elif isinstance(entry_mask, pd.Series):
+            mask = entry_mask.reindex(core.get_index(), fill_value=False).values.astype(np.bool_)
+        else:
+            mask = np.asarray(entry_mask, dtype=np.bool_).reshape(-1)
 
-        exit_tp = None
-        exit_sl = None
+        reval, tp_count, sl_count = _stat_arb(core.contiguous_column(symbol), mask, tp, sl)
 
-        tp_count = 0
-        sl_count = 0
-
-        open_money = 0
-        position = 0
-
-        for timestamp, px, mask_row in df.values:
-            if exit_tp is None:
-                entry_ok = entry_mask is None or mask_row
-                if entry_ok:
-                    exit_tp = px + tp
-                    exit_sl = px - sl
-                    open_money -= px
-                    position = 1
-            else:
-                closed = False
-
-                if px > exit_tp:
-                    tp_count += 1
-                    closed = True
-                elif px < exit_sl:
-                    sl_count += 1
-                    closed = True
-
-                if closed:
-                    exit_tp = None
-                    exit_sl = None
-                    open_money += px
-                    position = 0
-
-            timestamp_history.append(timestamp * 1e9)
-            reval_history.append(open_money + position * px)
-            tp_count_history.append(tp_count)
-            sl_count_history.append(sl_count)
-
-        result_df = pd.DataFrame(reval_history, index=pd.to_datetime(timestamp_history), columns=['revaluation'])
-        result_df['tp_count'] = tp_count_history
-        result_df['sl_count'] = sl_count_history
-
-        return result_df
+        return core.to_df(np.column_stack([reval, tp_count, sl_count]),
+                          columns=['revaluation', 'tp_count', 'sl_count']) \
+            .astype({'tp_count': np.int64, 'sl_count': np.int64})
 
     def strange(self, *, timestamp: DateTime, initial_pos: int, step: float, close_diapason: float,
                 one_way_fee: float = 0, book_spread: float = 0,
@@ -1,13 +1,16 @@
 import enum
-from typing import Tuple
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from scipy.optimize import minimize
 
 from cns_analytics import utils
-from cns_analytics.entities import DropLogic
+from cns_analytics.entities import DropLogic, Duration
 from cns_analytics.timeseries import TimeSeries
+from cns_analytics.utils import fast_optimize
 
 
 class SpreadOptimizerTarget(enum.Enum):
@@ -15,7 +18,27 @@ class SpreadOptimizerTarget(enum.Enum):
     DROP_PCT = "drop_pct"
 
 
+class SpreadOptimizerGradient(enum.Enum):
+    """Gradient for quasi-Newton methods"""
+    ANALYTIC = "analytic"
+    FINITE_DIFFERENCE = "finite_difference"
+
+
+_TARGETS = {
+    SpreadOptimizerTarget.DROP: fast_optimize.DROP,
+    SpreadOptimizerTarget.DROP_PCT: fast_optimize.DROP_PCT,
+}
+
+
 class SpreadOptimizerAddon:
+    """Finds weights of symbols, that minimize drop of their weighted sum
+
+    | Weight of first symbol is fixed to 1.
+    | Objective is compiled (see utils.fast_optimize) over prices prepared once per optimization.
+    | Several starting points (or walk-forward windows) can be optimized in parallel threads,
+      compiled objective releases GIL.
+    """
+
     def __init__(self, ts: TimeSeries):
         self.ts = ts
         self.data = None
@@ -33,26 +56,78 @@ class SpreadOptimizerAddon:
         drop = utils.get_drop(data=spread, logic=DropLogic.SIMPLE).max()
         return spread, money, drop
 
-    def _target_drop(self, x):
-        spread, money, drop = self._get_base(x)
+    def _get_weights(self, x) -> np.ndarray:
+        x = np.array(x, dtype=np.float64)
+        x[0] = 1
+        return x
+
+    def _target(self, x, prices: Tuple[np.ndarray, np.ndarray],
+                target: SpreadOptimizerTarget) -> float:
+        return fast_optimize.objective(*prices, self._get_weights(x), _TARGETS[target])
+
+    def _target_gradient(self, x, prices: Tuple[np.ndarray, np.ndarray],
+                         target: SpreadOptimizerTarget) -> Tuple[float, np.ndarray]:
+        value, gradient = fast_optimize.objective_gradient(
+            *prices, self._get_weights(x), _TARGETS[target])
+        # weight of first symbol is fixed
+        gradient[0] = 0
+        return value, gradient
+
+    def _get_starts(self, count: int, seed: Optional[int]) -> np.ndarray:
+        """Returns starting points, first one is all ones, others are random around it"""
+        size = self.data.shape[1]
+        rng = np.random.default_rng(seed)
+        return np.vstack([np.ones(size), 1 + rng.normal(size=(count - 1, size))])
+
+    def _minimize(self, x0: np.ndarray, prices: Tuple[np.ndarray, np.ndarray],
+                  target: SpreadOptimizerTarget, method: str,
+                  gradient: Optional[SpreadOptimizerGradient], options: dict):
+        """Minimizes target over prices (see fast_optimize.prepare) from x0"""
+        if method == 'Nelder-Mead':
+            return minimize(self._target, x0, args=(prices, target), method=method, options=options)
+        if gradient is SpreadOptimizerGradient.ANALYTIC:
+            return minimize(self._target_gradient, x0, args=(prices, target), method=method,
+                            jac=True, options=options)
+        return minimize(self._target, x0, args=(prices, target), method=method, options=options)
+
+    def _optimize(self, target: SpreadOptimizerTarget, steps=500, verbose=False,
+                  starts: int = 1,
+                  method: str = 'Nelder-Mead',
+                  gradient: SpreadOptimizerGradient = SpreadOptimizerGradient.ANALYTIC,
+                  workers: Optional[int] = None,
+                  seed: Optional[int] = 0) -> Tuple[TimeSeries, np.ndarray]:
+        """Optimizes weights over frame
+
+        :param target: What to minimize
+        :param steps: Max number of iterations
+        :param verbose: Whether to print convergence messages
+        :param starts: Number of starting points, best result is taken
+        :param method: Method of scipy.optimize.minimize, Nelder-Mead or quasi-Newton like L-BFGS-B
+        :param gradient: Gradient for methods that use it, analytic or finite difference
+        :param workers: Number of threads for starting points, number of CPUs by default
+        :param seed: Seed of random starting points
+        :returns: Optimized spread and weights
+        """
+        if starts < 1:
+            raise Exception("At least one starting point is required")
 
-        return drop
+        self.data = self.ts.get_framed_df()[self.ts.get_symbols()]
+        prices = fast_optimize.prepare(self.data.values)
 
-    def _target_drop_pct(self, x):
-        spread, money, drop = self._get_base(x)
-        drop_pct = np.mean(drop / money) * 100
+        minimizer_kwargs = {'disp': verbose, 'maxiter': steps}
+        x0s = self._get_starts(starts, seed)
 
-        return drop_pct
+        def run(x0):
+            return self._minimize(x0, prices, target, method, gradient, minimizer_kwargs)
 
-    def _optimize(self, target: SpreadOptimizerTarget, steps=500, verbose=False)\
-            -> Tuple[TimeSeries, np.ndarray]:
-        self.data = self.ts.get_framed_df()[self.ts.get_symbols()]
-        self.x = np.ones(self.data.shape[1]) * 1
+        if starts == 1:
+            results = [run(x0s[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                results = list(executor.map(run, x0s))
 
-        target = getattr(self, f"_target_{target.value}")
-        minimizer_kwargs = {'disp': verbose, 'maxiter': steps}
-        x1 = minimize(target, self.x, method='Nelder-Mead', options=minimizer_kwargs)
-        self.x = x1.x
+        best = min(results, key=lambda x: x.fun)
+        self.x = self._get_weights(best.x)
 
         spread, money, drop = self._get_base(self.x)
 
@@ -60,8 +135,81 @@ class SpreadOptimizerAddon:
 
         return TimeSeries.from_df(spread), self.x
 
-    def drop(self, steps: int = 100, verbose: bool = False):
-        return self._optimize(target=SpreadOptimizerTarget.DROP, steps=steps, verbose=verbose)
-
-    def drop_pct(self, steps=100, verbose=False):
-        return self._optimize(target=SpreadOptimizerTarget.DROP_PCT, steps=steps, verbose=verbose)
+    def drop(self, steps: int = 100, verbose: bool = False, **kwargs):
+        """Minimizes max drop of spread, see _optimize for parameters"""
+        return self._optimize(target=SpreadOptimizerTarget.DROP, steps=steps, verbose=verbose,
+                              **kwargs)
+
+    def drop_pct(self, steps=100, verbose=False, **kwargs):
+        """Minimizes max drop of spread relative to money in it, see _optimize for parameters"""
+        return self._optimize(target=SpreadOptimizerTarget.DROP_PCT, steps=steps, verbose=verbose,
+                              **kwargs)
+
+    def walk_forward(self, window: Duration, step: Duration,
+                     target: SpreadOptimizerTarget = SpreadOptimizerTarget.DROP,
+                     steps: int = 100,
+                     warm_start: bool = True,
+                     method: str = 'Nelder-Mead',
+                     gradient: SpreadOptimizerGradient = SpreadOptimizerGradient.ANALYTIC,
+                     workers: Optional[int] = None) \
+            -> Tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+        """Optimizes weights over window before every step and tests them over the step
+
+        | Same as shifting frame by step and optimizing inside it, but prices are prepared once.
+        | With warm start every window starts from weights of previous one, so windows are
+          optimized one by one; without it every window starts from ones and windows are
+          optimized in parallel threads.
+
+        :param window: Size of in sample window
+        :param step: Size of out of sample step, frame is shifted by it
+        :param target: What to minimize
+        :param steps: Max number of iterations for every window
+        :param warm_start: Whether to start from weights of previous window
+        :param method: Method of scipy.optimize.minimize
+        :param gradient: Gradient for methods that use it
+        :param workers: Number of threads without warm start, number of CPUs by default
+        :returns: Start of every step, weights optimized before it (row per step)
+            and target of these weights over step (out of sample drop)
+        """
+        data = self.ts.get_framed_df()[self.ts.get_symbols()]
+        prices = fast_optimize.prepare(data.values)
+        index = data.index.asi8
+        window = pd.Timedelta(window).value
+        step = pd.Timedelta(step).value
+
+        # steps start from first point + window until last point
+        count = max((index[-1] - index[0] - window) // step + 1, 0) if len(index) else 0
+        times = (index[0] if count else 0) + window + step * np.arange(count, dtype=np.int64)
+        starts = np.searchsorted(index, times - window)
+        middles = np.searchsorted(index, times)
+        ends = np.searchsorted(index, times + step)
+
+        options = {'maxiter': steps}
+
+        def optimize(k: int, x0: np.ndarray) -> np.ndarray:
+            if starts[k] == middles[k]:
+                return x0
+            in_sample = tuple(x[starts[k]:middles[k]] for x in prices)
+            return self._get_weights(
+                self._minimize(x0, in_sample, target, method, gradient, options).x)
+
+        ones = np.ones(data.shape[1])
+        if warm_start:
+            weights = []
+            for k in range(count):
+                weights.append(optimize(k, weights[-1] if weights else ones))
+        else:
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+                weights = list(executor.map(lambda k: optimize(k, ones), range(count)))
+        weights = np.array(weights).reshape(count, data.shape[1])
+
+        drops = np.full(count, np.nan)
+        for k in range(count):
+            if middles[k] < ends[k]:
+                drops[k] = fast_optimize.objective(
+                    *(x[middles[k]:ends[k]] for x in prices), weights[k], _TARGETS[target])
+
+        times = pd.DatetimeIndex(times.view('datetime64[ns]'), name=data.index.name)
+        if data.index.tz is not None:
+            times = times.tz_localize('UTC').tz_convert(data.index.tz)
+        return times, weights, drops
@@ -0,0 +1,253 @@
+"""Time series that doesn't fit into memory
+
+| Data is read from storage chunk by chunk and only one chunk is kept in memory,
+  so peak memory doesn't depend on length of history.
+| Results that are as long as history (drop, resampled data) are yielded chunk by chunk.
+"""
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pytz
+from dateutil import parser
+
+from cns_analytics import utils
+from cns_analytics.entities import DateTime, DropLogic, Duration, MDType, Symbol
+from cns_analytics.utils import fast_resample
+
+
+def _to_timestamp(value: Optional[DateTime]) -> Optional[pd.Timestamp]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = parser.parse(value, dayfirst=True)
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize(pytz.UTC)
+    return value
+
+
+class ChunkedTimeSeries:
+    """Represents one symbol, that is read from storage in chunks
+
+    .. python::
+        ts = ChunkedTimeSeries(Symbol('Si', Exchange.FinamTicks), md_type=MDType.TICKS,
+                               calendar='M')
+        max_drop = max(drop.max() for drop in ts.get_drop())
+        print(ts.get_percentile([0.05, 0.95]))
+    """
+
+    def __init__(self, symbol: Union[Symbol, str],
+                 md_type: MDType = MDType.OHLC,
+                 chunk_size: int = 1_000_000,
+                 calendar: Optional[str] = None,
+                 start: Optional[DateTime] = None,
+                 end: Optional[DateTime] = None):
+        """Initializes ChunkedTimeSeries
+
+        :param symbol: Symbol to load data from
+        :param md_type: Type of market data, OHLC or TICKS
+        :param chunk_size: Number of rows read from storage at once
+        :param calendar: Pandas period alias (D/W/M), if set every chunk is one calendar period
+        :param start: First date to keep
+        :param end: Last date to keep
+        """
+        self.symbol = symbol if isinstance(symbol, Symbol) else Symbol(symbol)
+        self.md_type = md_type
+        self.chunk_size = chunk_size
+        self.calendar = calendar
+        self._start = _to_timestamp(start)
+        self._end = _to_timestamp(end)
+
+    def _iter_raw(self) -> Iterator[pd.DataFrame]:
+        from cns_analytics.storage import Storage
+
+        for chunk in Storage.iter_data(self.symbol, self.md_type, self.chunk_size):
+            if self._start is not None:
+                if chunk.index[-1] < self._start:
+                    continue
+                chunk = chunk[self._start:]
+            if self._end is not None:
+                if chunk.index[0] > self._end:
+                    return
+                chunk = chunk[:self._end]
+            if not chunk.empty:
+                yield chunk
+
+    def _iter_calendar(self) -> Iterator[pd.DataFrame]:
+        """Regroups chunks, so that every chunk is one calendar period"""
+        buffer = []
+        current = None
+
+        for chunk in self._iter_raw():
+            periods = chunk.index.tz_localize(None).to_period(self.calendar)
+            breaks = np.flatnonzero(periods[1:] != periods[:-1]) + 1
+
+            if current is not None and periods[0] != current:
+                yield pd.concat(buffer)
+                buffer = []
+
+            start = 0
+            for stop in breaks:
+                buffer.append(chunk.iloc[start:stop])
+                yield pd.concat(buffer)
+                buffer = []
+                start = stop
+
+            buffer.append(chunk.iloc[start:])
+            current = periods[-1]
+
+        if buffer:
+            yield pd.concat(buffer)
+
+    def _iter_frames(self, overlap: Optional[Duration] = None) \
+            -> Iterator[Tuple[pd.DataFrame, int]]:
+        """Yields chunks with tail of previous chunk prepended
+
+        :returns: Chunk and number of rows prepended from previous chunk
+        """
+        chunks = self._iter_calendar() if self.calendar else self._iter_raw()
+        overlap = pd.Timedelta(overlap) if overlap is not None else None
+        tail = None
+
+        for chunk in chunks:
+            if overlap is None or tail is None:
+                yield chunk, 0
+            else:
+                yield pd.concat([tail, chunk]), len(tail)
+
+            if overlap is not None:
+                tail = chunk[chunk.index > chunk.index[-1] - overlap]
+
+    def _get_column(self, chunk: pd.DataFrame) -> pd.Series:
+        for column in ('px_close', 'px'):
+            if column in chunk.columns:
+                return chunk[column]
+        return chunk.iloc[:, 0]
+
+    def iter_chunks(self, overlap: Optional[Duration] = None) -> Iterator[pd.Series]:
+        """Yields prices chunk by chunk
+
+        :param overlap: Duration of previous chunk to repeat at the start of every chunk,
+            needed for windowed calculations
+        """
+        for chunk, _ in self._iter_frames(overlap):
+            yield self._get_column(chunk)
+
+    def get_drop(self, logic: DropLogic = DropLogic.SIMPLE,
+                 window: Optional[Duration] = None) -> Iterator[pd.Series]:
+        """Yields absolute drop chunk by chunk
+
+        | SIMPLE and WINDOWED logics are supported.
+
+        :param logic: How to calculate drop
+        :param window: Window for WINDOWED logic
+        """
+        if logic is DropLogic.SIMPLE:
+            high = -np.inf
+            for px in self.iter_chunks():
+                cummax = np.fmax(np.fmax.accumulate(px.values), high)
+                high = np.fmax(high, cummax[-1])
+                yield pd.Series(cummax - px.values, index=px.index, name=px.name)
+        elif logic is DropLogic.WINDOWED:
+            if window is None:
+                raise Exception(f"window prameter is required for {logic}")
+            for chunk, prepended in self._iter_frames(overlap=window):
+                px = self._get_column(chunk)
+                drop = utils.get_drop(px, logic=logic, window=window)
+                yield drop.iloc[prepended:]
+        else:
+            raise NotImplementedError(f"{logic} can't be calculated in chunks")
+
+    def get_crosses(self, value: float) -> pd.DatetimeIndex:
+        """Returns timestamps when specified value was crossed
+
+        :param value: Crossing line
+        :returns: List of timestamps when crossing occurred
+        """
+        crosses = []
+        last_state = None
+
+        for px in self.iter_chunks():
+            state = (px.values > value).astype(np.int64)
+            changed = np.diff(state, prepend=state[0] if last_state is None else last_state)
+            crosses.append(px.index[changed != 0])
+            last_state = state[-1]
+
+        if not crosses:
+            return pd.DatetimeIndex([])
+
+        return crosses[0].append(crosses[1:])
+
+    def get_percentile(self, value: Union[float, List[float]],
+                       bins: int = 2 ** 16) -> Union[float, List[float]]:
+        """Returns approximate percentile of prices
+
+        | Takes two passes over data: for range of prices and for histogram.
+        | Error is not bigger than (max price - min price) / bins.
+
+        :param value: Percentile value, [0-1]
+        :param bins: Number of histogram bins
+        :returns: Percentile or list of percentiles if value is a list,
+            NaN when there are no prices
+        """
+        low, high = np.inf, -np.inf
+        for px in self.iter_chunks():
+            px = px.values[~np.isnan(px.values)]
+            if len(px):
+                low = min(low, px.min())
+                high = max(high, px.max())
+
+        if low >= high:
+            # no prices at all, or all prices are equal
+            result = np.full(len(np.atleast_1d(value)), np.nan if low > high else low)
+            return result.tolist() if isinstance(value, list) else float(result[0])
+
+        edges = np.linspace(low, high, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for px in self.iter_chunks():
+            counts += np.histogram(px.values[~np.isnan(px.values)], bins=edges)[0]
+
+        cumulative = np.concatenate(([0], np.cumsum(counts))) / counts.sum()
+        result = np.interp(np.atleast_1d(value), cumulative, edges)
+
+        if isinstance(value, list):
+            return result.tolist()
+        return float(result[0])
+
+    def resample(self, dur: Duration) -> Iterator[pd.DataFrame]:
+        """Yields resampled data chunk by chunk
+
+        | OHLC data is aggregated into bigger bars, ticks take last price of every bucket
+          (labeled by bucket end, same as TimeSeries.resample).
+        | Rows of the last bucket of every chunk are carried to the next one.
+
+        :param dur: New time step
+        """
+        origin = None
+        carry = None
+
+        for chunk in self._iter_raw():
+            if self.md_type is not MDType.OHLC:
+                chunk = self._get_column(chunk).to_frame()
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+            if origin is None:
+                origin = chunk.index[0].normalize()
+
+            edges = fast_resample.get_bucket_edges(chunk.index, dur, origin=origin)
+            split = np.searchsorted(chunk.index.asi8,
+                                    edges[np.searchsorted(edges, chunk.index.asi8[-1],
+                                                          side='right') - 1])
+            carry = chunk.iloc[split:]
+
+            if split:
+                yield self._resample(chunk.iloc[:split], dur, origin)
+
+        if carry is not None and not carry.empty:
+            yield self._resample(carry, dur, origin)
+
+    def _resample(self, data: pd.DataFrame, dur: Duration, origin: pd.Timestamp):
+        if self.md_type is MDType.OHLC:
+            return utils.resample_ohlc(data, dur, origin=origin)
+        return fast_resample.resample(data, dur, fast_resample.LAST, origin=origin, label='right')
@@ -0,0 +1,88 @@
+"""Compact array representation of TimeSeries data
+
+| Compiled kernels take int64 epoch-ns index and C-contiguous float64 values directly,
+  pandas objects are created only for results returned to user.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ArrayCore:
+    """Index and values of time series as plain numpy arrays
+
+    | values has row per point and column per symbol, columns maps symbol to column number.
+    | Only numeric columns are kept.
+    """
+
+    __slots__ = ('index', 'values', 'columns', 'tz', 'index_name')
+
+    def __init__(self, index: np.ndarray, values: np.ndarray,
+                 columns: Dict[str, int], tz=None, index_name: Optional[str] = 'time'):
+        """
+        :param index: Epoch-ns time of points
+        :param values: 2D array of values, row per point
+        :param columns: Position of every symbol in values
+        :param tz: Timezone of original index
+        :param index_name: Name of original index
+        """
+        self.index = index
+        self.values = values
+        self.columns = columns
+        self.tz = tz
+        self.index_name = index_name
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> 'ArrayCore':
+        """Creates core from DataFrame with DatetimeIndex"""
+        df = df.select_dtypes('number')
+        index = df.index
+        tz = getattr(index, 'tz', None)
+
+        return cls(
+            index=np.ascontiguousarray(index.asi8 if isinstance(index, pd.DatetimeIndex)
+                                       else index.values, dtype=np.int64),
+            values=np.ascontiguousarray(df.values, dtype=np.float64),
+            columns={column: i for i, column in enumerate(df.columns)},
+            tz=tz,
+            index_name=index.name,
+        )
+
+    def __len__(self):
+        return self.index.shape[0]
+
+    def column(self, symbol: str) -> np.ndarray:
+        """Returns values of symbol (strided view)"""
+        return self.values[:, self.columns[symbol]]
+
+    def contiguous_column(self, symbol: str) -> np.ndarray:
+        """Returns values of symbol as contiguous array, needed by most kernels"""
+        return np.ascontiguousarray(self.column(symbol))
+
+    def select(self, symbols: List[str]) -> np.ndarray:
+        """Returns C-contiguous values of symbols"""
+        return np.ascontiguousarray(self.values[:, [self.columns[x] for x in symbols]])
+
+    def slice(self, positions: slice) -> 'ArrayCore':
+        """Returns core of part of points, arrays are views"""
+        return ArrayCore(self.index[positions], self.values[positions], self.columns, self.tz,
+                         self.index_name)
+
+    def get_index(self) -> pd.DatetimeIndex:
+        index = pd.DatetimeIndex(self.index.view('datetime64[ns]'), name=self.index_name)
+        if self.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self.tz)
+        return index
+
+    def to_series(self, values: np.ndarray, name: Optional[str] = None) -> pd.Series:
+        """Wraps values computed for every point into pandas series"""
+        return pd.Series(values, index=self.get_index(), name=name)
+
+    def to_df(self, values: Optional[np.ndarray] = None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Wraps values into DataFrame, by default returns data of core"""
+        if values is None:
+            values = self.values
+            columns = sorted(self.columns, key=self.columns.get)
+        return pd.DataFrame(values, index=self.get_index(), columns=columns)
@@ -0,0 +1,309 @@
+"""Lazy arithmetic over TimeSeries columns
+
+| Operators on lazy columns don't compute anything, they build an expression graph.
+  Graph is evaluated once, when result is needed:
+| - equal subexpressions are computed only once,
+| - with numexpr installed expression is computed in one blockwise pass
+  (repeated subexpressions are computed before it into temporaries),
+  otherwise numpy computes it node by node, reusing buffers of finished nodes,
+| - result is cached until data of used columns changes; all operations are elementwise,
+  so framed result is a slice of cached one.
+
+.. python::
+    x = ts.lazy()
+    ts['SPREAD'] = x['T10'] * 5 - x['T30'] * 2
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+_UFUNCS = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': np.true_divide,
+    '**': np.power,
+    'neg': np.negative,
+    'abs': np.absolute,
+}
+
+
+class Expression:
+    """Node of expression graph"""
+
+    # makes numpy arrays call our reflected operators instead of broadcasting over us
+    __array_priority__ = 1000
+
+    def __init__(self, key: tuple, args: Tuple['Expression', ...] = ()):
+        """
+        :param key: Structural key, equal for equal expressions
+        :param args: Operands
+        """
+        self.key = key
+        self.args = args
+        self._memo: Optional[Tuple[tuple, np.ndarray]] = None
+
+    def __add__(self, other):
+        return _operation('+', self, other)
+
+    def __radd__(self, other):
+        return _operation('+', other, self)
+
+    def __sub__(self, other):
+        return _operation('-', self, other)
+
+    def __rsub__(self, other):
+        return _operation('-', other, self)
+
+    def __mul__(self, other):
+        return _operation('*', self, other)
+
+    def __rmul__(self, other):
+        return _operation('*', other, self)
+
+    def __truediv__(self, other):
+        return _operation('/', self, other)
+
+    def __rtruediv__(self, other):
+        return _operation('/', other, self)
+
+    def __pow__(self, other):
+        return _operation('**', self, other)
+
+    def __neg__(self):
+        return _operation('neg', self)
+
+    def __abs__(self):
+        return _operation('abs', self)
+
+    def abs(self):
+        return _operation('abs', self)
+
+    def __repr__(self):
+        return f"Expression({self._render({})})"
+
+    def _render(self, names: Dict[tuple, str]) -> str:
+        raise NotImplementedError()
+
+    def get_nodes(self) -> List['Expression']:
+        """Returns unique nodes of graph, operands before operations"""
+        nodes = {}
+        stack = [(self, False)]
+
+        while stack:
+            node, expanded = stack.pop()
+            if node.key in nodes:
+                continue
+            if expanded or not node.args:
+                nodes[node.key] = node
+                continue
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in reversed(node.args))
+
+        return list(nodes.values())
+
+    def get_columns(self) -> List['Column']:
+        return [node for node in self.get_nodes() if isinstance(node, Column)]
+
+    def _get_state(self, columns: List['Column']) -> tuple:
+        return tuple(column.get_state() for column in columns)
+
+    def _compute(self, nodes: List['Expression'], length: int) -> np.ndarray:
+        # number of operations that still need result of every node
+        consumers = {}
+        for node in nodes:
+            for arg in node.args:
+                consumers[arg.key] = consumers.get(arg.key, 0) + 1
+
+        if numexpr is not None:
+            names = {}
+            local_dict = {}
+            for node in nodes:
+                if isinstance(node, (Column, Array)):
+                    names[node.key] = f"v{len(names)}"
+                    local_dict[names[node.key]] = node.get_values()
+                elif isinstance(node, Operation) and consumers.get(node.key, 0) > 1:
+                    # rendered tree would repeat the subexpression, so it's bound to temporary
+                    local_dict[f"v{len(names)}"] = numexpr.evaluate(node._render(names),
+                                                                    local_dict=local_dict)
+                    names[node.key] = f"v{len(names)}"
+            return numexpr.evaluate(self._render(names), local_dict=local_dict)
+
+        values = {}
+        free = []
+
+        for node in nodes:
+            if not node.args:
+                values[node.key] = node.get_values()
+                continue
+
+            operands = [values[arg.key] for arg in node.args]
+
+            # operations are elementwise, so result can overwrite operand that isn't needed anymore
+            for arg in node.args:
+                consumers[arg.key] -= 1
+                if consumers[arg.key] == 0 and isinstance(arg, Operation):
+                    buffer = values.pop(arg.key)
+                    if isinstance(buffer, np.ndarray) and buffer.dtype == np.float64 \
+                            and buffer.shape == (length,):
+                        free.append(buffer)
+
+            ufunc = _UFUNCS[node.key[0]]
+            if free and any(isinstance(x, np.ndarray) for x in operands):
+                values[node.key] = ufunc(*operands, out=free.pop())
+            else:
+                values[node.key] = ufunc(*operands)
+
+        result = values[self.key]
+        if not isinstance(result, np.ndarray):
+            result = np.full(length, result, dtype=np.float64)
+        return result
+
+    def get_values(self) -> np.ndarray:
+        """Evaluates expression over all data, result is cached until data changes
+
+        | Returned array is shared with cache and must not be changed.
+        """
+        nodes = self.get_nodes()
+        columns = [node for node in nodes if isinstance(node, Column)]
+        if not columns:
+            raise Exception("Expression doesn't use any TimeSeries column")
+
+        state = self._get_state(columns)
+        if self._memo is not None and self._memo[0] == state:
+            return self._memo[1]
+
+        length = len(columns[0].ts.get_raw_df())
+        for node in nodes:
+            if isinstance(node, (Column, Array)) and len(node.get_values()) != length:
+                raise Exception("Expression operands have different length")
+
+        result = self._compute(nodes, length)
+        self._memo = (state, result)
+        return result
+
+    def evaluate(self, framed: bool = False) -> pd.Series:
+        """Returns result as pandas series, indexed like first used column
+
+        :param framed: Whether to return only points inside frame of first used column
+        """
+        column = self.get_columns()[0]
+        values = self.get_values()
+        index = column.ts.get_raw_df().index
+
+        if framed:
+            frame = column.ts._get_frame_slice()
+            values = values[frame]
+            index = index[frame]
+
+        return pd.Series(values.copy(), index=index, name=column.symbol)
+
+    def to_ts(self, name: Optional[str] = None, framed: bool = False):
+        """Returns result as new TimeSeries
+
+        :param name: Name of symbol, name of first used column by default
+        :param framed: Whether to return only points inside frame of first used column
+        """
+        from cns_analytics.timeseries import TimeSeries
+
+        series = self.evaluate(framed=framed)
+        return TimeSeries.from_df(series.rename(name or series.name), copy=False)
+
+
+class Column(Expression):
+    """Symbol of TimeSeries"""
+
+    def __init__(self, ts, symbol: str):
+        super().__init__(('column', id(ts), symbol))
+        self.ts = ts
+        self.symbol = symbol
+
+    def get_state(self) -> tuple:
+        """Changes whenever data of column changes"""
+        df = self.ts.get_raw_df()
+        # length changes when points are appended
+        return id(df), len(df), self.ts.get_column_version(self.symbol)
+
+    def get_values(self) -> np.ndarray:
+        return self.ts.get_raw_df()[self.symbol].values
+
+    def _render(self, names: Dict[tuple, str]) -> str:
+        return names.get(self.key, self.symbol)
+
+
+class Array(Expression):
+    """Numpy array, used by position"""
+
+    def __init__(self, values: np.ndarray):
+        super().__init__(('array', id(values)))
+        self.values = values
+
+    def get_values(self) -> np.ndarray:
+        return self.values
+
+    def _render(self, names: Dict[tuple, str]) -> str:
+        return names.get(self.key, 'array')
+
+
+class Constant(Expression):
+    def __init__(self, value: float):
+        super().__init__(('constant', value))
+        self.value = value
+
+    def get_values(self):
+        return self.value
+
+    def _render(self, names: Dict[tuple, str]) -> str:
+        return repr(float(self.value))
+
+
+class Operation(Expression):
+    def _render(self, names: Dict[tuple, str]) -> str:
+        if self.key in names:
+            return names[self.key]
+        op = self.key[0]
+        args = [arg._render(names) for arg in self.args]
+        if op == 'neg':
+            return f"(-{args[0]})"
+        if op == 'abs':
+            return f"abs({args[0]})"
+        return f"({args[0]} {op} {args[1]})"
+
+
+class LazyFrame:
+    """Gives lazy columns of TimeSeries"""
+
+    def __init__(self, ts):
+        self.ts = ts
+
+    def __getitem__(self, symbol) -> Column:
+        symbol = getattr(symbol, 'name', symbol)
+        if symbol not in self.ts.get_raw_df().columns:
+            raise KeyError(symbol)
+        return Column(self.ts, symbol)
+
+
+def _wrap(value) -> Expression:
+    from cns_analytics.timeseries import TimeSeries
+
+    if isinstance(value, Expression):
+        return value
+    if isinstance(value, TimeSeries):
+        return Column(value, value.expect_one_symbol())
+    if isinstance(value, np.ndarray):
+        return Array(value)
+    if np.isscalar(value):
+        return Constant(value)
+    raise TypeError(f"Can't use {type(value).__name__} in expression")
+
+
+def _operation(op: str, *args) -> Expression:
+    args = tuple(_wrap(arg) for arg in args)
+    return Operation((op,) + tuple(arg.key for arg in args), args)
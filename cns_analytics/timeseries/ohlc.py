@@ -20,6 +20,7 @@ from typing import Optional
 import pandas as pd
 
 from cns_analytics.entities import Duration
+from cns_analytics.utils import fast_align
 
 
 class OHLCMask:
@@ -53,8 +54,7 @@ class OHLC:
             if isinstance(resolution, str):
                 resolution = pd.Timedelta(resolution)
 
-            idx = pd.date_range(df.index[0], df.index[-1], freq='1T')
-            df = df.reindex(idx, method='ffill')
+            df = fast_align.to_grid(df, '1min')
 
             if rolling_backwards:
                 self.df = df.shift(periods=1, freq=resolution).to_frame('open')
@@ -1,18 +1,21 @@
 """ Simplifies work with spreads
 """
 import functools
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Union
 
 import numpy as np
 import pandas as pd
 
-from cns_analytics.entities import Symbol
+from cns_analytics.entities import Symbol, Duration
 from cns_analytics.timeseries.timeseries import TimeSeries
 
 
 def _wrap_spread_method(method):
     """Parametrized decorator for spread methods that work with legs of spread,
-    rather that spread itself"""
+    rather that spread itself
+
+    | Spread is recomputed only if method has changed legs.
+    """
     @functools.wraps(method)
     def _decorator(*args, **kwargs):
         self = method.__self__
@@ -21,14 +24,14 @@ def _wrap_spread_method(method):
         self.include_symbol(self._leg2)
         self.exclude_symbol(self.SPREAD_SERIES_NAME)
 
-        ret_val = method(*args, **kwargs)
+        try:
+            ret_val = method(*args, **kwargs)
+        finally:
+            self.exclude_symbol(self._leg1)
+            self.exclude_symbol(self._leg2)
+            self.include_symbol(self.SPREAD_SERIES_NAME)
 
-        self.exclude_symbol(self._leg1)
-        self.exclude_symbol(self._leg2)
-        self.include_symbol(self.SPREAD_SERIES_NAME)
-
-        # TODO: take into account spread op {-, /, +, *}
-        self._df[self.SPREAD_SERIES_NAME] = self._df[self._leg1] - self._df[self._leg2]
+        self._update_spread()
 
         return ret_val
 
@@ -54,6 +57,9 @@ class Spread(TimeSeries):
         self._leg1 = leg1.name
         self._leg2 = leg2.name
         self._op = op
+        self._spread_expression = None
+        # state of legs spread column was computed for, see _get_legs_state
+        self._spread_state = None
 
         self.scale_ols = _wrap_spread_method(self.scale_ols)
         self.scale_mean = _wrap_spread_method(self.scale_mean)
@@ -67,15 +73,49 @@ class Spread(TimeSeries):
         self.exclude_symbol(self._leg2)
 
         self.dropna()
-        if self._op == '-':
-            self._df[self.SPREAD_SERIES_NAME] = self._df[self._leg1] - self._df[self._leg2]
-        elif self._op == '/':
-            self._df[self.SPREAD_SERIES_NAME] = self._df[self._leg1] - self._df[self._leg2]
+        self._update_spread()
 
         return res
 
+    def _get_legs_state(self) -> tuple:
+        """Changes whenever data of any leg changes"""
+        df = self.get_raw_df()
+        return (id(df), len(df), self.get_column_version(self._leg1),
+                self.get_column_version(self._leg2))
+
+    def _update_spread(self):
+        """Sets spread series from legs
+
+        | Spread column is written again only if legs have changed since last update,
+          so read-only methods over legs don't invalidate anything cached for spread.
+        """
+        state = self._get_legs_state()
+        if state == self._spread_state and self.SPREAD_SERIES_NAME in self._df.columns:
+            return
+
+        if self._spread_expression is None:
+            legs = self.lazy()
+            # TODO: take into account spread op {-, /, +, *}
+            self._spread_expression = legs[self._leg1] - legs[self._leg2]
+
+        self[self.SPREAD_SERIES_NAME] = self._spread_expression
+        # writing spread doesn't change legs
+        self._spread_state = self._get_legs_state()
+
+    def get_spread(self, coef: float = 1, framed: bool = True) -> pd.Series:
+        """Returns leg1 - coef * leg2 without changing spread column
+
+        | Computed from arrays of legs over frame only, so it's cheap to try many coefs.
+
+        :param coef: Coefficient of second leg
+        :param framed: Whether to use only data inside frame
+        """
+        core = self.get_core(framed)
+        values = core.column(self._leg1) - coef * core.column(self._leg2)
+        return core.to_series(values, name=self.SPREAD_SERIES_NAME)
+
     @classmethod
-    def from_df(cls, df: pd.DataFrame) -> 'Spread':
+    def from_df(cls, df: pd.DataFrame, copy: bool = True) -> 'Spread':
         if isinstance(df, pd.Series):
             df = df.to_frame()
 
@@ -86,8 +126,7 @@ class Spread(TimeSeries):
         spread.exclude_symbol(spread._leg2)
         spread[cls.SPREAD_SERIES_NAME] = spread[spread._leg1] - spread[spread._leg2]
 
-        spread._df = df.copy()
-        spread._df.sort_index()
+        spread._df = df.copy() if copy else df
 
         return spread
 
@@ -132,42 +171,41 @@ class Spread(TimeSeries):
         high = np.percentile(df[self.SPREAD_SERIES_NAME], 100 - percentile * 100)
         return high - low
 
-    def get_sensitivity(self, sma: str) -> pd.DataFrame:
+    def get_sensitivity(self, sma: Duration, framed: bool = True) -> pd.DataFrame:
         """Returns sensitivity of one leg to another
 
+        | Calculated on original points, without reindexing to regular grid,
+          see utils.online_stats.Sensitivity. After append only new points are processed.
+        | Values are returned for original points only and are normalized by 0.1-99.9
+          percentile range of these points. Before, range was taken over regular grid,
+          so with gaps in data (weekends, sessions) values differ by constant factor.
+
+        :param sma: Smoothing window size
+        :param framed: Whether to use only data inside frame
         :returns: Sensitivity series
         """
-        s1, s2 = self.get_symbols()
-        df: pd.DataFrame = self.get_framed_df()
+        from cns_analytics.utils import fast_stats
+        from cns_analytics.utils.online_stats import Sensitivity
+
+        df: pd.DataFrame = self.get_df(framed)
 
         if len(df) <= 1:
             return pd.DataFrame()
 
-        df_interval = pd.DataFrame(df.index).diff().mode().time[0]
-        df_interval_secs = df_interval.total_seconds()
-        idx = pd.date_range(df.index[0], df.index[-1], freq=df_interval)
-        df = df.reindex(idx, method='ffill')
-
         sma = pd.Timedelta(sma)
-        # breakpoint()
-
-        vola = 1  # (self.get_volatility(s1, sma * 2) + self.get_volatility(s2, sma * 2)) / 2
-
-        l1: pd.Series = (df[s1].diff() / df[s1] * 100000 / vola).dropna()
-        l2: pd.Series = (df[s2].diff() / df[s2] * 100000 / vola).dropna()
 
-        k: pd.Series = ((l1 + 1000000) / (l2 + 1000000))
+        def create(index: np.ndarray):
+            # most common interval between points is step of grid, kept for appended points
+            intervals, counts = np.unique(np.diff(index), return_counts=True)
+            return Sensitivity(sma, intervals[counts.argmax()], index[0])
 
-        sma_secs = sma.total_seconds()
-
-        k = k.rolling(window=sma, min_periods=int(sma_secs // df_interval_secs)).mean().dropna()
-
-        k = (k - 1) * 100000000
+        k = self._get_online_statistic('sensitivity', (self._leg1, self._leg2), framed,
+                                       create, Sensitivity.update, sma=sma.value).dropna()
 
         if k.empty:
             return pd.DataFrame()
 
-        magn = np.percentile(k, 99.9) - np.percentile(k, 0.1)
+        magn = fast_stats.percentile_range(k.values.copy(), 0.1, 99.9)
         k = k / magn * 2
         return k.to_frame(self.get_name())
 
@@ -179,42 +217,42 @@ class Spread(TimeSeries):
         c2 = self.get_correlation(self.SPREAD_SERIES_NAME, self._leg2, framed=framed)
         return c1, -c2
 
-    def get_closes(self, low=0.1, high=0.9) -> Tuple[List[pd.Timestamp], List[pd.Timestamp]]:
+    def get_closes(self, low=0.1, high=0.9,
+                   window: Optional[Union[Duration, int]] = None,
+                   center: float = 0,
+                   framed: bool = True) -> Tuple[List[pd.Timestamp], List[pd.Timestamp]]:
         """Finds low and high crosses that followed by crossing zero line
 
+        | Low and high lines are percentiles of spread, with window they are walk-forward
+          percentiles over window ending at every point, so there is no look-ahead.
+        | All lines are processed in one compiled pass, see utils.fast_cross.
+
         :param low: Low cross percentile
         :param high: High cross percentile
+        :param window: None for percentiles over all data,
+            number of points or duration for rolling percentiles
+        :param center: Center line
+        :param framed: Whether to use only data inside frame
         :returns: Low and high crosses followed by zero cross
         """
-        crosses_high = self.get_crosses(self.get_percentile(high))
-        crosses_center = self.get_crosses(0)
-        crosses_low = self.get_crosses(self.get_percentile(low))
-
-        all_crosses = {}
-        for cross in crosses_low:
-            all_crosses[cross] = 'low'
+        from cns_analytics.utils import fast_cross, fast_walk_forward
 
-        for cross in crosses_high:
-            all_crosses[cross] = 'high'
+        core = self.get_core(framed)
+        spread = core.contiguous_column(self.SPREAD_SERIES_NAME)
 
-        for cross in crosses_center:
-            all_crosses[cross] = 'center'
-
-        all_crosses = sorted(list(all_crosses.items()))
-
-        last = 'center'
-        closes_low = []
-        closes_high = []
+        if window is None:
+            low_line = self.get_percentile(low, framed=framed)
+            high_line = self.get_percentile(high, framed=framed)
+        else:
+            lines = fast_walk_forward.percentiles(
+                spread, fast_walk_forward.get_window_starts(core.index, window),
+                np.array([low, high], dtype=np.float64), 1)
+            low_line, high_line = lines[:, 0], lines[:, 1]
 
-        for cross_time, zone in all_crosses:
-            if zone != last and zone == 'center':
-                if last == 'low':
-                    closes_low.append(cross_time)
-                if last == 'high':
-                    closes_high.append(cross_time)
-            last = zone
+        closes_low, closes_high = fast_cross.get_closes(spread, low_line, center, high_line)
 
-        return closes_low, closes_high
+        index = core.get_index()
+        return list(index[closes_low]), list(index[closes_high])
 
     def plot(self):
         import ta.trend
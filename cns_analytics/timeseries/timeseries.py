@@ -3,7 +3,7 @@
 import contextlib
 import functools
 from datetime import datetime, timedelta
-from typing import Optional, Union, List, Dict, Tuple
+from typing import Optional, Union, List, Dict, Tuple, TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
@@ -12,9 +12,15 @@ from dateutil import parser
 
 from cns_analytics import utils
 from cns_analytics.database import DataBase
-from cns_analytics.entities import Symbol, DateTime, Duration, Triangle, DropLogic, MDType
+from cns_analytics.entities import Symbol, DateTime, Duration, Triangle, DropLogic, MDType, BarType, \
+    Statistic, Alignment
+from cns_analytics.timeseries.core import ArrayCore
+from cns_analytics.timeseries.expression import Expression, LazyFrame
 from cns_analytics.utils import get_ols_regression
 
+if TYPE_CHECKING:
+    from cns_analytics.utils.online_stats import OnlineCache
+
 
 class DateTimeIterator:
     """Allows easy iteration over timeseries
@@ -64,73 +70,158 @@ class TimeSeries:
 
         self._frame_start = None
         self._frame_end = None
+        # index and integer positions of frame in it, see _get_frame_slice
+        self._frame_cache: Optional[Tuple[pd.Index, slice]] = None
         self.__symbols = symbols
         self._df: pd.DataFrame = pd.DataFrame()
         self._excluded_symbols = list()
         self._figure = None
         self._pointer = None
         self._default_symbol: Optional[Union[str, datetime]] = None
-
+        self._is_ohlc = False
+        # incremented on every change of data, see _touch
+        self._version = 0
+        self._base_version = 0
+        self._column_versions: Dict[str, int] = {}
+        # compact copy of data and (data, version) it was made for, see get_core
+        self._core: Optional[ArrayCore] = None
+        self._core_state = None
+        # state of online statistics, so they are updated only for appended points,
+        # see _get_online_statistic
+        self._online_stats: Dict[tuple, 'OnlineCache'] = {}
+
+    # addons are created on first access, most of timeseries
+    # (results of arithmetic, slices) never use them
+
+    @functools.cached_property
+    def mask(self):
         from cns_analytics.timeseries.addons.mask import MaskAddon
-        self.mask = MaskAddon(self)
+        return MaskAddon(self)
 
+    @functools.cached_property
+    def optimize(self):
         from cns_analytics.timeseries.addons.optimizer import SpreadOptimizerAddon
-        self.optimize = SpreadOptimizerAddon(self)
+        return SpreadOptimizerAddon(self)
 
+    @functools.cached_property
+    def fix(self):
         from cns_analytics.timeseries.addons.fix import FixAddon
-        self.fix = FixAddon(self)
+        return FixAddon(self)
 
+    @functools.cached_property
+    def backtest(self):
         from cns_analytics.timeseries.addons.backtest import BacktestAddon
-        self.backtest = BacktestAddon(self)
-
-        self._is_ohlc = False
+        return BacktestAddon(self)
 
     @property
     def index(self):
         return self.get_raw_df().index
 
+    def _touch(self, *symbols: str):
+        """Marks data as changed, so results cached for it are recalculated
+
+        :param symbols: Changed columns, all columns by default
+        """
+        self._version += 1
+        if symbols:
+            for symbol in symbols:
+                self._column_versions[symbol] = self._version
+        else:
+            self._base_version = self._version
+            self._column_versions.clear()
+
+    def get_core(self, framed: bool = False) -> ArrayCore:
+        """Returns data as plain numpy arrays for compiled kernels
+
+        | Core is built once and reused until data changes.
+
+        :param framed: Whether to return only points inside frame (as views)
+        """
+        state = (self._df, self._version)
+        if self._core is None or self._core_state[0] is not state[0] \
+                or self._core_state[1] != state[1]:
+            self._core = ArrayCore.from_df(self._df)
+            self._core_state = state
+
+        if framed:
+            return self._core.slice(self._get_frame_slice())
+        return self._core
+
+    def get_column_version(self, symbol: str) -> int:
+        """Returns number that changes whenever data of symbol changes
+
+        | Changes made directly to DataFrame from get_raw_df are not tracked.
+        """
+        return self._column_versions.get(symbol, self._base_version)
+
+    def lazy(self) -> LazyFrame:
+        """Returns lazy columns, arithmetic on them is evaluated only when needed
+
+        .. python::
+            x = ts.lazy()
+            ts['SPREAD'] = x['T10'] * 5 - x['T30'] * 2
+        """
+        return LazyFrame(self)
+
     @classmethod
-    def from_df(cls, df: pd.DataFrame):
+    def from_df(cls, df: pd.DataFrame, copy: bool = True):
         """Creates TimeSeries from pandas DataFrame
 
         :param df: DataFrame to create TimeSeries from
+        :param copy: Whether to copy data, if False TimeSeries takes ownership of df
+            and df must not be changed afterwards (used for frames that were just created)
         """
         if isinstance(df, pd.Series):
             df = df.to_frame()
+        if copy:
+            df = df.copy()
 
         series = cls()
-        series._df = df.copy()
-        series._df.sort_index()
+        series._df = df
         return series
 
     async def load_ticks(
             self,
             start: Optional[DateTime] = None,
-            end: Optional[DateTime] = None):
+            end: Optional[DateTime] = None,
+            alignment: Alignment = Alignment.INNER,
+            tolerance: Optional[Duration] = None):
         dfs = []
         for symbol in self.__symbols:
             dfs.append(await DataBase.get_ticks(symbol))
 
-        self._df = pd.concat(dfs, axis=1, join="inner")
-        self._df.sort_index()
+        self._df = self._align(dfs, alignment, tolerance)
+        self._touch()
+
+    @staticmethod
+    def _align(dfs: List[pd.DataFrame], alignment: Alignment,
+               tolerance: Optional[Duration]) -> pd.DataFrame:
+        """Aligns loaded data of symbols, see utils.fast_align"""
+        from cns_analytics.utils import fast_align
+
+        return fast_align.align_frames(dfs, alignment, tolerance)
 
     async def load(self,
                    start: Optional[DateTime] = None,
                    end: Optional[DateTime] = None,
                    resolution='1m',
                    ticks=False,
-                   use_db=False):
+                   use_db=False,
+                   alignment: Alignment = Alignment.INNER,
+                   tolerance: Optional[Duration] = None):
         """Loads prices from database
 
         :param start: First date to keep after loading
         :param end: Last date to keep after loading
         :param resolution: Can be any of 1m/5m/15m/1h/1d
         :param ticks: Load ticks or closes
+        :param alignment: How to align symbols with different timestamps
+        :param tolerance: Max age of price taken from previous timestamp, unlimited by default
         """
         from cns_analytics.storage import Storage
 
         if ticks:
-            return await self.load_ticks()
+            return await self.load_ticks(alignment=alignment, tolerance=tolerance)
 
         dfs = []
 
@@ -138,7 +229,8 @@ class TimeSeries:
             if use_db:
                 dfs.append(await DataBase.get_closes(symbol, resolution=resolution))
             else:
-                dfs.append(Storage.load_data(symbol, MDType.OHLC).px_close.rename(symbol.name))
+                dfs.append(Storage.load_data(symbol, MDType.OHLC, resolution=resolution)
+                           .px_close.rename(symbol.name))
 
         if start:
             if isinstance(start, str):
@@ -149,24 +241,27 @@ class TimeSeries:
                 end = parser.parse(end, dayfirst=True)
             end = pd.Timestamp(end).tz_localize(pytz.UTC)
 
-        self._df = pd.concat(dfs, axis=1, join="inner")
+        self._df = self._align(dfs, alignment, tolerance)
+        self._touch()
         if start:
             self._df = self._df[start:]
         if end:
             self._df = self._df[: end]
 
-        self._df.sort_index()
-
     async def load_ohlc(self,
                   start: Optional[DateTime] = None,
                   end: Optional[DateTime] = None,
                   resolution='1m',
-                  use_db=False):
+                  use_db=False,
+                  alignment: Alignment = Alignment.INNER,
+                  tolerance: Optional[Duration] = None):
         """Loads ohlc values from database
 
         :param start: First date to keep after loading
         :param end: Last date to keep after loading
         :param resolution: Can be any of 1m/5m/15m/1h/1d
+        :param alignment: How to align symbols with different timestamps
+        :param tolerance: Max age of bar taken from previous timestamp, unlimited by default
         """
         from cns_analytics.storage import Storage
 
@@ -177,7 +272,7 @@ class TimeSeries:
             if use_db:
                 dfs.append(await DataBase.get_ohlcs(symbol, resolution=resolution))
             else:
-                dfs.append(Storage.load_data(symbol, MDType.OHLC))
+                dfs.append(Storage.load_data(symbol, MDType.OHLC, resolution=resolution))
 
         if start:
             if isinstance(start, str):
@@ -188,13 +283,84 @@ class TimeSeries:
                 end = parser.parse(end, dayfirst=True)
             end = pd.Timestamp(end).tz_localize(pytz.UTC)
 
-        self._df = pd.concat(dfs, axis=1, join="inner")
+        self._df = self._align(dfs, alignment, tolerance)
+        self._touch()
         if start:
             self._df = self._df[start:]
         if end:
             self._df = self._df[: end]
 
-        self._df.sort_index()
+    async def load_bars(self,
+                        bar_type: BarType,
+                        size: Union[float, Duration],
+                        start: Optional[DateTime] = None,
+                        end: Optional[DateTime] = None,
+                        chunk_size: int = 1_000_000,
+                        alignment: Alignment = Alignment.INNER,
+                        tolerance: Optional[Duration] = None):
+        """Loads ticks chunk by chunk and aggregates them into OHLC bars
+
+        | Bars are labeled by close time.
+        | For bars other than time bars symbols have different close times,
+          so they should be aligned with ASOF or OUTER_FFILL.
+
+        :param bar_type: How to group ticks into bars
+        :param size: Interval for time bars, volume/money/ticks per bar for others,
+            initial expected ticks per bar for imbalance bars
+        :param start: First date to keep after loading
+        :param end: Last date to keep after loading
+        :param chunk_size: Number of ticks to keep in memory
+        :param alignment: How to align symbols with different timestamps
+        :param tolerance: Max age of bar taken from previous timestamp, unlimited by default
+        """
+        from cns_analytics.storage import Storage
+        from cns_analytics.utils.fast_bars import ticks_to_bars
+
+        self._is_ohlc = True
+        dfs = []
+
+        for symbol in self.__symbols:
+            dfs.append(ticks_to_bars(Storage.iter_data(symbol, MDType.TICKS, chunk_size),
+                                     bar_type, size))
+
+        if start:
+            if isinstance(start, str):
+                start = parser.parse(start, dayfirst=True)
+            start = pd.Timestamp(start).tz_localize(pytz.UTC)
+        if end:
+            if isinstance(end, str):
+                end = parser.parse(end, dayfirst=True)
+            end = pd.Timestamp(end).tz_localize(pytz.UTC)
+
+        self._df = self._align(dfs, alignment, tolerance)
+        self._touch()
+        if start:
+            self._df = self._df[start:]
+        if end:
+            self._df = self._df[: end]
+
+    def append(self, df: Union[pd.DataFrame, pd.Series]):
+        """Appends new points after last one
+
+        | Existing points don't change, so online statistics (get_zscore, get_volatility,
+          add_running_scale) are updated only for new points.
+
+        :param df: New points, columns missing in it (like ones added by add_running_scale) are NaN
+        """
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+        if not len(df):
+            return
+        if not len(self._df):
+            self._df = df.copy()
+            self._touch()
+            return
+        if df.index[0] <= self._df.index[-1]:
+            raise Exception("Appended points must be after last point")
+        if not set(df.columns) <= set(self._df.columns):
+            raise Exception("Appended points have unknown columns")
+
+        self._df = pd.concat([self._df, df.reindex(columns=self._df.columns)])
 
     def set_default_symbol(self, symbol: Optional[Union[str, datetime]]):
         """Set default symbol in order to omit symbol param in most functions"""
@@ -227,6 +393,8 @@ class TimeSeries:
         else:
             self._frame_end = None
 
+        self._frame_cache = None
+
     def get_frame(self) -> [Optional[datetime], Optional[datetime]]:
         """Returns currently applied frame
 
@@ -247,6 +415,8 @@ class TimeSeries:
         self._frame_end += step
         self._frame_end = min(self._df.index[-1], self._frame_end)
 
+        self._frame_cache = None
+
     @contextlib.contextmanager
     def context_frame(self,
                       start: Optional[Union[str, datetime]],
@@ -329,11 +499,16 @@ class TimeSeries:
             coefs[symbol] = coef
             if not dry_run:
                 self._df[symbol] *= coef
+                self._touch(symbol)
 
         return coefs
 
     def scale_running(self, period='30d'):
-        """Scale symbols to match first symbol's running mean inside frame"""
+        """Scale symbols to match first symbol's running mean inside frame
+
+        | Prices are changed inplace and whole frame is recalculated on every call,
+          see add_running_scale for online version.
+        """
 
         df = self.get_framed_df()
         base_symbol = self.get_symbols()[0]
@@ -342,6 +517,69 @@ class TimeSeries:
         for symbol in self.get_symbols():
             running_coef = base_series_mean / df[symbol].rolling(period).mean()
             self._df[symbol] *= running_coef
+            self._touch(symbol)
+
+    def add_running_scale(self, *symbols: Union[Symbol, str], period: Duration = '30d',
+                          suffix: str = '_SCALED') -> List[str]:
+        """Writes symbols scaled to match first symbol's running mean inside frame to new columns
+
+        | Same values as scale_running, but prices are not changed.
+        | Rolling means are kept between calls, so after append only new points
+          are processed and written.
+        | New columns are excluded (see exclude_symbol), so they aren't taken as symbols
+          by other methods, use ts[column] to get them.
+
+        :param symbols: Base symbol followed by symbols to scale, all symbols by default
+        :param period: Time window of running mean
+        :param suffix: Suffix of new columns
+        :returns: Names of new columns
+        """
+        from cns_analytics.utils.online_stats import RollingMoments
+
+        symbols = [x.name if isinstance(x, Symbol) else x for x in symbols] or self.get_symbols()
+        period = pd.Timedelta(period)
+        frame = self._get_frame_slice()
+        length = frame.stop - frame.start
+
+        def create(index: np.ndarray):
+            return RollingMoments(period, min_periods=1, ddof=0)
+
+        def update(stats: RollingMoments, index: np.ndarray, values: np.ndarray):
+            return stats.update(index, values)[0]
+
+        base, base_position = self._update_online_statistic(
+            'running_mean', symbols[0], frame, create, update, period=period.value)
+
+        columns = []
+        for symbol in symbols:
+            leg, position = self._update_online_statistic(
+                'running_mean', symbol, frame, create, update, period=period.value)
+            column = f"{symbol}{suffix}"
+            columns.append(column)
+            self.exclude_symbol(column)
+
+            # written part of column is valid while its inputs and column itself don't change
+            state = (symbols[0], symbol, period.value, base.first_time,
+                     self.get_column_version(symbols[0]), self.get_column_version(symbol))
+            written = self._online_stats.get(('running_scale', column))
+            if written is not None and column in self._df.columns and written[0] == state \
+                    and written[1] == self.get_column_version(column):
+                position = min(position, base_position, written[2])
+            else:
+                position = 0
+                self._df[column] = np.nan
+
+            if position < length:
+                values = self._df[symbol].values[frame][position:]
+                scaled = values * base.result[position:] / leg.result[position:]
+                self._df.iloc[frame.start + position:frame.stop,
+                              self._df.columns.get_loc(column)] = scaled
+                self._touch(column)
+
+            self._online_stats[('running_scale', column)] = \
+                (state, self.get_column_version(column), length)
+
+        return columns
 
     def scale_ols(self, *symbols: Optional[str], dry_run=False) -> Dict[str, float]:
         """ Scales all symbols using OLS regression with first symbol inside frame
@@ -350,21 +588,48 @@ class TimeSeries:
         :param dry_run: Don't scale, only return coefs
         :returns: List of scale coefficient
         """
-        df = self.get_framed_df()
         symbols = symbols or self.get_symbols()
-        base_symbol = symbols[0]
-        base_series = df[base_symbol]
+        core = self.get_core(framed=True)
 
-        coefs = {}
+        # all symbols are regressed on base symbol at once
+        _, coefs = get_ols_regression(core.column(symbols[0]), core.select(symbols))
+        coefs = dict(zip(symbols, coefs))
 
-        for symbol in symbols:
-            coef = get_ols_regression(base_series, df[symbol])[1]
-            coefs[symbol] = coef
-            if not dry_run:
-                self._df[symbol] = self._df[symbol] * round(coef, 6)
+        if not dry_run:
+            for symbol in symbols:
+                self._df[symbol] = self._df[symbol] * round(coefs[symbol], 6)
+            self._touch(*symbols)
 
         return coefs
 
+    def get_rolling_ols(self, *symbols: Union[Symbol, str],
+                        window: Optional[Union[Duration, int]] = None,
+                        min_periods: Optional[int] = None,
+                        framed: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Regresses symbols on first symbol over window ending at every point
+
+        | Same as walk_forward(Statistic.OLS) for every symbol, symbols are processed in parallel.
+
+        :param symbols: Base symbol followed by dependent symbols, all symbols by default
+        :param window: None for expanding window, number of points or duration for rolling one
+        :param min_periods: Minimum number of points in window, NaN is returned for smaller windows
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrames of shift and coef, with column per dependent symbol
+        """
+        from cns_analytics.utils import fast_stats, fast_walk_forward
+
+        symbols = [x.name if isinstance(x, Symbol) else x for x in symbols] or self.get_symbols()
+        if len(symbols) < 2:
+            raise Exception("OLS requires at least two symbols")
+        core = self.get_core(framed)
+        if min_periods is None:
+            min_periods = fast_walk_forward.MIN_PERIODS[Statistic.OLS]
+
+        shift, coef = fast_stats.rolling_ols_batch(
+            core.contiguous_column(symbols[0]), core.select(symbols[1:]),
+            fast_walk_forward.get_window_starts(core.index, window), min_periods)
+        return core.to_df(shift, columns=symbols[1:]), core.to_df(coef, columns=symbols[1:])
+
     def get_raw_df(self) -> pd.DataFrame:
         """Returns all data disregarding frame
 
@@ -372,12 +637,45 @@ class TimeSeries:
         """
         return self._df
 
+    def _get_frame_slice(self) -> slice:
+        """Returns integer positions of frame
+
+        | Positions are found by binary search over int64 index and cached
+          until frame or index of data changes.
+        """
+        index = self._df.index
+        if self._frame_cache is not None and self._frame_cache[0] is index:
+            return self._frame_cache[1]
+
+        if isinstance(index, pd.DatetimeIndex):
+            values = index.asi8
+            start = 0 if self._frame_start is None else \
+                np.searchsorted(values, pd.Timestamp(self._frame_start).value, side='left')
+            end = len(values) if self._frame_end is None else \
+                np.searchsorted(values, pd.Timestamp(self._frame_end).value, side='right')
+            frame = slice(int(start), int(end))
+        else:
+            frame = index.slice_indexer(self._frame_start, self._frame_end)
+
+        self._frame_cache = (index, frame)
+        return frame
+
     def get_framed_df(self) -> pd.DataFrame:
         """Returns framed data
 
         :returns: Framed DataFrame
         """
-        return self._df.loc[self._frame_start: self._frame_end]
+        return self._df.iloc[self._get_frame_slice()]
+
+    def framed_values(self, symbol: Optional[Union[Symbol, str]] = None) -> np.ndarray:
+        """Returns framed prices of symbol as numpy array
+
+        | Array is a view of underlying data, it must not be changed.
+
+        :param symbol: Symbol to return
+        """
+        symbol = self.expect_one_symbol(symbol)
+        return self._df[symbol].values[self._get_frame_slice()]
 
     def get_df(self, framed: bool) -> pd.DataFrame:
         """Returns data
@@ -391,18 +689,68 @@ class TimeSeries:
     def get_frame_iterator(self, frame_start: str, frame_end: str):
         """Iterates over time series shifting frame along the way
 
-        Frame is set to current row on every iteration
+        Frame is set to current row on every iteration,
+        use walk_forward to calculate statistics for every row
 
         :param frame_start: Start of frame to iterate, won't be shifted
         :param frame_end: End of frame to iterate, will shifted every iteration
         """
 
         self.set_frame(None, None)
+        rows = self._df[frame_end:]
+
+        self.set_frame(frame_start, frame_end)
+        start, end = self._frame_start, self._frame_end
+        frame = self._get_frame_slice()
 
-        for row in self._df[frame_end:].itertuples():
-            self.set_frame(frame_start, frame_end)
+        for position, row in enumerate(rows.itertuples(), start=len(self._df) - len(rows)):
+            self._frame_start, self._frame_end = start, end
+            self._frame_cache = (self._df.index, frame)
             yield row
-            frame_end = row.Index
+            # next frame ends at this row
+            end = row.Index.astimezone(pytz.UTC)
+            frame = slice(frame.start, position + 1)
+
+    def walk_forward(self, statistic: Statistic, *symbols: Union[Symbol, str],
+                     window: Optional[Union[Duration, int]] = None,
+                     value: Optional[float] = None,
+                     min_periods: Optional[int] = None,
+                     framed: bool = True) -> Union[pd.Series, pd.DataFrame]:
+        """Calculates statistic for every point over window ending at this point (inclusive)
+
+        | Same as calculating statistic inside frame on every step of get_frame_iterator,
+          but in one compiled pass.
+
+        .. python::
+            zscore_std = ts.walk_forward(Statistic.STD, window='30d')
+            hedge = ts.walk_forward(Statistic.OLS, 'T10', 'T30')
+
+        :param statistic: Statistic to calculate
+        :param symbols: Symbol, or base and dependent symbols for OLS
+        :param window: None for expanding window, number of points or duration for rolling one
+        :param value: Percentile value, [0-1]
+        :param min_periods: Minimum number of points in window, NaN is returned for smaller windows
+        :param framed: Whether to use only data inside frame
+        :returns: Series of statistic, DataFrame with shift and coef columns for OLS
+        """
+        from cns_analytics.utils import fast_walk_forward
+
+        core = self.get_core(framed)
+
+        if statistic is Statistic.OLS:
+            symbols = [x.name if isinstance(x, Symbol) else x for x in symbols] \
+                or self.get_symbols()
+            if len(symbols) != 2:
+                raise Exception("OLS requires exactly two symbols")
+            shift, coef = fast_walk_forward.calculate(
+                core.index, core.column(symbols[0]), statistic, y=core.column(symbols[1]),
+                window=window, min_periods=min_periods)
+            return core.to_df(np.column_stack([shift, coef]), columns=['shift', 'coef'])
+
+        symbol = self.expect_one_symbol(symbols[0] if symbols else None)
+        result = fast_walk_forward.calculate(core.index, core.column(symbol), statistic,
+                                             window=window, value=value, min_periods=min_periods)
+        return core.to_series(result, name=symbol)
 
     def get_adf_test(self,
                      symbol: str = None,
@@ -426,6 +774,24 @@ class TimeSeries:
 
         return adf, key_points, p_value
 
+    def get_adf_tests(self, *symbols: Union[Symbol, str], lag: int = 1,
+                      framed: bool = True) -> pd.DataFrame:
+        """Tests every symbol for stationarity with compiled ADF test, symbols are tested in parallel
+
+        | Unlike get_adf_test lag is fixed, p-value is MacKinnon approximation.
+
+        :param symbols: Symbols to test, all symbols by default
+        :param lag: Number of lagged differences
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with adf and p_value columns, indexed by symbol
+        """
+        from cns_analytics.utils import fast_adf
+
+        symbols = [x.name if isinstance(x, Symbol) else x for x in symbols] or self.get_symbols()
+        stat, p_value = fast_adf.adf_tests(self.get_core(framed).select(symbols), lag)
+
+        return pd.DataFrame({'adf': stat, 'p_value': p_value}, index=symbols)
+
     def get_hurst_exponent(self, symbol: str = None) -> float:
         """Returns the Hurst Exponent of the time series vector ts
 
@@ -446,6 +812,46 @@ class TimeSeries:
 
         return utils.get_hurst_exponent(data)
 
+    def get_hurst_exponents(self, *symbols: Union[Symbol, str], framed: bool = True) -> pd.Series:
+        """Returns Hurst Exponent of every symbol, symbols are processed in parallel
+
+        :param symbols: Symbols to get exponent, all symbols by default
+        :param framed: Whether to use only data inside frame
+        :returns: Hurst exponent indexed by symbol
+        """
+        from cns_analytics.utils import fast_stats
+
+        symbols = [x.name if isinstance(x, Symbol) else x for x in symbols] or self.get_symbols()
+        core = self.get_core(framed)
+
+        return pd.Series(fast_stats.get_hurst_exponents(core.select(symbols)), index=symbols)
+
+    def get_rolling_hurst(self, *symbols: Union[Symbol, str],
+                          window: Optional[Union[Duration, int]] = None,
+                          min_periods: Optional[int] = None,
+                          framed: bool = True) -> pd.DataFrame:
+        """Returns Hurst Exponent over window ending at every point for every symbol
+
+        | Same as walk_forward(Statistic.HURST) for every symbol, symbols are processed in parallel.
+
+        :param symbols: Symbols to get exponent, all symbols by default
+        :param window: None for expanding window, number of points or duration for rolling one
+        :param min_periods: Minimum number of points in window, NaN is returned for smaller windows
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with column per symbol
+        """
+        from cns_analytics.utils import fast_stats, fast_walk_forward
+
+        symbols = [x.name if isinstance(x, Symbol) else x for x in symbols] or self.get_symbols()
+        core = self.get_core(framed)
+        if min_periods is None:
+            min_periods = fast_walk_forward.MIN_PERIODS[Statistic.HURST]
+
+        result = fast_stats.rolling_hurst_batch(
+            core.select(symbols), fast_walk_forward.get_window_starts(core.index, window),
+            fast_stats.HURST_LAGS, min_periods)
+        return core.to_df(result, columns=symbols)
+
     def get_correlation(self, *symbols: str, framed=True):
         """Returns correlation between two symbols
 
@@ -492,35 +898,39 @@ class TimeSeries:
         """Returns smoothed volatility of a chosen symbol
 
         If there is only one symbol you can omit "symbol" argument
+        Calculated online, after append only new points are processed.
 
         :param symbol: Symbol to calculate volatility for
-        :param sma: Smoothing window size
+        :param sma: Smoothing window size, 14 days by default
         :param framed: Whether to frame underlying data
 
         :returns: Smoothed volatility pandas series
         """
-        symbols = [symbol] or self.get_symbols()
-        if len(symbols) != 1:
-            raise Exception("Expected exactly 1 symbol")
+        from cns_analytics.utils.online_stats import RollingMoments
 
-        df = self.get_df(framed=framed)
+        symbol = self.expect_one_symbol(symbol)
+        sma = pd.Timedelta(sma or '14d')
+
+        def create(index: np.ndarray):
+            # most common interval between points, kept for appended points
+            intervals, counts = np.unique(np.diff(index), return_counts=True)
+            min_periods = int(sma.value // intervals[counts.argmax()]) if len(intervals) else 1
+            return RollingMoments(sma, min_periods=min_periods, ddof=0)
 
-        sma_secs = sma.total_seconds()
-        df_interval = pd.DataFrame(df.index).diff().mode().time[0]
-        df_interval_secs = df_interval.total_seconds()
-        min_periods = int(sma_secs // df_interval_secs)
+        def update(stats: RollingMoments, index: np.ndarray, values: np.ndarray):
+            return stats.update(index, values)[1] * (252 ** 0.5)
 
-        return df[symbols[0]].rolling(sma or '14d', min_periods=min_periods).std(ddof=0)*(252**0.5)
+        return self._get_online_statistic('volatility', symbol, framed, create, update, sma=sma.value)
 
     def dropna(self):
         """Remove NaN values from dataframe"""
-        return TimeSeries.from_df(self.get_raw_df().dropna())
+        return TimeSeries.from_df(self.get_raw_df().dropna(), copy=False)
 
     def copy(self):
-        return TimeSeries.from_df(self.get_raw_df().copy())
+        return TimeSeries.from_df(self.get_raw_df().copy(), copy=False)
 
     def fillna(self, value):
-        return TimeSeries.from_df(self.get_raw_df().fillna(value))
+        return TimeSeries.from_df(self.get_raw_df().fillna(value), copy=False)
 
     def get_crosses(self, value: float,
                     symbol: Union[Symbol, str] = None,
@@ -535,10 +945,14 @@ class TimeSeries:
 
         :returns: List of timestamps when crossing occurred
         """
+        from cns_analytics.utils import fast_cross
+
         symbol = self.expect_one_symbol(symbol)
+        core = self.get_core(framed)
 
-        crosses = (self.get_df(framed=framed)[symbol] > value).astype(np.int64).diff().dropna()
-        return crosses[crosses != 0].index
+        positions = fast_cross.crosses(core.contiguous_column(symbol),
+                                       np.array([value], dtype=np.float64))
+        return core.get_index()[positions]
 
     def get_macd_diff(self, window_slow: int, window_fast: int, window_sign: int,
                       symbol: Union[Symbol, str] = None, framed: bool = True) -> pd.Series:
@@ -588,7 +1002,7 @@ class TimeSeries:
             window = pd.Timedelta(window)
         df = self.get_df(framed=framed)
         data = df.rolling(window).mean()
-        return TimeSeries.from_df(data)
+        return TimeSeries.from_df(data, copy=False)
 
     def set_pointer(self, pointer: DateTime):
         """Sets pointer"""
@@ -639,6 +1053,7 @@ class TimeSeries:
         symbol = self.expect_one_symbol(symbol)
         trend = self.get_trend(symbol)
         self._df[symbol] -= trend
+        self._touch(symbol)
 
     def get_datetime_iterator(self,
                               step: Duration, framed=True,
@@ -649,27 +1064,38 @@ class TimeSeries:
                                 end=df.index[-1],
                                 step=step)
 
-    def resample(self, dur: Duration, inplace=True):
-        """Changes time step of timeseries, irreversible if inplace"""
+    def resample(self, dur: Duration, inplace=True,
+                 origin: Union[str, DateTime] = 'start_day',
+                 offset: Optional[Duration] = None,
+                 session_start: Optional[str] = None):
+        """Changes time step of timeseries, irreversible if inplace
+
+        :param dur: New time step
+        :param inplace: Whether to change this timeseries or return new one
+        :param origin: Same as in pandas: epoch/start/start_day or timestamp to align buckets to
+        :param offset: Shift of origin
+        :param session_start: Local time of session open (like "09:30"),
+            aligns buckets to it every day
+        """
+        from cns_analytics.utils import fast_resample
+
         if not self.empty():
             if self._is_ohlc:
-                resampled = self._df.resample(pd.Timedelta(dur))
-                df = resampled.last()
-                df['px_open'] = resampled.px_open.first()
-                df['px_high'] = resampled.px_high.max()
-                df['px_low'] = resampled.px_low.min()
-                df['volume'] = resampled.volume.sum()
-                df = df.dropna()
+                df = utils.resample_ohlc(self._df, dur, origin=origin, offset=offset,
+                                         session_start=session_start)
             else:
-                df = self._df.resample(pd.Timedelta(dur), label='right').last().dropna()
+                df = fast_resample.resample(self._df, dur, fast_resample.LAST, origin=origin,
+                                            offset=offset, session_start=session_start,
+                                            label='right')
 
         else:
             df = self._df
 
         if inplace:
             self._df = df
+            self._touch()
         else:
-            return type(self).from_df(df)
+            return type(self).from_df(df, copy=False)
 
     def get_triangle(self, symbol: Union[Symbol, str] = None, outside_threshold=0.05) -> Triangle:
         """Returns best triangle for this timeseries
@@ -677,31 +1103,44 @@ class TimeSeries:
         :param outside_threshold: Max pct of points outside of upper or lower triangle lines
             (each side is counted separately)
         """
-        from scipy.optimize import minimize
+        from cns_analytics.utils import fast_triangle
 
         symbol = self.expect_one_symbol(symbol=symbol)
-        points = self.get_df(framed=False)[symbol].values
-        point_count = points.size
-        half_point_count = int(round(point_count / 2))
+        points = np.ascontiguousarray(self.get_df(framed=False)[symbol].values, dtype=np.float64)
+
+        a0, a1, b0, b1 = fast_triangle.fit(points, outside_threshold)
+
+        return Triangle(a0=a0, a1=a1, b0=b0, b1=b1, n=points.size)
 
-        xa0 = np.array([np.max(points[:half_point_count]), np.max(points[half_point_count:])])
-        xb0 = np.array([np.min(points[:half_point_count]), np.min(points[half_point_count:])])
+    def get_rolling_triangles(self, window: Union[Duration, int],
+                              symbol: Union[Symbol, str] = None,
+                              step: int = 1,
+                              outside_threshold=0.05,
+                              framed: bool = True) -> pd.DataFrame:
+        """Fits triangle to window ending at every step'th point, windows are fitted in parallel
 
-        minimizer_kwargs = {'disp': False, 'maxiter': 10e3}
+        | Every row is the same as get_triangle over points of window.
+
+        :param window: Number of points or duration of window
+        :param symbol: Symbol to work with
+        :param step: Number of points between ends of windows
+        :param outside_threshold: Max pct of points outside of upper or lower triangle lines
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with a0, a1, b0, b1 and n columns, indexed by last point of window
+        """
+        from cns_analytics.utils import fast_triangle, fast_walk_forward
 
-        xa2 = minimize(
-            functools.partial(Triangle.target_function, direction=-1, h=point_count, points=points,
-                              outside_threshold=outside_threshold), xa0,
-            method='Nelder-Mead', options=minimizer_kwargs)
-        xa3 = minimize(
-            functools.partial(Triangle.target_function, direction=1, h=point_count, points=points,
-                              outside_threshold=outside_threshold), xb0,
-            method='Nelder-Mead', options=minimizer_kwargs)
+        symbol = self.expect_one_symbol(symbol=symbol)
+        core = self.get_core(framed)
 
-        a0, a1 = xa2.x
-        b0, b1 = xa3.x
+        ends = np.arange(len(core) - 1, -1, -step)[::-1]
+        starts = fast_walk_forward.get_window_starts(core.index, window)[ends]
+        result = fast_triangle.fit_windows(core.contiguous_column(symbol), starts, ends + 1,
+                                           outside_threshold)
 
-        return Triangle(a0=a0, a1=a1, b0=b0, b1=b1, n=point_count)
+        df = pd.DataFrame(result, index=core.get_index()[ends], columns=['a0', 'a1', 'b0', 'b1'])
+        df['n'] = ends + 1 - starts
+        return df
 
     def get_drop(self,
                  logic: DropLogic = DropLogic.SIMPLE,
@@ -747,22 +1186,78 @@ class TimeSeries:
         use ALL [0-5000] previous time points available, not [4000-5000] (like sliding window would do).
         first values, that lay inside initial "windows" are biased, because they are calculated from themselves,
         so you shouldn't and can't use them, because they are NaN
+        mean and std are calculated online, after append only new points are processed
         """
+        from cns_analytics.utils.online_stats import ExpandingMoments
+
         window = pd.Timedelta(window)
         symbol = self.expect_one_symbol(symbol)
-        df = self.get_df(framed=framed)[symbol]
-        assert df.index[-1] - df.index[0] > window, "Window is bigger than available history"
+        index = self._df.index[self._get_frame_slice() if framed else slice(None)]
+        assert index[-1] - index[0] > window, "Window is bigger than available history"
+
+        def create(index: np.ndarray):
+            # because window is expanding, it's enough to know number of points in first window
+            min_periods = int(np.searchsorted(index, index[0] + window.value, side='left'))
+            return ExpandingMoments(min_periods=min_periods, ddof=1)
+
+        def update(stats: ExpandingMoments, index: np.ndarray, values: np.ndarray):
+            mean, std = stats.update(values)
+            return (values - mean) / std
+
+        zscore = self._get_online_statistic('zscore', symbol, framed, create, update, window=window.value)
+        return TimeSeries.from_df(zscore, copy=False)
+
+    def _get_online_statistic(self, name: str, symbol: Union[str, Tuple[str, ...]], framed: bool,
+                              create, update, **params) -> pd.Series:
+        """Calculates statistic online, resuming from points processed by previous call
+
+        | State is reused while column version and already processed points don't change,
+          so after append only new points are processed.
+
+        :param name: Name of statistic
+        :param symbol: Symbol to calculate statistic for, or tuple of symbols,
+            then update gets 2D values with column per symbol
+        :param framed: Whether to frame underlying data
+        :param create: Creates online statistic from epoch-ns index of all points
+        :param update: Feeds statistic with new points, returns result for them
+        :param params: Parameters of statistic, different parameters are cached separately
+        """
+        frame = self._get_frame_slice() if framed else slice(None)
+        cache, _ = self._update_online_statistic(name, symbol, frame, create, update, **params)
+
+        return pd.Series(cache.result.copy(), index=self._df.index[frame],
+                         name=symbol if isinstance(symbol, str) else None)
+
+    def _update_online_statistic(self, name: str, symbol: Union[str, Tuple[str, ...]], frame: slice,
+                                 create, update, **params) -> Tuple['OnlineCache', int]:
+        """Updates online statistic with points of frame, see _get_online_statistic
+
+        :returns: Cache with result for every point of frame and number of points,
+            that were processed before this call
+        """
+        from cns_analytics.utils.online_stats import OnlineCache
+
+        time = self._df.index.asi8[frame]
+        if isinstance(symbol, str):
+            values = self._df[symbol].values[frame]
+            version = self.get_column_version(symbol)
+        else:
+            values = self._df[list(symbol)].values[frame]
+            version = tuple(self.get_column_version(x) for x in symbol)
 
-        # because DataFrame.expanding takes number of points and not window, we need to calculate them
-        min_periods = df.index.get_loc(df.index[0] + window, method='bfill')
+        key = (name, symbol) + tuple(sorted(params.items()))
+        cache = self._online_stats.get(key)
+        position = None if cache is None else cache.get_resume_position(time, version)
 
-        expanding = df.expanding(min_periods=min_periods)
-        mean = expanding.mean()
-        std = expanding.std()
+        if position is None:
+            cache = OnlineCache(create(time), version, time[0] if len(time) else None)
+            self._online_stats[key] = cache
+            position = 0
 
-        zscore = (df - mean) / std
+        if position < len(time):
+            cache.extend(time, update(cache.stats, time[position:], values[position:]))
 
-        return TimeSeries.from_df(zscore)
+        return cache, position
 
     def expect_one_symbol(self, symbol: Optional[Union[Symbol, str]] = None):
         """Raises Exception if no symbol is passed and timeseries has one or more symbol
@@ -790,6 +1285,7 @@ class TimeSeries:
         And it's quite unlikely to be in such situation when you are an algo trader
         """
         self.get_raw_df().loc['2020-04-19': '2020-04-19'] = np.nan
+        self._touch()
         self.dropna()
 
     def convert_to_levels(
@@ -799,22 +1295,41 @@ class TimeSeries:
             symbol: Optional[Union[Symbol, str]] = None, 
             framed: bool = True):
         """Returns time series converted to levels, starting from zero"""
+        from cns_analytics.utils import fast_math
+
+        symbol = self.expect_one_symbol(symbol)
+        core = self.get_core(framed)
+        positions, levels = fast_math.convert_to_levels(core.contiguous_column(symbol),
+                                                        float(level_size), pct)
+
+        new_df = pd.DataFrame(levels, index=core.get_index()[positions], columns=[symbol])
+        return TimeSeries.from_df(new_df, copy=False)
+
+    def convert_to_levels_batch(
+            self,
+            level_sizes: List[float],
+            pct: bool = False,
+            symbol: Optional[Union[Symbol, str]] = None,
+            framed: bool = True) -> Dict[float, 'TimeSeries']:
+        """Same as convert_to_levels for many level sizes in one call
+
+        :returns: Time series of levels for every level size
+        """
+        from cns_analytics.utils import fast_math
+
         symbol = self.expect_one_symbol(symbol)
-        df = self.get_df(framed=framed)[symbol]
-        shift = df.iloc[0]
-        df = df - shift
-        index = [df.index[0]]
-        result = [round(df.values[0] / level_size) * level_size]
-        for idx, px in df.to_frame().itertuples():
-            last_px = result[-1]
-            lvl = level_size if not pct else (last_px + shift) * level_size
-            while abs(px - last_px) >= lvl:
-                last_px += np.sign(px - last_px) * lvl
-                result.append(last_px)
-                index.append(idx)
-
-        new_df = pd.DataFrame(result, index=index, columns=[symbol])
-        return TimeSeries.from_df(new_df)
+        core = self.get_core(framed)
+        positions, levels, offsets = fast_math.convert_to_levels_batch(
+            core.contiguous_column(symbol), np.asarray(level_sizes, dtype=np.float64), pct)
+        index = core.get_index()
+
+        result = {}
+        for i, level_size in enumerate(level_sizes):
+            part = slice(offsets[i], offsets[i + 1])
+            new_df = pd.DataFrame(levels[part], index=index[positions[part]], columns=[symbol])
+            result[level_size] = TimeSeries.from_df(new_df, copy=False)
+
+        return result
 
     def first(self, symbol: Optional[Union[Symbol, str]] = None, framed: bool = True):
         """Returns first price for symbol"""
@@ -827,54 +1342,54 @@ class TimeSeries:
         return self.get_df(framed).iloc[-1][symbol]
 
     def diff(self, *args, **kwargs):
-        return TimeSeries.from_df(self.get_raw_df().diff(*args, **kwargs))
+        return TimeSeries.from_df(self.get_raw_df().diff(*args, **kwargs), copy=False)
 
     def pct_change(self, *args, **kwargs):
-        return TimeSeries.from_df(self.get_raw_df().pct_change(*args, **kwargs))
+        return TimeSeries.from_df(self.get_raw_df().pct_change(*args, **kwargs), copy=False)
 
     def cumsum(self, *args, **kwargs):
-        return TimeSeries.from_df(self.get_raw_df().cumsum(*args, **kwargs))
+        return TimeSeries.from_df(self.get_raw_df().cumsum(*args, **kwargs), copy=False)
 
     def cummax(self, *args, **kwargs):
-        return TimeSeries.from_df(self.get_raw_df().cummax(*args, **kwargs))
+        return TimeSeries.from_df(self.get_raw_df().cummax(*args, **kwargs), copy=False)
 
     def mean(self, *args, **kwargs):
         value = self.get_raw_df().mean(*args, **kwargs)
         if len(value) == 1:
             return float(value)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def max(self, *args, **kwargs):
         value = self.get_raw_df().max(*args, **kwargs)
         if len(value) == 1:
             return float(value)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def min(self, *args, **kwargs):
         value = self.get_raw_df().min(*args, **kwargs)
         if len(value) == 1:
             return float(value)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def sum(self, *args, **kwargs):
         value = self.get_raw_df().sum(*args, **kwargs)
         if len(value) == 1:
             return float(value)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def std(self, *args, **kwargs):
         value = self.get_raw_df().std(*args, **kwargs)
         if len(value) == 1:
             return float(value)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def abs(self, *args, **kwargs):
         value = self.get_raw_df().abs(*args, **kwargs)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def sign(self, *args, **kwargs):
         value = np.sign(self.get_raw_df(), *args, **kwargs)
-        return TimeSeries.from_df(value)
+        return TimeSeries.from_df(value, copy=False)
 
     def scale_to(self, base: float, symbol: Optional[Union[Symbol, str]] = None, framed: bool = True):
         """Scales prices to start from base"""
@@ -886,8 +1401,10 @@ class TimeSeries:
 
         if symbol:
             self._df[symbol] *= base / zero_px
+            self._touch(symbol)
         else:
             self._df *= base / zero_px
+            self._touch()
 
         return base / zero_px
 
@@ -895,14 +1412,17 @@ class TimeSeries:
         """Updates/sets underlying data key by value
 
         :param key: Key to update/set
-        :param value: New value
+        :param value: New value, lazy expression is evaluated over all data
         """
         if isinstance(value, TimeSeries):
             if len(value.get_symbols()) != 1:
                 raise Exception("Can't set more than one symbol!")
             self._df[key] = value._df[value.get_symbols()[0]]
+        elif isinstance(value, Expression):
+            self._df[key] = value.get_values().copy()
         else:
             self._df[key] = value
+        self._touch(key)
 
     def __getitem__(self, item) -> 'TimeSeries':
         """Returns new timeseries from underling's data item
@@ -972,11 +1492,13 @@ class TimeSeries:
         :param other: Multiplicand
         :returns: Self
         """
+        if isinstance(other, Expression):
+            return NotImplemented
         if isinstance(other, TimeSeries):
             _df = self._df * other.get_raw_df().values
         else:
             _df = self._df * other
-        return TimeSeries.from_df(_df)
+        return TimeSeries.from_df(_df, copy=False)
 
     def __add__(self, other):
         """Adds timeseries, float, numpy array or pandas series/frame to timeseries
@@ -984,11 +1506,13 @@ class TimeSeries:
         :param other: Addend
         :returns: Self
         """
+        if isinstance(other, Expression):
+            return NotImplemented
         if isinstance(other, TimeSeries):
             _df = self._df + other.get_raw_df().values
         else:
             _df = self._df + other
-        return TimeSeries.from_df(_df)
+        return TimeSeries.from_df(_df, copy=False)
 
     def __sub__(self, other):
         """Subtract timeseries, float, numpy array or pandas series/frame from timeseries
@@ -996,11 +1520,13 @@ class TimeSeries:
         :param other: Subtrahend
         :returns: Self
         """
+        if isinstance(other, Expression):
+            return NotImplemented
         if isinstance(other, TimeSeries):
             _df = self._df - other.get_raw_df().values
         else:
             _df = self._df - other
-        return TimeSeries.from_df(_df)
+        return TimeSeries.from_df(_df, copy=False)
 
     def __truediv__(self, other):
         """Divides timeseries by timeseries, float, numpy array or pandas series/frame
@@ -1008,11 +1534,13 @@ class TimeSeries:
         :param other: Divisor
         :returns: Self
         """
+        if isinstance(other, Expression):
+            return NotImplemented
         if isinstance(other, TimeSeries):
             _df = self._df / other.get_raw_df().values
         else:
             _df = self._df / other
-        return TimeSeries.from_df(_df)
+        return TimeSeries.from_df(_df, copy=False)
 
     def __neg__(self):
-        return TimeSeries.from_df(-self.get_raw_df())
+        return TimeSeries.from_df(-self.get_raw_df(), copy=False)
@@ -0,0 +1,232 @@
+"""Analytics over many aligned symbols at once
+
+| Symbols are loaded once into one TimeSeries, instead of TimeSeries per pair.
+| Matrix statistics are calculated from one product of centered values (BLAS),
+  rolling statistics and cointegration tests by compiled kernels in parallel.
+| SpreadUniverse scores spreads of all pairs at once, instead of Spread per pair.
+
+.. python::
+    universe = Universe('CL', 'BZ', 'HO', 'RB')
+    await universe.load('01.01.2020')
+    universe.get_correlation_matrix()
+    universe.get_cointegration().sort_values('p_value')
+
+    spreads = SpreadUniverse(*symbols)
+    await spreads.load('01.01.2020')
+    spreads.get_spread_statistics().sort_values('max_drop')
+"""
+import itertools
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from cns_analytics.entities import Duration, Symbol
+from cns_analytics.timeseries.timeseries import TimeSeries
+
+
+class Universe(TimeSeries):
+    """Many aligned symbols, adds matrix and pair statistics
+
+    | Pair (leg1, leg2) is regressed as leg1 = coef * leg2 + shift, so spread is leg1 - coef * leg2.
+    """
+
+    def _get_symbols(self, symbols) -> List[str]:
+        return [x.name if isinstance(x, Symbol) else x for x in symbols] or self.get_symbols()
+
+    def _get_pairs(self, symbols: List[str],
+                   pairs: Optional[List[Tuple[str, str]]]) -> List[Tuple[str, str]]:
+        if pairs is None:
+            return list(itertools.combinations(symbols, 2))
+        return [tuple(x.name if isinstance(x, Symbol) else x for x in pair) for pair in pairs]
+
+    def get_correlation_matrix(self, *symbols: Union[Symbol, str], framed: bool = True) -> pd.DataFrame:
+        """Returns correlation of every symbol with every other one
+
+        :param symbols: Symbols to use, all symbols by default
+        :param framed: Whether to use only data inside frame
+        :returns: Symbol by symbol DataFrame
+        """
+        from cns_analytics.utils import fast_stats
+
+        symbols = self._get_symbols(symbols)
+        matrix = fast_stats.correlation_matrix(self.get_core(framed).select(symbols))
+
+        return pd.DataFrame(matrix, index=symbols, columns=symbols)
+
+    def get_rolling_correlation(self, window: Optional[Union[Duration, int]],
+                                pairs: Optional[List[Tuple[str, str]]] = None,
+                                min_periods: int = 2,
+                                framed: bool = True) -> pd.DataFrame:
+        """Returns correlation of every pair over window ending at every point
+
+        :param window: Number of points or duration of window, None for expanding window
+        :param pairs: Pairs of symbols, all pairs by default
+        :param min_periods: Minimum number of points in window, NaN is returned for smaller windows
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with column per pair
+        """
+        from cns_analytics.utils import fast_stats, fast_walk_forward
+
+        core = self.get_core(framed)
+        pairs = self._get_pairs(self.get_symbols(), pairs)
+        positions = np.array([[core.columns[a], core.columns[b]] for a, b in pairs],
+                             dtype=np.int64).reshape(-1, 2)
+
+        result = fast_stats.rolling_correlation_pairs(
+            core.values, positions, fast_walk_forward.get_window_starts(core.index, window),
+            min_periods)
+
+        df = core.to_df(result)
+        df.columns = pd.MultiIndex.from_tuples(pairs)
+        return df
+
+    def get_hedge_ratios(self, pairs: Optional[List[Tuple[str, str]]] = None,
+                         framed: bool = True) -> pd.DataFrame:
+        """Returns OLS hedge ratio of every pair
+
+        :param pairs: Pairs of symbols, all pairs by default
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with leg1, leg2, shift and coef columns
+        """
+        from cns_analytics.utils import fast_stats
+
+        core = self.get_core(framed)
+        pairs = self._get_pairs(self.get_symbols(), pairs)
+        positions = np.array([[core.columns[b], core.columns[a]] for a, b in pairs],
+                             dtype=np.int64).reshape(-1, 2)
+
+        shift, coef = fast_stats.ols_pairs(core.values, positions)
+
+        return pd.DataFrame({
+            'leg1': [a for a, _ in pairs],
+            'leg2': [b for _, b in pairs],
+            'shift': shift,
+            'coef': coef,
+        })
+
+    def get_cointegration(self, pairs: Optional[List[Tuple[str, str]]] = None,
+                          max_lag: int = 1,
+                          framed: bool = True) -> pd.DataFrame:
+        """Runs Engle-Granger test for every pair
+
+        | Hedge ratios of all pairs are calculated at once,
+          then residuals of all pairs are tested by ADF with fixed lag in parallel.
+
+        :param pairs: Pairs of symbols, all pairs by default
+        :param max_lag: Lag of ADF test
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with leg1, leg2, shift, coef, adf and p_value columns
+        """
+        from cns_analytics.utils import fast_adf
+
+        core = self.get_core(framed)
+        result = self.get_hedge_ratios(pairs, framed=framed)
+        positions = np.array([[core.columns[b], core.columns[a]]
+                              for a, b in zip(result.leg1, result.leg2)],
+                             dtype=np.int64).reshape(-1, 2)
+
+        result['adf'], result['p_value'] = fast_adf.engle_granger_pairs(
+            core.values, positions, result['shift'].values, result['coef'].values, max_lag)
+        return result
+
+
+class SpreadUniverse(Universe):
+    """Spreads of many pairs of aligned symbols
+
+    | Spread of pair (leg1, leg2) is leg1 - coef * leg2 - shift with OLS hedge ratio,
+      so it's centered around zero.
+    | Spreads are built in blocks or inside compiled kernels, pairs x time array is never stored.
+    """
+
+    def _get_ratios(self, pairs: Optional[List[Tuple[str, str]]],
+                    hedge_ratios: Optional[pd.DataFrame], framed: bool) -> pd.DataFrame:
+        if hedge_ratios is None:
+            return self.get_hedge_ratios(pairs, framed=framed)
+        return hedge_ratios
+
+    def _get_leg_positions(self, ratios: pd.DataFrame) -> np.ndarray:
+        columns = self.get_core().columns
+        return np.array([[columns[a], columns[b]] for a, b in zip(ratios.leg1, ratios.leg2)],
+                        dtype=np.int64).reshape(-1, 2)
+
+    def iter_spreads(self, pairs: Optional[List[Tuple[str, str]]] = None,
+                     hedge_ratios: Optional[pd.DataFrame] = None,
+                     block_size: int = 256,
+                     framed: bool = True) -> Iterator[Tuple[pd.DataFrame, np.ndarray]]:
+        """Generates spreads block by block
+
+        :param pairs: Pairs of symbols, all pairs by default
+        :param hedge_ratios: Result of get_hedge_ratios to use, calculated over same data by default
+            (pass ratios calculated inside frame to get out of sample spreads)
+        :param block_size: Number of spreads in block
+        :param framed: Whether to use only data inside frame
+        :returns: Hedge ratios of pairs in block and 2D array of their spreads, row per pair
+        """
+        ratios = self._get_ratios(pairs, hedge_ratios, framed)
+        positions = self._get_leg_positions(ratios)
+        # row per symbol, so legs are contiguous
+        values_t = np.ascontiguousarray(self.get_core(framed).values.T)
+
+        for start in range(0, len(ratios), block_size):
+            block = slice(start, start + block_size)
+            shift = ratios['shift'].values[block, None]
+            coef = ratios['coef'].values[block, None]
+            spreads = values_t[positions[block, 1]]
+            spreads *= -coef
+            spreads += values_t[positions[block, 0]]
+            spreads -= shift
+            yield ratios.iloc[block], spreads
+
+    def get_spreads(self, pairs: Optional[List[Tuple[str, str]]] = None,
+                    hedge_ratios: Optional[pd.DataFrame] = None,
+                    framed: bool = True) -> pd.DataFrame:
+        """Returns spreads of pairs as DataFrame, use for small number of pairs
+
+        :param pairs: Pairs of symbols, all pairs by default
+        :param hedge_ratios: Result of get_hedge_ratios to use, calculated over same data by default
+        :param framed: Whether to use only data inside frame
+        :returns: DataFrame with column per pair
+        """
+        ratios = self._get_ratios(pairs, hedge_ratios, framed)
+        spreads = np.concatenate([block for _, block in self.iter_spreads(hedge_ratios=ratios,
+                                                                          framed=framed)])
+
+        df = self.get_core(framed).to_df(spreads.T)
+        df.columns = pd.MultiIndex.from_arrays([ratios.leg1, ratios.leg2])
+        return df
+
+    def get_spread_statistics(self, pairs: Optional[List[Tuple[str, str]]] = None,
+                              hedge_ratios: Optional[pd.DataFrame] = None,
+                              percentile: float = 0.025,
+                              value: float = 0,
+                              framed: bool = True) -> pd.DataFrame:
+        """Scores spread of every pair
+
+        | Same statistics as Spread.get_magnitude, get_drop(DropLogic.SIMPLE).max(),
+          len(get_crosses(value)) and get_hurst_exponent, pairs are processed in parallel.
+
+        :param pairs: Pairs of symbols, all pairs by default
+        :param hedge_ratios: Result of get_hedge_ratios to use, calculated over same data by default
+            (pass ratios calculated inside frame to score spreads out of sample)
+        :param percentile: Percentile of magnitude, magnitude is high percentile - low percentile
+        :param value: Crossing line
+        :param framed: Whether to use only data inside frame
+        :returns: Hedge ratios with magnitude, max_drop, crosses and hurst columns
+        """
+        from cns_analytics.utils import fast_stats
+        from cns_analytics.utils.fast_walk_forward import HURST_LAGS
+
+        ratios = self._get_ratios(pairs, hedge_ratios, framed).copy()
+        values_t = np.ascontiguousarray(self.get_core(framed).values.T)
+
+        result = fast_stats.spread_statistics(
+            values_t, self._get_leg_positions(ratios),
+            ratios['shift'].values.astype(np.float64), ratios['coef'].values.astype(np.float64),
+            HURST_LAGS, percentile * 100, 100 - percentile * 100, value)
+
+        ratios['magnitude'] = result[:, 0]
+        ratios['max_drop'] = result[:, 1]
+        ratios['crosses'] = result[:, 2]
+        ratios['hurst'] = result[:, 3]
+        return ratios
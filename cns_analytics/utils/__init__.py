@@ -1,7 +1,7 @@
 import contextlib
 import copy
 import itertools
-from typing import Optional, List
+from typing import Optional, List, Union
 
 import math
 import random
@@ -11,34 +11,29 @@ from collections import defaultdict
 import numpy as np
 import pandas as pd
 
-from cns_analytics.entities import DropLogic, Duration, Exchange, Symbol, MDType, Resolution
+from cns_analytics.entities import DropLogic, Duration, DateTime, Exchange, Symbol, MDType, Resolution
 
 
 def get_ols_regression(x, y):
-    """Returns shift, multiplier"""
+    """Returns shift, multiplier of y = multiplier * x + shift
+
+    | y can be 2D (column per series), then arrays of shifts and multipliers are returned.
+    """
+    from cns_analytics.utils import fast_stats
+
     if isinstance(y, (pd.Series, pd.DataFrame)):
         y = y.values
 
     if isinstance(x, (pd.Series, pd.DataFrame)):
         x = x.values
 
-    # if len(y.shape) == 1:
-    #     y = y.reshape(-1, 1)
-
-    # ones = np.ones(shape=y.shape[0]).reshape(-1, 1)
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
 
-    # y = np.concatenate((ones, y), 1)
+    if y.ndim == 2:
+        return fast_stats.ols_batch(x, y)
 
-    # try:
-    # coefs = np.linalg.inv(y.transpose().dot(y)).dot(y.transpose()).dot(x)
-    # except np.linalg.linalg.LinAlgError:
-    #     raise
-
-    A = np.vstack([x, np.ones(len(x))]).T
-
-    coef, shift = np.linalg.lstsq(A, y, rcond=None)[0]
-
-    return shift, coef
+    return fast_stats.ols(x, np.ascontiguousarray(y))
 
 
 def get_mean_regression(x, y):
@@ -150,6 +145,8 @@ def get_drop(data: pd.Series, logic: DropLogic,
              growth_during: Optional[Duration] = None,
              std_period: Duration = '30d',
              std_limit: Optional[float] = None) -> pd.Series:
+    from cns_analytics.utils import fast_align
+
     if logic is DropLogic.SIMPLE:
         return data.cummax() - data
     elif logic is DropLogic.SKIP_AFTER_UPDATE:
@@ -175,9 +172,7 @@ def get_drop(data: pd.Series, logic: DropLogic,
             data['look_back'] = data
 
         data_freq = data.index.to_series().diff().mode().iloc[0]
-        new_index = pd.date_range(data.index[0], data.index[-1],
-                                  freq=data_freq)
-        data = data.reindex(new_index, fill_value=np.nan).ffill()
+        data = fast_align.to_grid(data, data_freq, tolerance=0).ffill()
 
         std_period = pd.Timedelta(std_period)
         data['std'] = data.px.rolling(std_period, min_periods=int(std_period / data_freq)).std()
@@ -215,14 +210,39 @@ def get_drop(data: pd.Series, logic: DropLogic,
         raise NotImplementedError()
 
 
+def resample_ohlc(data: pd.DataFrame, duration: Duration,
+                  origin: Union[str, DateTime] = 'start_day',
+                  offset: Optional[Duration] = None,
+                  session_start: Optional[str] = None) -> pd.DataFrame:
+    """Aggregates OHLC bars into bigger bars
+
+    | Bars are labeled by start of the bucket, empty buckets are dropped.
+    | Volumes and number of ticks (volume/dollar_volume/buy_volume/ticks) are summed,
+      columns other than them and px_open/px_high/px_low take last value of the bucket.
+
+    :param data: OHLC bars
+    :param duration: Size of new bars
+    :param origin: Same as in pandas: epoch/start/start_day or timestamp to align bars to
+    :param offset: Shift of origin
+    :param session_start: Local time of session open (like "09:30"), aligns bars to it every day
+    :returns: Resampled bars
+    """
+    from cns_analytics.utils import fast_resample
+
+    how = [fast_resample.OHLC_AGGREGATION.get(column, fast_resample.LAST)
+           for column in data.columns]
+
+    return fast_resample.resample(data, duration, how, origin=origin, offset=offset,
+                                  session_start=session_start)
+
+
 def get_hurst_exponent(data):
     """ Returns Hurst Exponent
         | 0-0.5 Mean Reverting
         | 0.5 Random Work
         | 0.5-1 Trending
     """
-    lags = range(2, 20)
-    tau = [np.sqrt(np.std(np.subtract(data[lag:], data[:-lag]))) for lag in lags]
-    poly = np.polyfit(np.log(lags), np.log(tau), 1)
-    return poly[0] * 2.0
+    from cns_analytics.utils import fast_stats
+
+    return fast_stats.hurst(np.ascontiguousarray(data, dtype=np.float64), fast_stats.HURST_LAGS)
 
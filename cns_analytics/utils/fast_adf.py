@@ -0,0 +1,207 @@
+"""Compiled Augmented Dickey-Fuller test with fixed lag
+
+| Same regression as statsmodels adfuller(x, maxlag=lag, autolag=None):
+  diff(x) on lagged level, lagged differences and optional constant.
+  Normal equations are accumulated in one pass over data and solved directly.
+| p-value is MacKinnon (1994) approximation, same tables as statsmodels.tsa.adfvalues.
+| Many series (or pair residuals for Engle-Granger test) are tested in parallel.
+| NaN values are dropped before test.
+"""
+import math
+from typing import Tuple
+
+import numba
+import numpy as np
+
+# regression without constant and with constant
+NO_CONSTANT = 0
+CONSTANT = 1
+
+REGRESSIONS = {'n': NO_CONSTANT, 'c': CONSTANT}
+
+# MacKinnon (1994) tables, [regression, N - 1], N is number of I(1) series
+_TAU_MAX = np.array([
+    [np.inf, 1.51, 0.86, 0.88, 1.05, 1.24],
+    [2.74, 0.92, 0.55, 0.61, 0.79, 1],
+])
+_TAU_MIN = np.array([
+    [-19.04, -19.62, -21.21, -23.25, -21.63, -25.74],
+    [-18.83, -18.86, -23.48, -28.07, -25.96, -23.27],
+])
+_TAU_STAR = np.array([
+    [-1.04, -1.53, -2.68, -3.09, -3.07, -3.77],
+    [-1.61, -2.62, -3.13, -3.47, -3.78, -3.93],
+])
+_TAU_SMALL_P = np.array([
+    [[0.6344, 1.2378, 3.2496],
+     [1.9129, 1.3857, 3.5322],
+     [2.7648, 1.4502, 3.4186],
+     [3.4336, 1.4835, 3.19],
+     [4.0999, 1.5533, 3.59],
+     [4.5388, 1.5344, 2.9807]],
+    [[2.1659, 1.4412, 3.8269],
+     [2.92, 1.5012, 3.9796],
+     [3.4699, 1.4856, 3.164],
+     [3.9673, 1.4777, 2.6315],
+     [4.5509, 1.5338, 2.9545],
+     [5.1399, 1.6036, 3.4445]],
+]) * np.array([1, 1, 1e-2])
+_TAU_LARGE_P = np.array([
+    [[0.4797, 9.3557, -0.6999, 3.3066],
+     [1.5578, 8.558, -2.083, -3.3549],
+     [2.2268, 6.8093, -3.2362, -5.4448],
+     [2.7654, 6.4502, -3.0811, -4.4946],
+     [3.2684, 6.8051, -2.6778, -3.4972],
+     [3.7268, 7.167, -2.3648, -2.8288]],
+    [[1.7339, 9.3202, -1.2745, -1.0368],
+     [2.1945, 6.4695, -2.9198, -4.2377],
+     [2.5893, 4.5168, -3.6529, -5.0074],
+     [3.0387, 4.5452, -3.3666, -4.1921],
+     [3.5049, 5.2098, -2.9158, -3.3468],
+     [3.9489, 5.8933, -2.5359, -2.721]],
+]) * np.array([1, 1e-1, 1e-1, 1e-2])
+
+
+@numba.njit(nogil=True)
+def mackinnon_p(stat, regression, n):
+    """Returns approximate p-value of ADF statistic
+
+    :param stat: ADF statistic
+    :param regression: NO_CONSTANT or CONSTANT
+    :param n: Number of I(1) series, 1 for ADF, 2 for Engle-Granger test of pair
+    """
+    if np.isnan(stat):
+        return np.nan
+    if stat > _TAU_MAX[regression, n - 1]:
+        return 1.0
+    if stat < _TAU_MIN[regression, n - 1]:
+        return 0.0
+
+    if stat <= _TAU_STAR[regression, n - 1]:
+        coefs = _TAU_SMALL_P[regression, n - 1]
+    else:
+        coefs = _TAU_LARGE_P[regression, n - 1]
+
+    value = 0.0
+    for k in range(coefs.shape[0] - 1, -1, -1):
+        value = value * stat + coefs[k]
+
+    return 0.5 * math.erfc(-value / math.sqrt(2.0))
+
+
+@numba.njit(nogil=True)
+def adf(x, lag, regression):
+    """Returns ADF statistic of series without NaN values
+
+    :param x: Values
+    :param lag: Number of lagged differences
+    :param regression: NO_CONSTANT or CONSTANT
+    """
+    m = x.shape[0]
+    nobs = m - 1 - lag
+    k = 1 + lag + regression
+    if nobs <= k:
+        return np.nan
+
+    # constant absorbs shift of level, it keeps sums precise
+    base = x[0] if regression == CONSTANT else 0.0
+
+    xtx = np.zeros((k, k))
+    xty = np.zeros(k)
+    yy = 0.0
+    row = np.empty(k)
+
+    for t in range(lag, m - 1):
+        y = x[t + 1] - x[t]
+        row[0] = x[t] - base
+        for j in range(1, lag + 1):
+            row[j] = x[t + 1 - j] - x[t - j]
+        if regression == CONSTANT:
+            row[k - 1] = 1.0
+
+        for a in range(k):
+            xty[a] += row[a] * y
+            for b in range(a, k):
+                xtx[a, b] += row[a] * row[b]
+        yy += y * y
+
+    for a in range(k):
+        for b in range(a):
+            xtx[a, b] = xtx[b, a]
+
+    inverse = np.linalg.pinv(xtx)
+    beta = inverse @ xty
+    rss = yy - beta @ xty
+    sigma2 = rss / (nobs - k)
+    if sigma2 <= 0 or inverse[0, 0] <= 0:
+        return np.nan
+
+    return beta[0] / math.sqrt(sigma2 * inverse[0, 0])
+
+
+@numba.njit(nogil=True)
+def _drop_nan(x):
+    return x[~np.isnan(x)]
+
+
+@numba.njit(nogil=True, parallel=True)
+def adf_batch(values, lag, regression, n):
+    """Tests every column in parallel
+
+    :param values: 2D array, column per series
+    :param lag: Number of lagged differences
+    :param regression: NO_CONSTANT or CONSTANT
+    :param n: Number of I(1) series, for p-value
+    :returns: ADF statistic and p-value of every column
+    """
+    stat = np.full(values.shape[1], np.nan)
+    p_value = np.full(values.shape[1], np.nan)
+    for c in numba.prange(values.shape[1]):
+        stat[c] = adf(_drop_nan(np.ascontiguousarray(values[:, c])), lag, regression)
+        p_value[c] = mackinnon_p(stat[c], regression, n)
+    return stat, p_value
+
+
+@numba.njit(nogil=True, parallel=True)
+def engle_granger_pairs(values, pairs, shift, coef, lag):
+    """Tests residuals of every pair in parallel, same as statsmodels coint(autolag=None)
+
+    :param values: 2D array, column per series
+    :param pairs: 2D int array, row of (base column, dependent column) per pair
+    :param shift: Shift of every pair, dependent = coef * base + shift
+    :param coef: Coef of every pair
+    :param lag: Number of lagged differences
+    :returns: ADF statistic and p-value of every pair
+    """
+    stat = np.full(pairs.shape[0], np.nan)
+    p_value = np.full(pairs.shape[0], np.nan)
+    for k in numba.prange(pairs.shape[0]):
+        if np.isnan(coef[k]):
+            continue
+        residuals = values[:, pairs[k, 1]] - coef[k] * values[:, pairs[k, 0]] - shift[k]
+        stat[k] = adf(_drop_nan(residuals), lag, NO_CONSTANT)
+        p_value[k] = mackinnon_p(stat[k], CONSTANT, 2)
+    return stat, p_value
+
+
+def adf_test(x: np.ndarray, lag: int = 1, regression: str = 'c') -> Tuple[float, float]:
+    """Returns ADF statistic and p-value of one series
+
+    :param x: Values
+    :param lag: Number of lagged differences
+    :param regression: 'c' for constant, 'n' for no constant
+    """
+    stat, p_value = adf_tests(np.asarray(x, dtype=np.float64).reshape(-1, 1), lag, regression)
+    return stat[0], p_value[0]
+
+
+def adf_tests(values: np.ndarray, lag: int = 1, regression: str = 'c') -> Tuple[np.ndarray, np.ndarray]:
+    """Returns ADF statistic and p-value of every column
+
+    :param values: 2D array, column per series
+    :param lag: Number of lagged differences
+    :param regression: 'c' for constant, 'n' for no constant
+    """
+    if regression not in REGRESSIONS:
+        raise Exception(f"Regression {regression} is not supported")
+    return adf_batch(np.asarray(values, dtype=np.float64), lag, REGRESSIONS[regression], 1)
@@ -0,0 +1,202 @@
+"""Alignment of many symbols over sorted int64 indexes
+
+| Indexes are merged in one pass (k-way merge), then every symbol gets position
+  of its last point not after every aligned timestamp.
+| Aligned data is gathered by these positions directly,
+  so no reindexed intermediate frames are built.
+| Timestamps, where any symbol has no point (or its last point is older than tolerance),
+  are dropped.
+| Timestamps inside every index must be unique, align_frames keeps frames with duplicate
+  timestamps only when there is nothing to align (see it).
+"""
+from typing import List, Optional, Tuple, Union
+
+import numba
+import numpy as np
+import pandas as pd
+
+from cns_analytics.entities import Alignment, Duration
+
+_NO_TOLERANCE = np.iinfo(np.int64).max
+
+
+@numba.njit(nogil=True)
+def union(flat, offsets):
+    """Returns sorted unique timestamps of all indexes
+
+    :param flat: Sorted indexes concatenated
+    :param offsets: Start of every index in flat followed by its length
+    """
+    k = offsets.shape[0] - 1
+    heads = offsets[:-1].copy()
+    result = np.empty(flat.shape[0], dtype=np.int64)
+    count = 0
+
+    while True:
+        current = _NO_TOLERANCE
+        done = True
+        for j in range(k):
+            if heads[j] < offsets[j + 1]:
+                done = False
+                if flat[heads[j]] < current:
+                    current = flat[heads[j]]
+        if done:
+            break
+
+        result[count] = current
+        count += 1
+        for j in range(k):
+            while heads[j] < offsets[j + 1] and flat[heads[j]] == current:
+                heads[j] += 1
+
+    return result[:count]
+
+
+@numba.njit(nogil=True)
+def positions(flat, offsets, index, tolerance):
+    """Returns position of last point not after every timestamp of index for every symbol
+
+    :param flat: Sorted indexes concatenated
+    :param offsets: Start of every index in flat followed by its length
+    :param index: Sorted aligned timestamps
+    :param tolerance: Max age of point in ns
+    :returns: 2D array, column per symbol, -1 where there is no point
+    """
+    k = offsets.shape[0] - 1
+    result = np.full((index.shape[0], k), -1, dtype=np.int64)
+
+    for j in range(k):
+        start = offsets[j]
+        end = offsets[j + 1]
+        p = start
+        for i in range(index.shape[0]):
+            while p < end and flat[p] <= index[i]:
+                p += 1
+            if p > start and index[i] - flat[p - 1] <= tolerance:
+                result[i, j] = p - 1 - start
+
+    return result
+
+
+def align(indexes: List[np.ndarray], alignment: Alignment = Alignment.INNER,
+          tolerance: Optional[Duration] = None,
+          freq: Optional[Duration] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Aligns sorted epoch-ns indexes
+
+    :param indexes: Index of every symbol, without duplicate timestamps
+    :param alignment: How to align
+    :param tolerance: Max age of point taken from previous timestamp, unlimited by default
+    :param freq: Step of grid, most common interval of first index by default
+    :returns: Aligned index and position of point of every symbol (column per symbol)
+    """
+    indexes = [np.ascontiguousarray(x, dtype=np.int64) for x in indexes]
+    flat = np.concatenate(indexes)
+    offsets = np.concatenate(([0], np.cumsum([len(x) for x in indexes]))).astype(np.int64)
+    tolerance = _NO_TOLERANCE if tolerance is None else pd.Timedelta(tolerance).value
+
+    if alignment is Alignment.INNER:
+        index = union(flat, offsets)
+        tolerance = 0
+    elif alignment is Alignment.OUTER_FFILL:
+        index = union(flat, offsets)
+    elif alignment is Alignment.ASOF:
+        index = indexes[0]
+    elif alignment is Alignment.GRID:
+        index = get_grid(union(flat, offsets), freq, reference=indexes[0])
+    else:
+        raise NotImplementedError(f"{alignment} is not supported")
+
+    result = positions(flat, offsets, index, tolerance)
+    valid = (result >= 0).all(axis=1)
+    if not valid.all():
+        index, result = index[valid], result[valid]
+
+    return index, result
+
+
+def get_grid(index: np.ndarray, freq: Optional[Duration] = None,
+             reference: Optional[np.ndarray] = None) -> np.ndarray:
+    """Returns regular timestamps from first to last timestamp of index
+
+    :param index: Sorted epoch-ns index
+    :param freq: Step of grid, most common interval of reference index by default
+    :param reference: Index to take most common interval from, index by default
+    """
+    if not len(index):
+        return index
+    if freq is None:
+        intervals, counts = np.unique(np.diff(index if reference is None else reference),
+                                      return_counts=True)
+        step = intervals[counts.argmax()] if len(intervals) else 1
+    else:
+        step = pd.Timedelta(freq).value
+    # count in integers, np.arange loses precision on epoch-ns values
+    count = (index[-1] - index[0]) // step + 1
+    return index[0] + step * np.arange(count, dtype=np.int64)
+
+
+def to_grid(data: Union[pd.Series, pd.DataFrame], freq: Optional[Duration] = None,
+            tolerance: Optional[Duration] = None):
+    """Moves data to regular grid from first to last timestamp
+
+    | Same as data.reindex(grid, method='ffill'), with zero tolerance same as data.reindex(grid).
+
+    :param data: Data with sorted DatetimeIndex
+    :param freq: Step of grid, most common interval by default
+    :param tolerance: Max age of point taken from previous timestamp, unlimited by default
+    """
+    index = data.index.asi8
+    grid = get_grid(index, freq)
+    tolerance = _NO_TOLERANCE if tolerance is None else pd.Timedelta(tolerance).value
+    position = positions(index, np.array([0, len(index)], dtype=np.int64), grid, tolerance)[:, 0]
+
+    missing = position < 0
+    result = data.take(np.maximum(position, 0))
+    result.index = _to_datetime_index(grid, data.index)
+    if missing.any():
+        result = result.astype(np.float64)
+        result.iloc[missing] = np.nan
+    return result
+
+
+def _to_datetime_index(index: np.ndarray, like: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    result = pd.DatetimeIndex(index.view('datetime64[ns]'), name=like.name)
+    if like.tz is not None:
+        result = result.tz_localize('UTC').tz_convert(like.tz)
+    return result
+
+
+def align_frames(dfs: List[Union[pd.Series, pd.DataFrame]], alignment: Alignment = Alignment.INNER,
+                 tolerance: Optional[Duration] = None,
+                 freq: Optional[Duration] = None) -> pd.DataFrame:
+    """Aligns data of many symbols into one DataFrame, columns of all symbols are kept
+
+    | Same as pd.concat(dfs, axis=1, join="inner") for INNER alignment.
+    | Duplicate timestamps (e.g. ticks) are kept as is, if there is only one frame
+      or all frames have same index (then rows are matched by position, like concat does),
+      otherwise Exception is raised, like concat does.
+
+    :param dfs: Data of every symbol, sorted by DatetimeIndex
+    :param alignment: How to align
+    :param tolerance: Max age of point taken from previous timestamp, unlimited by default
+    :param freq: Step of GRID alignment, most common interval of first symbol by default
+    """
+    dfs = [df.to_frame() if isinstance(df, pd.Series) else df for df in dfs]
+    if len(dfs) == 1 and alignment is not Alignment.GRID:
+        return dfs[0]
+
+    if any((np.diff(df.index.asi8) <= 0).any() for df in dfs):
+        if alignment is not Alignment.GRID and all(df.index.equals(dfs[0].index) for df in dfs):
+            return pd.concat(dfs, axis=1)
+        raise Exception("Can't align data with duplicate timestamps")
+
+    index, position = align([df.index.asi8 for df in dfs], alignment, tolerance, freq)
+    index = _to_datetime_index(index, dfs[0].index)
+
+    parts = []
+    for j, df in enumerate(dfs):
+        part = df.take(position[:, j])
+        part.index = index
+        parts.append(part)
+
+    return pd.concat(parts, axis=1)
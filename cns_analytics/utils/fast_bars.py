@@ -0,0 +1,245 @@
+"""Streaming aggregation of ticks into bars
+
+| Ticks are processed in one compiled pass per chunk,
+  unfinished bar is kept in a small state between chunks,
+  so history of any length is aggregated in bounded memory.
+| Bars are labeled by close time: end of interval for time bars, last tick for others.
+"""
+from typing import Iterable, Union
+
+import numba
+import numpy as np
+import pandas as pd
+
+from cns_analytics.entities import BarType, Duration
+
+BAR_COLUMNS = ['px_open', 'px_high', 'px_low', 'px_close',
+               'volume', 'dollar_volume', 'buy_volume', 'ticks']
+
+_KIND = {
+    BarType.TIME: 0,
+    BarType.VOLUME: 1,
+    BarType.DOLLAR: 2,
+    BarType.TICK: 3,
+    BarType.TICK_IMBALANCE: 4,
+    BarType.VOLUME_IMBALANCE: 5,
+}
+
+# layout of float state
+_OPEN, _HIGH, _LOW, _CLOSE, _VOLUME, _DOLLAR, _BUY_VOLUME, _TICKS = range(8)
+_THETA, _EXP_TICKS, _EXP_IMBALANCE, _LAST_PX, _LAST_SIGN = range(8, 13)
+# layout of int state
+_BAR_END, _LAST_TIME = range(2)
+
+
+@numba.njit(nogil=True)
+def _emit(fstate, label, out_ts, out, count):
+    out_ts[count] = label
+    for col in range(_TICKS + 1):
+        out[count, col] = fstate[col]
+    fstate[_TICKS] = 0
+    fstate[_VOLUME] = 0
+    fstate[_DOLLAR] = 0
+    fstate[_BUY_VOLUME] = 0
+    fstate[_THETA] = 0
+    return count + 1
+
+
+@numba.njit(nogil=True)
+def build_bars(ts, px, qty, sign, kind, size, alpha, fstate, istate):
+    """Aggregates chunk of ticks into bars, continuing from state
+
+    :param ts: Epoch-ns time of ticks
+    :param px: Prices
+    :param qty: Quantities
+    :param sign: Aggressor side, 1 for buy, -1 for sell, 0 if unknown (tick rule is used)
+    :param kind: Code of bar type
+    :param size: Interval in ns for time bars, volume/money/ticks per bar for others,
+        initial expected ticks per bar for imbalance bars
+    :param alpha: Weight of last bar in expectations of imbalance bars
+    :param fstate: Float state, changed inplace
+    :param istate: Int state, changed inplace
+    :returns: Close times of completed bars and their values in BAR_COLUMNS order
+    """
+    n = ts.shape[0]
+    out_ts = np.empty(n, dtype=np.int64)
+    out = np.empty((n, _TICKS + 1), dtype=np.float64)
+    count = 0
+    step = np.int64(size)
+
+    for i in range(n):
+        if kind == 0 and fstate[_TICKS] > 0 and ts[i] >= istate[_BAR_END]:
+            count = _emit(fstate, istate[_BAR_END], out_ts, out, count)
+
+        price = px[i]
+        volume = qty[i]
+
+        if fstate[_TICKS] == 0:
+            fstate[_OPEN] = price
+            fstate[_HIGH] = price
+            fstate[_LOW] = price
+            if kind == 0:
+                istate[_BAR_END] = (ts[i] // step) * step + step
+
+        fstate[_HIGH] = max(fstate[_HIGH], price)
+        fstate[_LOW] = min(fstate[_LOW], price)
+        fstate[_CLOSE] = price
+        fstate[_VOLUME] += volume
+        fstate[_DOLLAR] += price * volume
+        fstate[_TICKS] += 1
+        istate[_LAST_TIME] = ts[i]
+
+        side = sign[i]
+        if side == 0:
+            if price > fstate[_LAST_PX]:
+                side = 1
+            elif price < fstate[_LAST_PX]:
+                side = -1
+            else:
+                side = fstate[_LAST_SIGN]
+        fstate[_LAST_PX] = price
+        fstate[_LAST_SIGN] = side
+
+        if side > 0:
+            fstate[_BUY_VOLUME] += volume
+        fstate[_THETA] += side if kind == 4 else side * volume
+
+        if kind == 0:
+            continue
+        elif kind == 1:
+            closed = fstate[_VOLUME] >= size
+        elif kind == 2:
+            closed = fstate[_DOLLAR] >= size
+        elif kind == 3:
+            closed = fstate[_TICKS] >= size
+        elif np.isnan(fstate[_EXP_IMBALANCE]):
+            closed = fstate[_TICKS] >= fstate[_EXP_TICKS]
+        else:
+            closed = abs(fstate[_THETA]) >= fstate[_EXP_TICKS] * abs(fstate[_EXP_IMBALANCE])
+
+        if closed:
+            if kind >= 4:
+                imbalance = fstate[_THETA] / fstate[_TICKS]
+                # on balanced flow expectations shrink until every tick is a bar,
+                # so expected bar length is kept within 10x of initial one
+                fstate[_EXP_TICKS] = min(max(
+                    alpha * fstate[_TICKS] + (1 - alpha) * fstate[_EXP_TICKS],
+                    size / 10), size * 10)
+                if np.isnan(fstate[_EXP_IMBALANCE]):
+                    fstate[_EXP_IMBALANCE] = imbalance
+                else:
+                    fstate[_EXP_IMBALANCE] = (alpha * imbalance
+                                              + (1 - alpha) * fstate[_EXP_IMBALANCE])
+            count = _emit(fstate, ts[i], out_ts, out, count)
+
+    return out_ts[:count], out[:count]
+
+
+def get_tick_arrays(ticks: pd.DataFrame):
+    """Returns time, price, quantity and aggressor side arrays of ticks
+
+    | Understands both tick schema (px, qty, side/maker_side)
+      and ticks stored as OHLC rows (px_close, volume).
+    | Side can be numeric sign or text starting with B/S.
+    """
+    ts = ticks.index.asi8
+    px = ticks['px' if 'px' in ticks.columns else 'px_close'].values.astype(np.float64)
+
+    if 'qty' in ticks.columns:
+        qty = ticks['qty'].values.astype(np.float64)
+    elif 'volume' in ticks.columns:
+        qty = ticks['volume'].values.astype(np.float64)
+    else:
+        qty = np.ones(len(ticks))
+
+    sign = np.zeros(len(ticks))
+    for column, direction in (('side', 1), ('maker_side', -1)):
+        if column not in ticks.columns:
+            continue
+        side = ticks[column]
+        if pd.api.types.is_numeric_dtype(side):
+            sign = np.sign(side.values.astype(np.float64))
+        else:
+            first = side.astype(str).str[:1].str.upper()
+            sign = np.select([first == 'B', first == 'S'], [1.0, -1.0], 0.0)
+        sign = np.nan_to_num(sign) * direction
+        break
+
+    return ts, px, qty, sign
+
+
+class BarBuilder:
+    """Aggregates ticks into bars chunk by chunk
+
+    .. python::
+        builder = BarBuilder(BarType.VOLUME, 1000)
+        for chunk in chunks:
+            bars = builder.update(chunk)
+        last_bar = builder.flush()
+    """
+
+    def __init__(self, bar_type: BarType, size: Union[float, Duration], alpha: float = 0.1):
+        """
+        :param bar_type: How to group ticks
+        :param size: Interval for time bars, volume/money/ticks per bar for others,
+            initial expected ticks per bar for imbalance bars
+        :param alpha: Weight of last bar in expectations of imbalance bars
+        """
+        self.bar_type = bar_type
+        self._kind = _KIND[bar_type]
+        self._size = float(pd.Timedelta(size).value if bar_type is BarType.TIME else size)
+        self._alpha = alpha
+
+        self._fstate = np.zeros(_LAST_SIGN + 1)
+        self._fstate[_EXP_TICKS] = self._size
+        self._fstate[_EXP_IMBALANCE] = np.nan
+        self._fstate[_LAST_PX] = np.nan
+        self._istate = np.zeros(_LAST_TIME + 1, dtype=np.int64)
+        self._tz = None
+
+    def _to_df(self, out_ts, out) -> pd.DataFrame:
+        index = pd.DatetimeIndex(out_ts.astype('datetime64[ns]'), name='time')
+        if self._tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self._tz)
+        return pd.DataFrame(out, index=index, columns=BAR_COLUMNS)
+
+    def update(self, ticks: pd.DataFrame) -> pd.DataFrame:
+        """Processes chunk of ticks (sorted by time)
+
+        :param ticks: Ticks with time index
+        :returns: Bars completed by this chunk
+        """
+        self._tz = ticks.index.tz
+        out_ts, out = build_bars(*get_tick_arrays(ticks), self._kind, self._size, self._alpha,
+                                 self._fstate, self._istate)
+        return self._to_df(out_ts, out)
+
+    def flush(self) -> pd.DataFrame:
+        """Returns unfinished bar, if there is one, and starts new bar"""
+        if self._fstate[_TICKS] == 0:
+            return self._to_df(np.empty(0, dtype=np.int64), np.empty((0, len(BAR_COLUMNS))))
+
+        label = self._istate[_BAR_END if self.bar_type is BarType.TIME else _LAST_TIME]
+        out = self._fstate[:_TICKS + 1].reshape(1, -1).copy()
+        self._fstate[[_TICKS, _VOLUME, _DOLLAR, _BUY_VOLUME, _THETA]] = 0
+        return self._to_df(np.array([label], dtype=np.int64), out)
+
+
+def ticks_to_bars(chunks: Iterable[pd.DataFrame], bar_type: BarType,
+                  size: Union[float, Duration], alpha: float = 0.1,
+                  keep_last: bool = True) -> pd.DataFrame:
+    """Aggregates ticks into bars, one chunk at a time
+
+    :param chunks: Chunks of ticks sorted by time, for example from Storage.iter_data
+    :param bar_type: How to group ticks
+    :param size: Interval for time bars, volume/money/ticks per bar for others,
+        initial expected ticks per bar for imbalance bars
+    :param alpha: Weight of last bar in expectations of imbalance bars
+    :param keep_last: Whether to return last unfinished bar
+    :returns: Bars
+    """
+    builder = BarBuilder(bar_type, size, alpha=alpha)
+    bars = [builder.update(chunk) for chunk in chunks]
+    if keep_last:
+        bars.append(builder.flush())
+    return pd.concat(bars) if bars else builder.flush()
@@ -0,0 +1,102 @@
+"""Crossing of thresholds in one compiled pass
+
+| Value is above threshold when x > threshold (NaN is never above),
+  threshold is crossed at point where this state differs from previous point.
+| Thresholds are constant (array of one value) or given for every point (rolling),
+  so same kernels are used for walk-forward research.
+| Spread.get_closes: crossings of low, high and center lines are merged into one sequence
+  of zones (center > high > low, when lines are crossed at same point),
+  close is crossing of center that follows crossing of low or high line.
+"""
+from typing import Tuple
+
+import numba
+import numpy as np
+
+# zones of crossing events
+CENTER = 0
+LOW = 1
+HIGH = 2
+NONE = -1
+
+
+@numba.njit(nogil=True)
+def _at(thresholds, i):
+    return thresholds[i if thresholds.shape[0] > 1 else 0]
+
+
+@numba.njit(nogil=True)
+def _crossed(x, thresholds, i):
+    current = _at(thresholds, i)
+    previous = _at(thresholds, i - 1)
+    # rolling line is not crossed before it's defined
+    if np.isnan(current) or np.isnan(previous):
+        return False
+    return (x[i] > current) != (x[i - 1] > previous)
+
+
+@numba.njit(nogil=True)
+def crosses(x, thresholds):
+    """Returns positions, where threshold was crossed
+
+    :param x: Values
+    :param thresholds: Threshold for every point or array of one threshold
+    """
+    result = np.empty(max(x.shape[0] - 1, 0), dtype=np.int64)
+    count = 0
+    for i in range(1, x.shape[0]):
+        if _crossed(x, thresholds, i):
+            result[count] = i
+            count += 1
+    return result[:count]
+
+
+@numba.njit(nogil=True)
+def cross_events(x, low, center, high):
+    """Returns crossing events of low, center and high lines
+
+    :param x: Values
+    :param low: Low line for every point or array of one value
+    :param center: Center line for every point or array of one value
+    :param high: High line for every point or array of one value
+    :returns: Positions of events, their zones (LOW, CENTER, HIGH)
+        and zone that was closed by event (LOW, HIGH or NONE)
+    """
+    size = max(x.shape[0] - 1, 0)
+    positions = np.empty(size, dtype=np.int64)
+    zones = np.empty(size, dtype=np.int64)
+    closed = np.empty(size, dtype=np.int64)
+    count = 0
+    last = CENTER
+
+    for i in range(1, x.shape[0]):
+        if _crossed(x, center, i):
+            zone = CENTER
+        elif _crossed(x, high, i):
+            zone = HIGH
+        elif _crossed(x, low, i):
+            zone = LOW
+        else:
+            continue
+
+        positions[count] = i
+        zones[count] = zone
+        closed[count] = last if zone == CENTER and last != CENTER else NONE
+        count += 1
+        last = zone
+
+    return positions[:count], zones[:count], closed[:count]
+
+
+def get_closes(x: np.ndarray, low: np.ndarray, center: np.ndarray,
+               high: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns positions of closes of low and high zones, see Spread.get_closes
+
+    :param x: Values
+    :param low: Low line for every point or array of one value
+    :param center: Center line for every point or array of one value
+    :param high: High line for every point or array of one value
+    """
+    positions, _, closed = cross_events(*(np.ascontiguousarray(v, dtype=np.float64)
+                                          for v in (x, low, center, high)))
+    return positions[closed == LOW], positions[closed == HIGH]
@@ -8,3 +8,80 @@ def expanding_mean(arr):
     """
     total_len = arr.shape[0]
     return ((arr / total_len).cumsum() / np.arange(1, total_len + 1)) * total_len
+
+
+@numba.njit(nogil=True)
+def _walk_levels(px, level_size, pct, shift, positions, levels):
+    """Walks prices over levels, fills positions and levels if they are given
+
+    :returns: Number of levels
+    """
+    fill = positions.shape[0] > 0
+    last_px = np.round(px[0] / level_size) * level_size
+    count = 1
+    if fill:
+        positions[0] = 0
+        levels[0] = last_px
+
+    for i in range(px.shape[0]):
+        lvl = level_size if not pct else (last_px + shift) * level_size
+        if not lvl > 0:
+            continue
+        while abs(px[i] - last_px) >= lvl:
+            last_px += np.sign(px[i] - last_px) * lvl
+            if fill:
+                positions[count] = i
+                levels[count] = last_px
+            count += 1
+
+    return count
+
+
+@numba.njit(nogil=True)
+def convert_to_levels(px, level_size, pct):
+    """Returns positions and values of levels price passed through
+
+    | Prices are shifted to start from zero, every time price moves by level_size
+      from last level (level_size * price in pct mode), new level is emitted.
+    | Runs two passes: first counts levels, second fills preallocated arrays.
+
+    :param px: Prices
+    :param level_size: Distance between levels, fraction of price if pct
+    :param pct: Whether level size is relative to price
+    :returns: Positions of prices where levels were reached and levels
+    """
+    shift = px[0]
+    px = px - shift
+    empty_positions = np.empty(0, dtype=np.int64)
+    count = _walk_levels(px, level_size, pct, shift, empty_positions, np.empty(0))
+
+    positions = np.empty(count, dtype=np.int64)
+    levels = np.empty(count)
+    _walk_levels(px, level_size, pct, shift, positions, levels)
+    return positions, levels
+
+
+@numba.njit(nogil=True, parallel=True)
+def convert_to_levels_batch(px, level_sizes, pct):
+    """Same as convert_to_levels for many level sizes, sizes are processed in parallel
+
+    :returns: Positions and levels of all sizes concatenated, and offsets of every size in them
+    """
+    shift = px[0]
+    px = px - shift
+    counts = np.empty(level_sizes.shape[0], dtype=np.int64)
+
+    for k in numba.prange(level_sizes.shape[0]):
+        counts[k] = _walk_levels(px, level_sizes[k], pct, shift,
+                                 np.empty(0, dtype=np.int64), np.empty(0))
+
+    offsets = np.zeros(level_sizes.shape[0] + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    positions = np.empty(offsets[-1], dtype=np.int64)
+    levels = np.empty(offsets[-1])
+
+    for k in numba.prange(level_sizes.shape[0]):
+        _walk_levels(px, level_sizes[k], pct, shift,
+                     positions[offsets[k]:offsets[k + 1]], levels[offsets[k]:offsets[k + 1]])
+
+    return positions, levels, offsets
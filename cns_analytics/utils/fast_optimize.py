@@ -0,0 +1,112 @@
+"""Compiled objectives of basket optimization, see timeseries.addons.optimizer
+
+| Basket is weighted sum of forward-filled prices, objective is its max drop
+  (max of cummax - value) or max drop relative to money in basket.
+  Weighted sum, drop and money are calculated in one pass over rows, without temporary frames.
+| Drop is difference of basket at two points (peak and bottom), so its gradient
+  is difference of prices at these points; gradient of money is accumulated in same pass.
+"""
+from typing import Tuple
+
+import numba
+import numpy as np
+
+# objectives
+DROP = 0
+DROP_PCT = 1
+
+
+def prepare(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns prices for basket (forward-filled, 0 before first price)
+    and prices for money (0 where price is missing), both C-contiguous
+
+    :param values: 2D array of prices, column per symbol
+    """
+    values = np.asarray(values, dtype=np.float64)
+    # row of last price for every point
+    rows = np.where(np.isnan(values), 0, np.arange(values.shape[0])[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    filled = values[rows, np.arange(values.shape[1])]
+
+    return np.ascontiguousarray(np.nan_to_num(filled, nan=0.0)), \
+        np.ascontiguousarray(np.nan_to_num(values, nan=0.0))
+
+
+@numba.njit(nogil=True)
+def objective(filled, raw, x, target):
+    """Returns objective of weights
+
+    :param filled: Prices for basket, see prepare
+    :param raw: Prices for money, see prepare
+    :param x: Weight of every symbol
+    :param target: DROP or DROP_PCT
+    """
+    return objective_gradient(filled, raw, x, target, False)[0]
+
+
+@numba.njit(nogil=True)
+def objective_gradient(filled, raw, x, target, with_gradient=True):
+    """Returns objective of weights and its gradient
+
+    :param filled: Prices for basket, see prepare
+    :param raw: Prices for money, see prepare
+    :param x: Weight of every symbol
+    :param target: DROP or DROP_PCT
+    :param with_gradient: Whether to calculate gradient, zeros are returned otherwise
+    :returns: Objective and gradient, for DROP_PCT objective is inf (and gradient zeros)
+        when basket has no money at some point
+    """
+    n, m = filled.shape
+    gradient = np.zeros(m)
+    # gradient of sum of 1 / money
+    inverse_gradient = np.zeros(m)
+
+    peak = -np.inf
+    peak_position = 0
+    drop = 0.0
+    top = 0
+    bottom = 0
+    inverse_sum = 0.0
+
+    for t in range(n):
+        value = 0.0
+        for j in range(m):
+            value += filled[t, j] * x[j]
+
+        if value > peak:
+            peak = value
+            peak_position = t
+        elif peak - value > drop:
+            drop = peak - value
+            top = peak_position
+            bottom = t
+
+        if target == DROP_PCT:
+            money = 0.0
+            for j in range(m):
+                money += abs(raw[t, j] * x[j])
+            if money <= 0:
+                # no money in basket, drop relative to it is infinite
+                inverse_sum = np.inf
+                continue
+            inverse_sum += 1 / money
+            if with_gradient:
+                for j in range(m):
+                    inverse_gradient[j] -= abs(raw[t, j]) * np.sign(x[j]) / (money * money)
+
+    if with_gradient and drop > 0:
+        for j in range(m):
+            gradient[j] = filled[top, j] - filled[bottom, j]
+
+    if target == DROP:
+        return drop, gradient
+
+    if inverse_sum == np.inf:
+        # same as drop / money of previous pandas objective, optimizer moves away from it
+        return np.inf, np.zeros(m)
+
+    # mean of drop / money, in percents
+    scale = 100 / n
+    for j in range(m):
+        gradient[j] = (gradient[j] * inverse_sum + drop * inverse_gradient[j]) * scale
+    return drop * inverse_sum * scale, gradient
@@ -0,0 +1,200 @@
+"""Single pass resampling of time series over int64 index
+
+| Bucket boundaries are computed once with searchsorted over epoch-ns index,
+  then all columns are aggregated together in one compiled pass.
+| NaN values are skipped by aggregations, same as in pandas.
+"""
+from typing import Optional, Union
+
+import numba
+import numpy as np
+import pandas as pd
+
+from cns_analytics.entities import Duration, DateTime
+
+LAST = 0
+FIRST = 1
+MAX = 2
+MIN = 3
+SUM = 4
+
+OHLC_AGGREGATION = {
+    'px_open': FIRST,
+    'px_high': MAX,
+    'px_low': MIN,
+    'px_close': LAST,
+    'volume': SUM,
+    # columns of bars aggregated from ticks, see fast_bars
+    'dollar_volume': SUM,
+    'buy_volume': SUM,
+    'ticks': SUM,
+}
+
+
+@numba.njit((numba.float64[:, :], numba.int64[:], numba.int64[:]), nogil=True)
+def aggregate(values, bounds, how):
+    """Aggregates values between consecutive bounds
+
+    :param values: 2D array of values, row per column of data (same layout pandas keeps)
+    :param bounds: Positions of bucket starts followed by position of last bucket end
+    :param how: Aggregation for every column (LAST/FIRST/MAX/MIN/SUM)
+    :returns: 2D array with row per bucket
+    """
+    bucket_count = bounds.shape[0] - 1
+    column_count = values.shape[0]
+    result = np.full((bucket_count, column_count), np.nan)
+
+    for col in range(column_count):
+        agg = how[col]
+        column = values[col]
+
+        for bucket in range(bucket_count):
+            start = bounds[bucket]
+            end = bounds[bucket + 1]
+            acc = np.nan
+
+            if agg == SUM:
+                acc = 0
+                for row in range(start, end):
+                    if not np.isnan(column[row]):
+                        acc += column[row]
+            elif agg == FIRST:
+                for row in range(start, end):
+                    if not np.isnan(column[row]):
+                        acc = column[row]
+                        break
+            elif agg == LAST:
+                for row in range(end - 1, start - 1, -1):
+                    if not np.isnan(column[row]):
+                        acc = column[row]
+                        break
+            elif agg == MAX:
+                for row in range(start, end):
+                    if column[row] > acc or np.isnan(acc):
+                        acc = column[row]
+            elif agg == MIN:
+                for row in range(start, end):
+                    if column[row] < acc or np.isnan(acc):
+                        acc = column[row]
+
+            result[bucket, col] = acc
+
+    return result
+
+
+def get_bucket_edges(index: pd.DatetimeIndex, step: Duration,
+                     origin: Union[str, DateTime] = 'start_day',
+                     offset: Optional[Duration] = None,
+                     session_start: Optional[str] = None) -> np.ndarray:
+    """Returns epoch-ns edges of buckets covering index, including end of last bucket
+
+    | Edges are computed with fixed step in UTC. For other timezones pandas steps in local
+      wall time (buckets move after DST change), so edges are taken from pandas.
+
+    :param index: Sorted index to cover
+    :param step: Bucket size
+    :param origin: Same as in pandas: epoch/start/start_day or timestamp to align buckets to
+    :param offset: Shift of origin
+    :param session_start: Local time of session open (like "09:30"),
+        if set buckets are aligned to session open every day, origin is ignored
+    """
+    if session_start is None and index.tz is not None and str(index.tz) != 'UTC':
+        return _get_local_bucket_edges(index, step, origin, offset)
+
+    step = pd.Timedelta(step).value
+    offset = pd.Timedelta(offset or 0).value
+    first, last = index.asi8[0], index.asi8[-1]
+
+    if session_start is not None:
+        days = pd.date_range(index[0].tz_localize(None).normalize() - pd.Timedelta('1d'),
+                             index[-1].tz_localize(None).normalize() + pd.Timedelta('1d'),
+                             freq='1d')
+        session_start = pd.Timestamp(session_start)
+        opens = days + (session_start - session_start.normalize()) + pd.Timedelta(offset)
+        if index.tz is not None:
+            opens = opens.tz_localize(index.tz, ambiguous=False, nonexistent='shift_forward')
+        opens = opens.asi8
+
+        counts = -((opens[:-1] - opens[1:]) // step)
+        session_idx = np.repeat(np.arange(len(counts)), counts)
+        bucket_idx = np.arange(len(session_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+        edges = np.append(opens[session_idx] + bucket_idx * step, opens[-1])
+        # leave only edges around index
+        lo = max(np.searchsorted(edges, first, side='right') - 1, 0)
+        hi = np.searchsorted(edges, last, side='right') + 1
+        return edges[lo:hi]
+
+    if origin == 'epoch':
+        origin = 0
+    elif origin == 'start':
+        origin = first
+    elif origin == 'start_day':
+        origin = index[0].normalize().value
+    else:
+        origin = pd.Timestamp(origin).value
+
+    origin += offset
+    start = origin + (first - origin) // step * step
+    # count in integers, np.arange loses precision on epoch-ns values
+    count = (last - start) // step + 2
+    return start + step * np.arange(count, dtype=np.int64)
+
+
+def _get_local_bucket_edges(index: pd.DatetimeIndex, step: Duration,
+                            origin: Union[str, DateTime],
+                            offset: Optional[Duration]) -> np.ndarray:
+    """Returns bucket edges for index in non-UTC timezone, same as pandas
+
+    | Pandas steps buckets in local wall time, so they are shifted after DST change.
+      Edges are taken from pandas, resampling only first and last points.
+    | Step is passed as Timedelta, pandas reads strings like '5m' as months.
+    """
+    step = pd.Timedelta(step)
+    ends = pd.Series(0, index=index[[0, -1]])
+    kwargs = dict(origin=origin, offset=offset)
+    left = ends.resample(step, **kwargs).first().index
+    right = ends.resample(step, label='right', **kwargs).first().index
+    return np.append(left.asi8, right.asi8[-1])
+
+
+def resample(data: pd.DataFrame, step: Duration, how: Union[int, np.ndarray] = LAST,
+             origin: Union[str, DateTime] = 'start_day',
+             offset: Optional[Duration] = None,
+             session_start: Optional[str] = None,
+             label: str = 'left') -> pd.DataFrame:
+    """Resamples data, keeps only buckets where all columns have a value
+
+    Same as data.resample(step).agg(how).dropna(), also for timezones with DST
+    (see get_bucket_edges)
+
+    :param data: Data to resample
+    :param step: Bucket size
+    :param how: Aggregation for all columns or for every column
+    :param origin: Same as in pandas: epoch/start/start_day or timestamp to align buckets to
+    :param offset: Shift of origin
+    :param session_start: Local time of session open (like "09:30"),
+        if set buckets are aligned to session open every day
+    :param label: Label buckets by left or right edge
+    :returns: Resampled data
+    """
+    if data.empty:
+        return data
+
+    edges = get_bucket_edges(data.index, step, origin=origin, offset=offset,
+                             session_start=session_start)
+    bounds = np.searchsorted(data.index.asi8, edges).astype(np.int64)
+
+    non_empty = np.flatnonzero(bounds[:-1] < bounds[1:])
+    labels = edges[non_empty] if label == 'left' else edges[non_empty + 1]
+    # empty buckets have equal bounds, so dropping them keeps the rest contiguous
+    bounds = np.append(bounds[non_empty], bounds[non_empty[-1] + 1])
+
+    how = np.broadcast_to(np.asarray(how, dtype=np.int64), (data.shape[1],)).copy()
+    values = aggregate(np.ascontiguousarray(data.values.T, dtype=np.float64), bounds, how)
+
+    keep = ~np.isnan(values).any(axis=1)
+    index = pd.DatetimeIndex(labels[keep].astype('datetime64[ns]'), name=data.index.name)
+    if data.index.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(data.index.tz)
+
+    return pd.DataFrame(values[keep], index=index, columns=data.columns)
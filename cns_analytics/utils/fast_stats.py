@@ -0,0 +1,397 @@
+"""Batched statistics over many series at once
+
+| Series are columns of 2D array (row per point), columns are processed in parallel.
+| Hurst exponent is slope of log(sqrt(std of lagged differences)) on log(lag) times 2,
+  same as utils.get_hurst_exponent. Differences for all lags are collected in one pass.
+| OLS is closed-form, y = coef * x + shift, same as utils.get_ols_regression.
+| Statistics of many pair spreads are calculated pair by pair in parallel,
+  spread of pair is built in buffer of one thread, so pairs x time array is never stored.
+| NaN values are skipped.
+"""
+from typing import Optional, Tuple
+
+import numba
+import numpy as np
+
+from cns_analytics.utils.fast_walk_forward import HURST_LAGS, hurst as _rolling_hurst, ols as _rolling_ols
+
+
+@numba.njit(nogil=True)
+def hurst(x, lags):
+    """Returns Hurst exponent of whole series
+
+    :param x: Values
+    :param lags: Lags of differences
+    """
+    n = x.shape[0]
+    lag_count = lags.shape[0]
+    count = np.zeros(lag_count, dtype=np.int64)
+    total = np.zeros(lag_count)
+    total_sq = np.zeros(lag_count)
+
+    for i in range(n):
+        if np.isnan(x[i]):
+            continue
+        for k in range(lag_count):
+            j = i - lags[k]
+            if j >= 0 and not np.isnan(x[j]):
+                diff = x[i] - x[j]
+                count[k] += 1
+                total[k] += diff
+                total_sq[k] += diff * diff
+
+    log_lags = np.log(lags.astype(np.float64))
+    mean_log_lag = log_lags.mean()
+    var_log_lag = ((log_lags - mean_log_lag) ** 2).sum()
+
+    slope = 0.0
+    for k in range(lag_count):
+        if count[k] == 0:
+            return np.nan
+        var = total_sq[k] / count[k] - (total[k] / count[k]) ** 2
+        if var <= 0:
+            return np.nan
+        slope += (log_lags[k] - mean_log_lag) * 0.25 * np.log(var)
+
+    return 2.0 * slope / var_log_lag
+
+
+@numba.njit(nogil=True, parallel=True)
+def hurst_batch(values, lags):
+    """Returns Hurst exponent of every column"""
+    result = np.full(values.shape[1], np.nan)
+    for k in numba.prange(values.shape[1]):
+        result[k] = hurst(np.ascontiguousarray(values[:, k]), lags)
+    return result
+
+
+@numba.njit(nogil=True, parallel=True)
+def rolling_hurst_batch(values, starts, lags, min_periods):
+    """Returns Hurst exponent of every window for every column
+
+    :param values: 2D array, column per series
+    :param starts: Position of window start for every point, see fast_walk_forward.get_window_starts
+    :param lags: Lags of differences
+    :param min_periods: Minimum number of values in window
+    """
+    result = np.full(values.shape, np.nan)
+    for k in numba.prange(values.shape[1]):
+        result[:, k] = _rolling_hurst(np.ascontiguousarray(values[:, k]), starts, lags, min_periods)
+    return result
+
+
+def get_hurst_exponents(values: np.ndarray, weights: Optional[np.ndarray] = None,
+                        block_size: int = 256) -> np.ndarray:
+    """Scores many series (or spreads of them) with Hurst exponent in parallel
+
+    | Spreads are built by matrix product in blocks, so only block_size spreads are in memory.
+
+    :param values: 2D array, column per series
+    :param weights: Optional 2D array, row of column weights per spread
+    :param block_size: Number of spreads built at once
+    :returns: Hurst exponent of every column, or of every spread if weights are passed
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if weights is None:
+        return hurst_batch(values, HURST_LAGS)
+
+    weights = np.asarray(weights, dtype=np.float64)
+    result = np.empty(weights.shape[0])
+    for start in range(0, weights.shape[0], block_size):
+        block = weights[start:start + block_size]
+        result[start:start + len(block)] = hurst_batch(values @ block.T, HURST_LAGS)
+    return result
+
+
+@numba.njit(nogil=True)
+def ols(x, y):
+    """Returns shift and coefficient of y = coef * x + shift, points with NaN are skipped"""
+    count = 0
+    mean_x = 0.0
+    mean_y = 0.0
+    for i in range(x.shape[0]):
+        if not np.isnan(x[i]) and not np.isnan(y[i]):
+            count += 1
+            mean_x += x[i]
+            mean_y += y[i]
+    if count < 2:
+        return np.nan, np.nan
+    mean_x /= count
+    mean_y /= count
+
+    sxx = 0.0
+    sxy = 0.0
+    for i in range(x.shape[0]):
+        if not np.isnan(x[i]) and not np.isnan(y[i]):
+            dx = x[i] - mean_x
+            sxx += dx * dx
+            sxy += dx * (y[i] - mean_y)
+    if sxx <= 0:
+        return np.nan, np.nan
+
+    coef = sxy / sxx
+    return mean_y - coef * mean_x, coef
+
+
+@numba.njit(nogil=True, parallel=True)
+def ols_batch(x, values):
+    """Regresses every column of values on x in parallel
+
+    :param x: Base values
+    :param values: 2D array, column per dependent series
+    :returns: Shift and coef of every column
+    """
+    shift = np.full(values.shape[1], np.nan)
+    coef = np.full(values.shape[1], np.nan)
+    for k in numba.prange(values.shape[1]):
+        shift[k], coef[k] = ols(x, np.ascontiguousarray(values[:, k]))
+    return shift, coef
+
+
+@numba.njit(nogil=True, parallel=True)
+def ols_pairs(values, pairs):
+    """Regresses many pairs of columns in parallel
+
+    :param values: 2D array, column per series
+    :param pairs: 2D int array, row of (base column, dependent column) per pair
+    :returns: Shift and coef of every pair
+    """
+    shift = np.full(pairs.shape[0], np.nan)
+    coef = np.full(pairs.shape[0], np.nan)
+    for k in numba.prange(pairs.shape[0]):
+        shift[k], coef[k] = ols(np.ascontiguousarray(values[:, pairs[k, 0]]),
+                                np.ascontiguousarray(values[:, pairs[k, 1]]))
+    return shift, coef
+
+
+@numba.njit(nogil=True, parallel=True)
+def rolling_ols_batch(x, values, starts, min_periods):
+    """Regresses every column of values on x over window ending at every point
+
+    :param x: Base values
+    :param values: 2D array, column per dependent series
+    :param starts: Position of window start for every point, see fast_walk_forward.get_window_starts
+    :param min_periods: Minimum number of points in window
+    :returns: 2D arrays of shift and coef, same shape as values
+    """
+    shift = np.full(values.shape, np.nan)
+    coef = np.full(values.shape, np.nan)
+    for k in numba.prange(values.shape[1]):
+        shift[:, k], coef[:, k] = _rolling_ols(x, np.ascontiguousarray(values[:, k]), starts, min_periods)
+    return shift, coef
+
+
+def ols_all_pairs(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Regresses every column on every other one from one product of centered values
+
+    | Rows with NaN in any column are dropped.
+
+    :param values: 2D array, column per series
+    :returns: Shift and coef matrices, [i, j] is regression of column j on column i
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values).any(axis=1)]
+    mean = values.mean(axis=0)
+    centered = values - mean
+    covariance = centered.T @ centered
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coef = covariance / np.diag(covariance)[:, None]
+    shift = mean[None, :] - coef * mean[:, None]
+    return shift, coef
+
+
+@numba.njit(nogil=True)
+def rolling_correlation(x, y, starts, min_periods):
+    """Returns correlation of x and y over window ending at every point"""
+    n = x.shape[0]
+    result = np.full(n, np.nan)
+
+    base_x = np.nan
+    base_y = np.nan
+    for i in range(n):
+        if not np.isnan(x[i]) and not np.isnan(y[i]):
+            base_x = x[i]
+            base_y = y[i]
+            break
+
+    count = 0
+    sx = 0.0
+    sy = 0.0
+    sxx = 0.0
+    syy = 0.0
+    sxy = 0.0
+    start = 0
+
+    for i in range(n):
+        if not np.isnan(x[i]) and not np.isnan(y[i]):
+            dx = x[i] - base_x
+            dy = y[i] - base_y
+            count += 1
+            sx += dx
+            sy += dy
+            sxx += dx * dx
+            syy += dy * dy
+            sxy += dx * dy
+
+        while start < starts[i]:
+            if not np.isnan(x[start]) and not np.isnan(y[start]):
+                dx = x[start] - base_x
+                dy = y[start] - base_y
+                count -= 1
+                sx -= dx
+                sy -= dy
+                sxx -= dx * dx
+                syy -= dy * dy
+                sxy -= dx * dy
+            start += 1
+
+        if count < min_periods or count < 2:
+            continue
+
+        var_x = sxx - sx * sx / count
+        var_y = syy - sy * sy / count
+        if var_x <= 0 or var_y <= 0:
+            continue
+        result[i] = (sxy - sx * sy / count) / np.sqrt(var_x * var_y)
+
+    return result
+
+
+@numba.njit(nogil=True, parallel=True)
+def rolling_correlation_pairs(values, pairs, starts, min_periods):
+    """Returns rolling correlation of every pair of columns, pairs are processed in parallel
+
+    :param values: 2D array, column per series
+    :param pairs: 2D int array, row of two columns per pair
+    :param starts: Position of window start for every point, see fast_walk_forward.get_window_starts
+    :param min_periods: Minimum number of points in window
+    :returns: 2D array, column per pair
+    """
+    result = np.full((values.shape[0], pairs.shape[0]), np.nan)
+    for k in numba.prange(pairs.shape[0]):
+        result[:, k] = rolling_correlation(np.ascontiguousarray(values[:, pairs[k, 0]]),
+                                           np.ascontiguousarray(values[:, pairs[k, 1]]),
+                                           starts, min_periods)
+    return result
+
+
+def correlation_matrix(values: np.ndarray) -> np.ndarray:
+    """Returns correlation of every column with every other one from one product of centered values
+
+    | Rows with NaN in any column are dropped.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values).any(axis=1)]
+    centered = values - values.mean(axis=0)
+    covariance = centered.T @ centered
+    std = np.sqrt(np.diag(covariance))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return covariance / np.outer(std, std)
+
+
+@numba.njit(nogil=True)
+def _percentile_bounds(n, q):
+    position = q / 100 * (n - 1)
+    lower = int(np.floor(position))
+    return lower, min(lower + 1, n - 1), position - lower
+
+
+@numba.njit(nogil=True)
+def percentile(x, q):
+    """Returns percentile of values, same as np.percentile (linear interpolation)
+
+    :param x: Values, sorted or partitioned at positions around percentile, see percentile_range
+    :param q: Percentile, [0-100]
+    """
+    lower, upper, t = _percentile_bounds(x.shape[0], q)
+    a = x[lower]
+    b = x[upper]
+    diff = b - a
+    if t >= 0.5:
+        return b - diff * (1 - t)
+    return a + diff * t
+
+
+@numba.njit(nogil=True)
+def percentile_range(x, low, high):
+    """Returns high percentile - low percentile, values are partitioned instead of sorting
+
+    :param x: Values without NaN, changed inplace
+    :param low: Low percentile, [0-100]
+    :param high: High percentile, [0-100]
+    """
+    n = x.shape[0]
+    low_lower, low_upper, _ = _percentile_bounds(n, low)
+    high_lower, high_upper, _ = _percentile_bounds(n, high)
+    x[:] = np.partition(x, np.array([low_lower, low_upper, high_lower, high_upper]))
+    return percentile(x, high) - percentile(x, low)
+
+
+@numba.njit(nogil=True)
+def max_drop(x):
+    """Returns max of cummax(x) - x, same as get_drop(DropLogic.SIMPLE).max()"""
+    peak = -np.inf
+    result = 0.0
+    for i in range(x.shape[0]):
+        if x[i] > peak:
+            peak = x[i]
+        elif peak - x[i] > result:
+            result = peak - x[i]
+    return result
+
+
+@numba.njit(nogil=True)
+def count_crosses(x, value):
+    """Returns number of times value was crossed, same as len(TimeSeries.get_crosses(value))"""
+    count = 0
+    for i in range(1, x.shape[0]):
+        if (x[i] > value) != (x[i - 1] > value):
+            count += 1
+    return count
+
+
+@numba.njit(nogil=True, parallel=True)
+def spread_statistics(values_t, pairs, shift, coef, lags, low, high, value):
+    """Scores spread of every pair in parallel
+
+    | Spread of pair is leg1 - coef * leg2 - shift, points with NaN in any leg are skipped.
+
+    :param values_t: 2D array, row per series (transposed data, so legs are contiguous)
+    :param pairs: 2D int array, row of (leg1 row, leg2 row) per pair
+    :param shift: Shift of every pair
+    :param coef: Coef of every pair
+    :param lags: Lags of differences for Hurst exponent
+    :param low: Low percentile of magnitude, [0-100]
+    :param high: High percentile of magnitude, [0-100]
+    :param value: Crossing line
+    :returns: 2D array, row of magnitude, max drop, number of crosses and Hurst exponent per pair
+    """
+    n = values_t.shape[1]
+    result = np.full((pairs.shape[0], 4), np.nan)
+
+    for k in numba.prange(pairs.shape[0]):
+        if np.isnan(coef[k]):
+            continue
+        leg1 = values_t[pairs[k, 0]]
+        leg2 = values_t[pairs[k, 1]]
+
+        spread = np.empty(n)
+        count = 0
+        for i in range(n):
+            point = leg1[i] - coef[k] * leg2[i] - shift[k]
+            if not np.isnan(point):
+                spread[count] = point
+                count += 1
+        if count == 0:
+            continue
+        spread = spread[:count]
+
+        result[k, 1] = max_drop(spread)
+        result[k, 2] = count_crosses(spread, value)
+        result[k, 3] = hurst(spread, lags)
+
+        result[k, 0] = percentile_range(spread, low, high)
+
+    return result
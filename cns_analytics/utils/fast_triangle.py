@@ -0,0 +1,160 @@
+"""Compiled triangle fitting, see entities.Triangle
+
+| Objective is Triangle.target_function without allocation of line,
+  Nelder-Mead is same as scipy.optimize.minimize(method='Nelder-Mead'),
+  so results are the same as before.
+| Many windows are fitted in parallel.
+"""
+import numba
+import numpy as np
+
+# same as options of minimize in TimeSeries.get_triangle
+MAX_ITERATIONS = 10e3
+# same as scipy defaults
+_NONZDELT = 0.05
+_ZDELT = 0.00025
+_XATOL = 1e-4
+_FATOL = 1e-4
+
+
+@numba.njit(nogil=True)
+def target(y0, y1, direction, points, outside_threshold):
+    """Same as Triangle.target_function, line is computed point by point like np.linspace"""
+    h = points.shape[0]
+    div = h - 1
+    step = (y1 - y0) / div if div > 0 else 0.0
+
+    count_outside = 0
+    for i in range(h):
+        if i == div and div > 0:
+            line = y1
+        elif step == 0:
+            line = i / div * (y1 - y0) + y0 if div > 0 else y0
+        else:
+            line = i * step + y0
+
+        if direction > 0:
+            if points[i] < line:
+                count_outside += 1
+        elif points[i] > line:
+            count_outside += 1
+
+    if count_outside > h * outside_threshold:
+        return 1e9 + count_outside
+
+    if direction > 0:
+        return -(y0 + y1) / 1e3
+    return (y0 + y1) / 1e3
+
+
+@numba.njit(nogil=True)
+def _sort(sim, fsim):
+    order = np.argsort(fsim, kind='mergesort')
+    return sim[order].copy(), fsim[order].copy()
+
+
+@numba.njit(nogil=True)
+def nelder_mead(x0, direction, points, outside_threshold, max_iterations):
+    """Minimizes target over line ends, same steps as scipy Nelder-Mead
+
+    :param x0: Initial ends of line
+    :returns: Ends of best line
+    """
+    n = 2
+    rho, chi, psi, sigma = 1.0, 2.0, 0.5, 0.5
+
+    sim = np.empty((n + 1, n))
+    sim[0] = x0
+    for k in range(n):
+        y = x0.copy()
+        if y[k] != 0:
+            y[k] = (1 + _NONZDELT) * y[k]
+        else:
+            y[k] = _ZDELT
+        sim[k + 1] = y
+
+    fsim = np.empty(n + 1)
+    for k in range(n + 1):
+        fsim[k] = target(sim[k, 0], sim[k, 1], direction, points, outside_threshold)
+    sim, fsim = _sort(sim, fsim)
+
+    iterations = 1
+    while iterations < max_iterations:
+        if np.max(np.abs(sim[1:] - sim[0])) <= _XATOL and np.max(np.abs(fsim[0] - fsim[1:])) <= _FATOL:
+            break
+
+        xbar = (sim[0] + sim[1]) / n
+        xr = (1 + rho) * xbar - rho * sim[-1]
+        fxr = target(xr[0], xr[1], direction, points, outside_threshold)
+        shrink = False
+
+        if fxr < fsim[0]:
+            xe = (1 + rho * chi) * xbar - rho * chi * sim[-1]
+            fxe = target(xe[0], xe[1], direction, points, outside_threshold)
+            if fxe < fxr:
+                sim[-1], fsim[-1] = xe, fxe
+            else:
+                sim[-1], fsim[-1] = xr, fxr
+        elif fxr < fsim[-2]:
+            sim[-1], fsim[-1] = xr, fxr
+        else:
+            if fxr < fsim[-1]:
+                xc = (1 + psi * rho) * xbar - psi * rho * sim[-1]
+                fxc = target(xc[0], xc[1], direction, points, outside_threshold)
+                if fxc <= fxr:
+                    sim[-1], fsim[-1] = xc, fxc
+                else:
+                    shrink = True
+            else:
+                xcc = (1 - psi) * xbar + psi * sim[-1]
+                fxcc = target(xcc[0], xcc[1], direction, points, outside_threshold)
+                if fxcc < fsim[-1]:
+                    sim[-1], fsim[-1] = xcc, fxcc
+                else:
+                    shrink = True
+
+            if shrink:
+                for j in range(1, n + 1):
+                    sim[j] = sim[0] + sigma * (sim[j] - sim[0])
+                    fsim[j] = target(sim[j, 0], sim[j, 1], direction, points, outside_threshold)
+
+        iterations += 1
+        sim, fsim = _sort(sim, fsim)
+
+    return sim[0].copy()
+
+
+@numba.njit(nogil=True)
+def fit(points, outside_threshold, max_iterations=MAX_ITERATIONS):
+    """Returns a0, a1, b0, b1 of best triangle, same as TimeSeries.get_triangle"""
+    half = int(round(points.shape[0] / 2))
+    xa0 = np.array([np.max(points[:half]), np.max(points[half:])])
+    xb0 = np.array([np.min(points[:half]), np.min(points[half:])])
+
+    a = nelder_mead(xa0, -1, points, outside_threshold, max_iterations)
+    b = nelder_mead(xb0, 1, points, outside_threshold, max_iterations)
+
+    return a[0], a[1], b[0], b[1]
+
+
+@numba.njit(nogil=True, parallel=True)
+def fit_windows(x, starts, ends, outside_threshold, max_iterations=MAX_ITERATIONS):
+    """Fits triangle to every window in parallel
+
+    :param x: Values
+    :param starts: First position of every window
+    :param ends: Position after last point of every window
+    :returns: Row of a0, a1, b0, b1 per window, NaN for windows with less than 2 points
+    """
+    result = np.full((starts.shape[0], 4), np.nan)
+
+    for k in numba.prange(starts.shape[0]):
+        if ends[k] - starts[k] < 2:
+            continue
+        a0, a1, b0, b1 = fit(x[starts[k]:ends[k]], outside_threshold, max_iterations)
+        result[k, 0] = a0
+        result[k, 1] = a1
+        result[k, 2] = b0
+        result[k, 3] = b1
+
+    return result
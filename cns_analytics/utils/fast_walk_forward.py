@@ -0,0 +1,371 @@
+"""Walk-forward statistics in one compiled pass
+
+| Value at every point is calculated from window that ends at this point (inclusive).
+| Window is expanding or rolling (fixed number of points or fixed time),
+  in both cases window start only moves forward, so mean, std, OLS and Hurst exponent
+  are updated incrementally when points enter and leave window.
+| For percentile counts of values in window are kept in Fenwick tree over value ranks,
+  entering and leaving points are added and removed in O(log n),
+  several percentiles are read in same pass.
+| NaN values are skipped.
+"""
+from typing import Optional, Tuple, Union
+
+import numba
+import numpy as np
+import pandas as pd
+
+from cns_analytics.entities import Duration, Statistic
+
+# same lags as in utils.get_hurst_exponent
+HURST_LAGS = np.arange(2, 20)
+
+MIN_PERIODS = {
+    Statistic.MEAN: 1,
+    Statistic.STD: 2,
+    Statistic.OLS: 2,
+    Statistic.PERCENTILE: 1,
+    Statistic.HURST: HURST_LAGS[-1] + 2,
+}
+
+
+def get_window_starts(index: np.ndarray, window: Optional[Union[Duration, int]] = None) -> np.ndarray:
+    """Returns position of window start for every point
+
+    :param index: Epoch-ns time of points
+    :param window: None for expanding window, number of points or duration for rolling one
+    """
+    size = len(index)
+
+    if window is None:
+        return np.zeros(size, dtype=np.int64)
+
+    if isinstance(window, (int, np.integer)):
+        return np.maximum(np.arange(size, dtype=np.int64) - window + 1, 0)
+
+    # same as pandas: window covers (t - window, t]
+    return np.searchsorted(index, index - pd.Timedelta(window).value, side='right').astype(np.int64)
+
+
+@numba.njit(nogil=True)
+def moments(x, starts, min_periods, ddof):
+    """Returns mean and standard deviation of every window"""
+    n = x.shape[0]
+    mean = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+
+    # sums of values shifted by first one, it keeps rolling sums precise
+    base = np.nan
+    for i in range(n):
+        if not np.isnan(x[i]):
+            base = x[i]
+            break
+
+    count = 0
+    total = 0.0
+    total_sq = 0.0
+    start = 0
+
+    for i in range(n):
+        if not np.isnan(x[i]):
+            value = x[i] - base
+            count += 1
+            total += value
+            total_sq += value * value
+
+        while start < starts[i]:
+            if not np.isnan(x[start]):
+                value = x[start] - base
+                count -= 1
+                total -= value
+                total_sq -= value * value
+            start += 1
+
+        if count < min_periods or count == 0:
+            continue
+
+        mean[i] = base + total / count
+        if count > ddof:
+            var = (total_sq - total * total / count) / (count - ddof)
+            std[i] = np.sqrt(max(var, 0.0))
+
+    return mean, std
+
+
+@numba.njit(nogil=True)
+def ols(x, y, starts, min_periods):
+    """Returns shift and coefficient of y = coef * x + shift for every window"""
+    n = x.shape[0]
+    shift = np.full(n, np.nan)
+    coef = np.full(n, np.nan)
+
+    base_x = np.nan
+    base_y = np.nan
+    for i in range(n):
+        if not np.isnan(x[i]) and not np.isnan(y[i]):
+            base_x = x[i]
+            base_y = y[i]
+            break
+
+    count = 0
+    sx = 0.0
+    sy = 0.0
+    sxx = 0.0
+    sxy = 0.0
+    start = 0
+
+    for i in range(n):
+        if not np.isnan(x[i]) and not np.isnan(y[i]):
+            dx = x[i] - base_x
+            dy = y[i] - base_y
+            count += 1
+            sx += dx
+            sy += dy
+            sxx += dx * dx
+            sxy += dx * dy
+
+        while start < starts[i]:
+            if not np.isnan(x[start]) and not np.isnan(y[start]):
+                dx = x[start] - base_x
+                dy = y[start] - base_y
+                count -= 1
+                sx -= dx
+                sy -= dy
+                sxx -= dx * dx
+                sxy -= dx * dy
+            start += 1
+
+        if count < min_periods or count < 2:
+            continue
+
+        var_x = sxx - sx * sx / count
+        if var_x <= 0:
+            continue
+
+        coef[i] = (sxy - sx * sy / count) / var_x
+        shift[i] = base_y + sy / count - coef[i] * (base_x + sx / count)
+
+    return shift, coef
+
+
+@numba.njit(nogil=True)
+def hurst(x, starts, lags, min_periods):
+    """Returns Hurst exponent of every window, same as utils.get_hurst_exponent
+
+    | Keeps sums of lagged differences inside window for every lag.
+    """
+    n = x.shape[0]
+    lag_count = lags.shape[0]
+    result = np.full(n, np.nan)
+
+    count = np.zeros(lag_count, dtype=np.int64)
+    total = np.zeros(lag_count)
+    total_sq = np.zeros(lag_count)
+    log_lags = np.log(lags.astype(np.float64))
+    mean_log_lag = log_lags.mean()
+    var_log_lag = ((log_lags - mean_log_lag) ** 2).sum()
+
+    points = 0
+    start = 0
+
+    for i in range(n):
+        if not np.isnan(x[i]):
+            points += 1
+
+        # differences that end at this point
+        for k in range(lag_count):
+            j = i - lags[k]
+            if j >= start and not np.isnan(x[i]) and not np.isnan(x[j]):
+                diff = x[i] - x[j]
+                count[k] += 1
+                total[k] += diff
+                total_sq[k] += diff * diff
+
+        while start < starts[i]:
+            if not np.isnan(x[start]):
+                points -= 1
+            # differences that start at point leaving window
+            for k in range(lag_count):
+                j = start + lags[k]
+                if j <= i and not np.isnan(x[start]) and not np.isnan(x[j]):
+                    diff = x[j] - x[start]
+                    count[k] -= 1
+                    total[k] -= diff
+                    total_sq[k] -= diff * diff
+            start += 1
+
+        if points < min_periods:
+            continue
+
+        # slope of log(tau) on log(lag)
+        slope = 0.0
+        valid = True
+        for k in range(lag_count):
+            if count[k] == 0:
+                valid = False
+                break
+            var = total_sq[k] / count[k] - (total[k] / count[k]) ** 2
+            if var <= 0:
+                valid = False
+                break
+            log_tau = 0.25 * np.log(var)
+            slope += (log_lags[k] - mean_log_lag) * log_tau
+
+        if valid:
+            result[i] = 2.0 * slope / var_log_lag
+
+    return result
+
+
+@numba.njit(nogil=True)
+def interpolate(lower, upper, t):
+    """Returns value between lower and upper, same as np.quantile (linear interpolation)"""
+    diff = upper - lower
+    if t >= 0.5:
+        return upper - diff * (1 - t)
+    return lower + diff * t
+
+
+@numba.njit(nogil=True)
+def tree_update(tree, rank, delta):
+    """Adds delta to count of value with rank in Fenwick tree"""
+    position = rank + 1
+    while position < tree.shape[0]:
+        tree[position] += delta
+        position += position & -position
+
+
+@numba.njit(nogil=True)
+def tree_find(tree, k, top):
+    """Returns rank of k-th (from 0) smallest value in Fenwick tree
+
+    :param top: Largest power of two not greater than number of ranks
+    """
+    position = 0
+    remaining = k + 1
+    step = top
+    while step > 0:
+        if position + step < tree.shape[0] and tree[position + step] < remaining:
+            position += step
+            remaining -= tree[position]
+        step //= 2
+    return position
+
+
+@numba.njit(nogil=True)
+def percentiles(x, starts, qs, min_periods):
+    """Returns several percentiles of every window
+
+    | Values are replaced by ranks among sorted distinct values, window keeps count
+      of every rank in Fenwick tree, so insert, remove and finding k-th value
+      take O(log n) and whole pass takes O(n log n) also for expanding window.
+
+    :param qs: Percentile values, [0-1]
+    :returns: 2D array, column per percentile value
+    """
+    n = x.shape[0]
+    result = np.full((n, qs.shape[0]), np.nan)
+
+    values = np.unique(x[~np.isnan(x)])
+    ranks = np.searchsorted(values, x)
+    tree = np.zeros(values.shape[0] + 1, dtype=np.int64)
+    top = 1
+    while top * 2 <= values.shape[0]:
+        top *= 2
+
+    size = 0
+    start = 0
+
+    for i in range(n):
+        if not np.isnan(x[i]):
+            tree_update(tree, ranks[i], 1)
+            size += 1
+
+        while start < starts[i]:
+            if not np.isnan(x[start]):
+                tree_update(tree, ranks[start], -1)
+                size -= 1
+            start += 1
+
+        if size >= max(min_periods, 1):
+            for k in range(qs.shape[0]):
+                position = qs[k] * (size - 1)
+                lower = int(np.floor(position))
+                upper = min(lower + 1, size - 1)
+                result[i, k] = interpolate(values[tree_find(tree, lower, top)],
+                                           values[tree_find(tree, upper, top)],
+                                           position - lower)
+
+    return result
+
+
+def percentile(x: np.ndarray, starts: np.ndarray, q: float, min_periods: int) -> np.ndarray:
+    """Returns percentile of every window"""
+    return percentiles(x, starts, np.array([q], dtype=np.float64), min_periods)[:, 0]
+
+
+def calculate(index: np.ndarray, x: np.ndarray, statistic: Statistic,
+              y: Optional[np.ndarray] = None,
+              window: Optional[Union[Duration, int]] = None,
+              value: Optional[float] = None,
+              min_periods: Optional[int] = None,
+              ddof: int = 1) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Calculates statistic for every point over window ending at this point
+
+    :param index: Epoch-ns time of points
+    :param x: Values, base values for OLS
+    :param statistic: Statistic to calculate
+    :param y: Dependent values for OLS
+    :param window: None for expanding window, number of points or duration for rolling one
+    :param value: Percentile value, [0-1]
+    :param min_periods: Minimum number of values in window, NaN is returned for smaller windows
+    :param ddof: Delta degrees of freedom for STD
+    :returns: Statistic for every point, shift and coef for OLS
+    """
+    starts = get_window_starts(index, window)
+    min_periods = MIN_PERIODS[statistic] if min_periods is None else min_periods
+    x = np.ascontiguousarray(x, dtype=np.float64)
+
+    if statistic is Statistic.MEAN:
+        return moments(x, starts, min_periods, ddof)[0]
+    elif statistic is Statistic.STD:
+        return moments(x, starts, min_periods, ddof)[1]
+    elif statistic is Statistic.OLS:
+        if y is None:
+            raise Exception("OLS requires exactly two symbols")
+        return ols(x, np.ascontiguousarray(y, dtype=np.float64), starts, min_periods)
+    elif statistic is Statistic.PERCENTILE:
+        if value is None:
+            raise Exception(f"value parameter is required for {statistic}")
+        return percentile(x, starts, value, min_periods)
+    elif statistic is Statistic.HURST:
+        return hurst(x, starts, HURST_LAGS, min_periods)
+
+    raise NotImplementedError(f"{statistic} is not supported")
+
+
+def walk_forward(data: pd.DataFrame, statistic: Statistic,
+                 window: Optional[Union[Duration, int]] = None,
+                 value: Optional[float] = None,
+                 min_periods: Optional[int] = None,
+                 ddof: int = 1) -> Union[pd.Series, pd.DataFrame]:
+    """Calculates statistic for every point of data over window ending at this point
+
+    :param data: Data with one column, or two columns (x, y) for OLS
+    :param statistic: Statistic to calculate
+    :param window: None for expanding window, number of points or duration for rolling one
+    :param value: Percentile value, [0-1]
+    :param min_periods: Minimum number of values in window, NaN is returned for smaller windows
+    :param ddof: Delta degrees of freedom for STD
+    :returns: Series of statistic, DataFrame with shift and coef columns for OLS
+    """
+    if statistic is Statistic.OLS and data.shape[1] != 2:
+        raise Exception("OLS requires exactly two symbols")
+
+    result = calculate(data.index.asi8, data.iloc[:, 0].values, statistic,
+                       y=data.iloc[:, 1].values if statistic is Statistic.OLS else None,
+                       window=window, value=value, min_periods=min_periods, ddof=ddof)
+
+    if statistic is Statistic.OLS:
+        return pd.DataFrame({'shift': result[0], 'coef': result[1]}, index=data.index)
+    return pd.Series(result, index=data.index, name=data.columns[0])
@@ -7,6 +7,7 @@ import pandas as pd
 from cns_analytics import TimeSeries, DataBase, Exchange, Symbol
 from cns_analytics.market_data import download_data
 from cns_analytics.ta import sma, rsi
+from cns_analytics.timeseries.expression import Expression
 
 
 async def _get_md(symbols, exchange, start=None, end=None):
@@ -71,6 +72,7 @@ async def formula(formula, exchange: Exchange = Exchange.BarchartDaily, start=No
     new_code = []
 
     symbols = set()
+    uses_functions = False
 
     for idx, (toknum, tokval, _, _, _) in enumerate(code):
         if toknum == token.NAME:
@@ -89,6 +91,7 @@ async def formula(formula, exchange: Exchange = Exchange.BarchartDaily, start=No
                         (token.OP, ']')
                     ])
                 else:
+                    uses_functions = True
                     new_code.append((toknum, tokval))
         else:
             new_code.append((toknum, tokval))
@@ -97,6 +100,17 @@ async def formula(formula, exchange: Exchange = Exchange.BarchartDaily, start=No
 
     new_code_str = tokenize.untokenize(new_code).decode('utf-8')
 
+    if not uses_functions:
+        # plain arithmetic over symbols is evaluated in one pass
+        lazy = TimeSeries.from_df(data, copy=False).lazy()
+        try:
+            result = eval(new_code_str, context, {'df': lazy})
+        except TypeError:
+            # operation that expressions don't support
+            result = None
+        if isinstance(result, Expression):
+            return result.evaluate().to_frame('SPREAD')
+
     return eval(new_code_str, context, {'df': data}).to_frame('SPREAD')
 
 
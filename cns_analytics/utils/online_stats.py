@@ -0,0 +1,374 @@
+"""Online statistics, that are fed with data chunk by chunk
+
+| Every class keeps a small state, so calculation can be resumed when new points arrive:
+  results for new points are the same as if all data was processed at once.
+| NaN values are skipped.
+
+.. python::
+    stats = ExpandingMoments()
+    mean, std = stats.update(history)
+    new_mean, new_std = stats.update(new_points)
+"""
+from typing import Optional, Tuple
+
+import numba
+import numpy as np
+import pandas as pd
+
+from cns_analytics.entities import Duration
+
+
+@numba.njit(nogil=True)
+def welford(x, state, min_periods, ddof):
+    """Updates expanding mean and variance with new values
+
+    :param x: New values
+    :param state: count, mean and sum of squared deviations, changed inplace
+    :param min_periods: Minimum number of values, NaN is returned before it's reached
+    :param ddof: Delta degrees of freedom of std
+    :returns: Mean and std after every value
+    """
+    n = x.shape[0]
+    mean = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    count, avg, m2 = state[0], state[1], state[2]
+
+    for i in range(n):
+        if not np.isnan(x[i]):
+            count += 1
+            delta = x[i] - avg
+            avg += delta / count
+            m2 += delta * (x[i] - avg)
+
+        if count >= min_periods and count > 0:
+            mean[i] = avg
+            if count > ddof:
+                std[i] = np.sqrt(max(m2 / (count - ddof), 0.0))
+
+    state[0], state[1], state[2] = count, avg, m2
+    return mean, std
+
+
+@numba.njit(nogil=True)
+def ewma(x, state, alpha, adjust):
+    """Updates exponentially weighted mean with new values
+
+    :param x: New values
+    :param state: Weighted sum and sum of weights (only sum is used without adjust)
+        and number of values seen, changed inplace
+    :param alpha: Weight of new value
+    :param adjust: Same as in pandas, divide by sum of weights
+    :returns: Mean after every value
+    """
+    n = x.shape[0]
+    result = np.full(n, np.nan)
+    total, weight, count = state[0], state[1], state[2]
+
+    for i in range(n):
+        if not np.isnan(x[i]):
+            if count == 0 or adjust:
+                total = total * (1 - alpha) + x[i]
+                weight = weight * (1 - alpha) + 1
+            else:
+                total = total * (1 - alpha) + x[i] * alpha
+                weight = 1.0
+            count += 1
+        if count > 0:
+            result[i] = total / weight
+
+    state[0], state[1], state[2] = total, weight, count
+    return result
+
+
+@numba.njit(nogil=True)
+def rolling(index, x, first_new, start, state, window, min_periods, ddof):
+    """Updates mean and variance over time window (t - window, t]
+
+    :param index: Epoch-ns time of points still in window followed by new points
+    :param x: Values of same points
+    :param first_new: Position of first new point
+    :param start: Position of first point in window
+    :param state: count, sum and sum of squares of values in window
+        (shifted by base value state[3]), changed inplace
+    :param window: Window size in ns
+    :param min_periods: Minimum number of values in window
+    :param ddof: Delta degrees of freedom of std
+    :returns: Mean and std for new points and new position of window start
+    """
+    n = x.shape[0]
+    mean = np.full(n - first_new, np.nan)
+    std = np.full(n - first_new, np.nan)
+    count, total, total_sq, base = state[0], state[1], state[2], state[3]
+
+    for i in range(first_new, n):
+        if not np.isnan(x[i]):
+            if np.isnan(base):
+                base = x[i]
+            value = x[i] - base
+            count += 1
+            total += value
+            total_sq += value * value
+
+        while index[start] <= index[i] - window:
+            if not np.isnan(x[start]):
+                value = x[start] - base
+                count -= 1
+                total -= value
+                total_sq -= value * value
+            start += 1
+
+        if count >= min_periods and count > 0:
+            mean[i - first_new] = base + total / count
+            if count > ddof:
+                var = (total_sq - total * total / count) / (count - ddof)
+                std[i - first_new] = np.sqrt(max(var, 0.0))
+
+    state[0], state[1], state[2], state[3] = count, total, total_sq, base
+    return mean, std, start
+
+
+@numba.njit(nogil=True)
+def rolling_sum(index, x, first_new, start, state, window):
+    """Updates sum over time window (t - window, t]
+
+    :param index: Epoch-ns time of points still in window followed by new points
+    :param x: Values of same points
+    :param first_new: Position of first new point
+    :param start: Position of first point in window
+    :param state: count and sum of values in window, changed inplace
+    :param window: Window size in ns
+    :returns: Sum and number of values for new points and new position of window start
+    """
+    n = x.shape[0]
+    total = np.zeros(n - first_new)
+    counts = np.zeros(n - first_new, dtype=np.int64)
+    count, value_sum = int(state[0]), state[1]
+
+    for i in range(first_new, n):
+        if not np.isnan(x[i]):
+            count += 1
+            value_sum += x[i]
+
+        while index[start] <= index[i] - window:
+            if not np.isnan(x[start]):
+                count -= 1
+                value_sum -= x[start]
+            start += 1
+
+        total[i - first_new] = value_sum if count else 0.0
+        counts[i - first_new] = count
+
+    state[0], state[1] = count, value_sum
+    return total, counts, start
+
+
+class ExpandingMoments:
+    """Mean and standard deviation of all values seen so far (Welford's algorithm)"""
+
+    def __init__(self, min_periods: int = 1, ddof: int = 1):
+        """
+        :param min_periods: Minimum number of values, NaN is returned before it's reached
+        :param ddof: Delta degrees of freedom of std
+        """
+        self.min_periods = min_periods
+        self.ddof = ddof
+        self._state = np.zeros(3)
+
+    @property
+    def count(self) -> int:
+        return int(self._state[0])
+
+    def update(self, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Feeds new values
+
+        :returns: Mean and std after every value
+        """
+        return welford(np.ascontiguousarray(values, dtype=np.float64), self._state,
+                       self.min_periods, self.ddof)
+
+
+class EWMA:
+    """Exponentially weighted mean"""
+
+    def __init__(self, alpha: float, adjust: bool = True):
+        """
+        :param alpha: Weight of new value
+        :param adjust: Same as in pandas, divide by sum of weights
+        """
+        self.alpha = alpha
+        self.adjust = adjust
+        self._state = np.zeros(3)
+
+    def update(self, values: np.ndarray) -> np.ndarray:
+        """Feeds new values
+
+        :returns: Mean after every value
+        """
+        return ewma(np.ascontiguousarray(values, dtype=np.float64), self._state,
+                    self.alpha, self.adjust)
+
+
+class RollingMoments:
+    """Mean and standard deviation over time window, same as pandas rolling(window)
+
+    | Keeps points that are still inside window to remove them later.
+    """
+
+    def __init__(self, window: Duration, min_periods: int = 1, ddof: int = 1):
+        """
+        :param window: Time window, covers (t - window, t]
+        :param min_periods: Minimum number of values in window
+        :param ddof: Delta degrees of freedom of std
+        """
+        self.window = pd.Timedelta(window).value
+        self.min_periods = min_periods
+        self.ddof = ddof
+        self._state = np.array([0, 0, 0, np.nan])
+        self._index = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0)
+
+    def update(self, index: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Feeds new points
+
+        :param index: Epoch-ns time of points, after all points fed before
+        :param values: Values of points
+        :returns: Mean and std for every point
+        """
+        first_new = self._index.shape[0]
+        index = np.concatenate((self._index, np.asarray(index, dtype=np.int64)))
+        values = np.concatenate((self._values, np.asarray(values, dtype=np.float64)))
+
+        mean, std, start = rolling(index, values, first_new, 0, self._state, self.window,
+                                   self.min_periods, self.ddof)
+
+        self._index = index[start:]
+        self._values = values[start:]
+        return mean, std
+
+
+class RollingSum:
+    """Sum over time window, same as pandas rolling(window).sum()
+
+    | Keeps points that are still inside window to remove them later.
+    """
+
+    def __init__(self, window: Duration):
+        """
+        :param window: Time window, covers (t - window, t]
+        """
+        self.window = pd.Timedelta(window).value
+        self._state = np.zeros(2)
+        self._index = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0)
+
+    def update(self, index: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Feeds new points
+
+        :param index: Epoch-ns time of points, after all points fed before
+        :param values: Values of points
+        :returns: Sum and number of values in window for every point
+        """
+        first_new = self._index.shape[0]
+        index = np.concatenate((self._index, np.asarray(index, dtype=np.int64)))
+        values = np.concatenate((self._values, np.asarray(values, dtype=np.float64)))
+
+        total, counts, start = rolling_sum(index, values, first_new, 0, self._state, self.window)
+
+        self._index = index[start:]
+        self._values = values[start:]
+        return total, counts
+
+
+class Sensitivity:
+    """Sensitivity of one leg to another, see Spread.get_sensitivity
+
+    | Same as mean of (l1 + 1e6) / (l2 + 1e6) over regular grid with step interval,
+      where l is change of leg in 1e-5 of price: grid points without price change add 1
+      to this mean, so it is 1 + sum of (k - 1) over real points / number of grid points in window.
+    """
+
+    def __init__(self, window: Duration, interval: int, first_time: int):
+        """
+        :param window: Time window, covers (t - window, t]
+        :param interval: Step of grid in ns, most common interval between points
+        :param first_time: Time of first point
+        """
+        window = pd.Timedelta(window).value
+        self.interval = interval
+        # number of grid points in full window
+        self.size = -(-window // interval)
+        self.min_periods = window // interval
+        # first change is at second grid point
+        self.first_change_time = first_time + interval
+        self._sum = RollingSum(window)
+        self._last = np.full(2, np.nan)
+
+    def update(self, index: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """Feeds new points
+
+        :param index: Epoch-ns time of points, after all points fed before
+        :param values: 2D array of prices of legs, row per point
+        :returns: (mean - 1) * 1e8 for every point, NaN while window has less than
+            window / interval grid points
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not values.shape[0]:
+            return np.empty(0)
+
+        changes = np.diff(values, axis=0, prepend=self._last[None]) / values * 100000
+        # k - 1 without subtracting numbers close to 1
+        terms = (changes[:, 0] - changes[:, 1]) / (changes[:, 1] + 1000000)
+        self._last = values[-1].copy()
+
+        total, _ = self._sum.update(index, terms)
+        # grid points with change in window, less than size until window is filled
+        counts = np.minimum((np.asarray(index) - self.first_change_time) // self.interval + 1,
+                            self.size)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = total / counts * 100000000
+        result[counts < max(self.min_periods, 1)] = np.nan
+        return result
+
+
+class OnlineCache:
+    """Result of online statistic for prefix of data, that can be extended
+
+    | Used by TimeSeries to update statistics in O(new points) when data is appended.
+    """
+
+    def __init__(self, stats, version: int, first_time: Optional[int]):
+        """
+        :param stats: Online statistic object
+        :param version: Version of data column statistic is calculated for
+        :param first_time: Time of first point
+        """
+        self.stats = stats
+        self.version = version
+        self.first_time = first_time
+        self.last_time: Optional[int] = None
+        self.length = 0
+        self.result = np.empty(0)
+
+    def get_resume_position(self, index: np.ndarray, version: int) -> Optional[int]:
+        """Returns number of points already processed, None if cache can't be used
+
+        :param index: Epoch-ns time of all points
+        :param version: Current version of data column
+        """
+        if version != self.version or index.shape[0] < self.length or index.shape[0] == 0:
+            return None
+        if index[0] != self.first_time:
+            return None
+        if self.length and index[self.length - 1] != self.last_time:
+            return None
+        return self.length
+
+    def extend(self, index: np.ndarray, result: np.ndarray):
+        """Appends result for new points
+
+        :param index: Epoch-ns time of all points
+        :param result: Result for points after already processed ones
+        """
+        self.result = np.concatenate((self.result, result))
+        self.length = index.shape[0]
+        self.last_time = index[-1] if self.length else None
@@ -29,7 +29,7 @@ setup(
         'colorama==0.3.9',
         'python-dateutil==2.8.1',
         'python-dotenv',
-        'feather-format==0.4.1',
+        'pyarrow',
         'paramiko==2.11.0',
     ],
     packages=find_packages()